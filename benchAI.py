@@ -0,0 +1,160 @@
+import io
+import os
+import json
+import time
+import tempfile
+import contextlib
+
+from mockAI import MockServer, DEFAULT_MOCK_OPTIONS
+from guess import ask_AI, run_samples, get_data_from_json
+from clientAI import close_clients
+from metricsAI import start_run
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, int(round(q / 100.0 * (len(values) - 1)))))
+    return values[k]
+
+
+def _summary(values):
+    return {
+        "n": len(values),
+        "mean": sum(values) / len(values) if values else None,
+        "p50": _percentile(values, 50),
+        "p95": _percentile(values, 95),
+        "max": max(values) if values else None,
+    }
+
+
+def bench_single(url, repeats=10, thinking="enabled"):
+    """
+    单次 ask_AI 的端到端延迟、首 token 时间 (TTFT) 与每个增量的回调间隔。
+    标准输出被重定向到内存，计入 ask_AI 自带的打印开销但不刷屏。
+    """
+    e2e, ttft, ttfr, gaps = [], [], [], []
+    for _ in range(repeats):
+        stamps = []
+        thinking_stamps = []
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            ask_AI("benchmark", api_key="mock", base_url=url, model="mock", thinking=thinking, use_cache=False,
+                   on_delta=lambda _: stamps.append(time.perf_counter()),
+                   on_thinking=lambda _: thinking_stamps.append(time.perf_counter()))
+        end = time.perf_counter()
+        e2e.append(end - start)
+        if stamps:
+            ttft.append(stamps[0] - start)
+            gaps += [b - a for a, b in zip(stamps, stamps[1:])]
+        if thinking_stamps:
+            ttfr.append(thinking_stamps[0] - start)
+    return {"e2e": _summary(e2e), "ttft": _summary(ttft), "first_reasoning": _summary(ttfr),
+            "delta_gap": _summary(gaps)}
+
+
+def bench_delta_overhead(url):
+    """
+    服务端不限速、无首 token 延迟时，客户端处理每个增量（SSE 解析、回调、打印）的平均耗时。
+    """
+    deltas = [0]
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        ask_AI("benchmark", api_key="mock", base_url=url, model="mock", thinking="disabled", use_cache=False,
+               on_delta=lambda _: deltas.__setitem__(0, deltas[0] + 1))
+    elapsed = time.perf_counter() - start
+    return {"deltas": deltas[0], "elapsed": elapsed, "per_delta_us": elapsed / max(deltas[0], 1) * 1e6}
+
+
+def bench_pipeline(url, samples=20, concurrency=8, sample_path=None, structured=None):
+    """
+    完整流水线 (gen_datas + Step 2 + Step 3) 在并发样品下的吞吐量与单样品延迟。
+    两组端点都指向模拟服务。
+    """
+    sample_path = sample_path or os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_data",
+                                              "input_template.json")
+    data = get_data_from_json(sample_path)
+    latencies = []
+    metrics = start_run("bench_pipeline")
+    with tempfile.TemporaryDirectory() as tmp:
+        config_path = os.path.join(tmp, "API.json")
+        with open(config_path, "w", encoding="utf-8") as f:
+            json.dump({"api_key": "mock", "base_url_1": url, "base_url_2": url, "model_1": "mock",
+                       "model_2": "mock", "max_concurrency": concurrency}, f)
+        begin = time.perf_counter()
+
+        def on_result(result):
+            latencies.append(time.perf_counter() - begin)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = run_samples([(i, data) for i in range(samples)], api_config_path=config_path,
+                                  use_cache=False, on_result=on_result, structured=structured)
+        wall = time.perf_counter() - begin
+    failed = sum(1 for r in results if r["error"])
+    return {"samples": samples, "concurrency": concurrency, "wall": wall, "failed": failed,
+            "throughput": samples / wall if wall else None, "completion_time": _summary(latencies),
+            "metrics": metrics.record()}
+
+
+def run_benchmarks(options=None, repeats=10, samples=20, concurrency=8, structured=None):
+    """启动模拟端点并运行全部测量，返回结果 dict。"""
+    options = dict(DEFAULT_MOCK_OPTIONS, **(options or {}))
+    report = {"mock": options}
+    with MockServer(options=options) as mock:
+        report["single"] = bench_single(mock.url, repeats)
+    # 增量开销单独用不限速、长回答的端点测量
+    with MockServer(options=dict(options, token_rate=0, ttft=0, jitter=0, error_rate=0, disconnect_rate=0,
+                                 reasoning_tokens=0),
+                    reply="token " * 1000) as fast:
+        report["delta_overhead"] = bench_delta_overhead(fast.url)
+    with MockServer(options=options) as mock:
+        report["pipeline"] = bench_pipeline(mock.url, samples, concurrency, structured=structured)
+        report["mock_stats"] = mock.stats
+    close_clients()
+    return report
+
+
+def format_report(report):
+    def ms(value):
+        return "-" if value is None else f"{value * 1000:.1f} ms"
+
+    lines = []
+    single = report["single"]
+    lines.append(f"ask_AI end-to-end   p50 {ms(single['e2e']['p50'])}  p95 {ms(single['e2e']['p95'])}")
+    lines.append(f"TTFT (content)      p50 {ms(single['ttft']['p50'])}  p95 {ms(single['ttft']['p95'])}"
+                 f"  (mock ttft {report['mock']['ttft'] * 1000:.0f} ms + {report['mock']['reasoning_tokens']} reasoning tokens)")
+    lines.append(f"delta gap           p50 {ms(single['delta_gap']['p50'])}  p95 {ms(single['delta_gap']['p95'])}")
+    overhead = report["delta_overhead"]
+    lines.append(f"per-delta overhead  {overhead['per_delta_us']:.1f} us ({overhead['deltas']} deltas)")
+    pipeline = report["pipeline"]
+    lines.append(f"pipeline            {pipeline['samples']} samples x concurrency {pipeline['concurrency']}:"
+                 f" {pipeline['wall']:.2f} s, {pipeline['throughput']:.2f} samples/s, {pipeline['failed']} failed")
+    lines.append(f"sample completion   p50 {ms(pipeline['completion_time']['p50'])}"
+                 f"  p95 {ms(pipeline['completion_time']['p95'])}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="End-to-end latency benchmark against the offline mock endpoint")
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--samples", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--token-rate", type=float, default=DEFAULT_MOCK_OPTIONS["token_rate"])
+    parser.add_argument("--ttft", type=float, default=DEFAULT_MOCK_OPTIONS["ttft"])
+    parser.add_argument("--jitter", type=float, default=DEFAULT_MOCK_OPTIONS["jitter"])
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--structured", nargs="?", const="json_object")
+    parser.add_argument("--json", help="把完整结果写入该 JSON 文件")
+    args = parser.parse_args()
+
+    result = run_benchmarks({"token_rate": args.token_rate, "ttft": args.ttft, "jitter": args.jitter,
+                             "error_rate": args.error_rate, "seed": 0},
+                            repeats=args.repeats, samples=args.samples, concurrency=args.concurrency,
+                            structured=args.structured)
+    print(format_report(result))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
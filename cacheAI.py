@@ -0,0 +1,136 @@
+import sys
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+CACHE_FILE = "ai_cache.sqlite3"
+# 默认上限：条目数、总字节数、存活时间（秒）
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+DEFAULT_TTL = 30 * 24 * 3600
+
+
+def _base_dir():
+    if getattr(sys, 'frozen', False):
+        return os.path.dirname(sys.executable)
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+def default_cache_path():
+    return os.path.join(_base_dir(), CACHE_FILE)
+
+
+def cache_key(prompt, model, base_url, thinking, options=None):
+    """请求内容、模型、端点、思考模式与请求选项（max_tokens、response_format 等）共同决定缓存键（SHA-256）。"""
+    payload = json.dumps([prompt, model, base_url, thinking, options or {}], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    ask_AI 回复的 SQLite 磁盘缓存，保存完整正文与思考内容。
+
+    按最近访问时间做 LRU 淘汰，同时受条目数、总字节数与 TTL 限制。
+    同一进程内多线程共享一个连接，读写由锁串行化。
+    """
+
+    def __init__(self, path=None, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL):
+        self.path = path or default_cache_path()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, model TEXT, base_url TEXT, text TEXT NOT NULL, reasoning TEXT NOT NULL,"
+            " size INTEGER NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+
+    def get(self, key):
+        """返回 (text, reasoning)；未命中或已过期返回 None。"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT text, reasoning, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if self.ttl and now - row[2] > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        return row[0], row[1]
+
+    def put(self, key, text, reasoning="", model=None, base_url=None):
+        now = time.time()
+        size = len(text.encode("utf-8")) + len(reasoning.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, base_url, text, reasoning, size, created, accessed)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, model, base_url, text, reasoning, size, now, now),
+            )
+            self._evict(now)
+
+    def _evict(self, now):
+        if self.ttl:
+            self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        # 从最久未访问的条目开始删，直到满足两项上限
+        doomed = []
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY accessed ASC"):
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            doomed.append((key,))
+            count -= 1
+            total -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+
+    def stats(self):
+        """返回 {"entries": 条目数, "bytes": 总字节数}。"""
+        with self._lock:
+            count, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        return {"entries": count, "bytes": total}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(path=None):
+    """每个缓存文件只打开一次，之后复用同一个 ResponseCache（线程安全）。"""
+    path = os.path.abspath(path or default_cache_path())
+    cache = _caches.get(path)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(path)
+            if cache is None:
+                cache = _caches[path] = ResponseCache(path)
+    return cache
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "clear":
+        get_cache().clear()
+        print("缓存已清空")
+    else:
+        print(get_cache().stats())
@@ -0,0 +1,186 @@
+import os
+import json
+import asyncio
+import threading
+import contextvars
+import concurrent.futures
+import weakref
+
+from openai import OpenAI, AsyncOpenAI
+
+from metricsAI import trace_request, atrace_request
+
+# 连接池与超时的默认值，可在 API.json 中用同名键覆盖
+DEFAULT_POOL_OPTIONS = {
+    "max_connections": 20,
+    "max_keepalive_connections": 10,
+    "keepalive_expiry": 60.0,
+    "timeout": 600.0,
+    "connect_timeout": 10.0,
+    "max_retries": 2,
+    # 批量异步运行时每个端点同时进行的请求数
+    "max_concurrency": 8,
+}
+
+_config_cache = {}
+_config_lock = threading.Lock()
+
+
+def load_api_config(path):
+    """
+    读取 API 配置文件，按 (mtime, size) 缓存：文件未变时不再读盘，修改后自动重新读取。
+    文件不存在返回空 dict。返回值是副本，调用方可以随意修改。
+    """
+    if not path:
+        return {}
+    path = os.path.abspath(path)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        with _config_lock:
+            _config_cache.pop(path, None)
+        return {}
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    with _config_lock:
+        cached = _config_cache.get(path)
+        if cached is None or cached[0] != stamp:
+            with open(path, "r", encoding="utf-8") as f:
+                cached = _config_cache[path] = (stamp, json.load(f))
+    return dict(cached[1])
+
+
+def pool_options(config=None):
+    """从配置中取出连接池 / 超时选项，缺省项使用 DEFAULT_POOL_OPTIONS。"""
+    options = dict(DEFAULT_POOL_OPTIONS)
+    for name in DEFAULT_POOL_OPTIONS:
+        if config and config.get(name) is not None:
+            options[name] = type(DEFAULT_POOL_OPTIONS[name])(config[name])
+    return options
+
+
+def _http_kwargs(options):
+    import httpx
+
+    return {
+        "limits": httpx.Limits(
+            max_connections=options["max_connections"],
+            max_keepalive_connections=options["max_keepalive_connections"],
+            keepalive_expiry=options["keepalive_expiry"],
+        ),
+        "timeout": httpx.Timeout(options["timeout"], connect=options["connect_timeout"]),
+    }
+
+
+def _build_client(api_key, base_url, options):
+    import httpx
+
+    http_client = httpx.Client(event_hooks={"request": [trace_request]}, **_http_kwargs(options))
+    return OpenAI(api_key=api_key, base_url=base_url, http_client=http_client,
+                  max_retries=options["max_retries"])
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(api_key, base_url, options=None):
+    """
+    按 (base_url, api_key) 复用 OpenAI 客户端及其 keep-alive 连接池（线程安全）。
+
+    options 为 pool_options() 的结果；同一端点的选项变化时重建客户端，
+    旧客户端不主动关闭，以免打断其它线程上仍在进行的流式请求。
+    """
+    options = options or pool_options()
+    key = (base_url, api_key)
+    entry = _clients.get(key)
+    if entry is None or entry[0] != options:
+        with _clients_lock:
+            entry = _clients.get(key)
+            if entry is None or entry[0] != options:
+                entry = _clients[key] = (options, _build_client(api_key, base_url, options))
+    return entry[1]
+
+
+def _build_async_client(api_key, base_url, options):
+    import httpx
+
+    http_client = httpx.AsyncClient(event_hooks={"request": [atrace_request]}, **_http_kwargs(options))
+    return AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client,
+                       max_retries=options["max_retries"])
+
+
+# 异步连接绑定在创建它的事件循环上，因此按事件循环分别登记，循环结束后自动释放
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client(api_key, base_url, options=None):
+    """
+    get_client 的异步版本：在当前事件循环内按 (base_url, api_key) 复用 AsyncOpenAI 客户端。
+    只能在协程中调用。
+    """
+    options = options or pool_options()
+    loop = asyncio.get_running_loop()
+    clients = _async_clients.get(loop)
+    if clients is None:
+        clients = _async_clients[loop] = {}
+    key = (base_url, api_key)
+    entry = clients.get(key)
+    if entry is None or entry[0] != options:
+        entry = clients[key] = (options, _build_async_client(api_key, base_url, options))
+    return entry[1]
+
+
+_client_loop = None
+_client_loop_lock = threading.Lock()
+
+
+def get_client_loop():
+    """常驻的后台事件循环（守护线程中运行，首次调用时创建）。"""
+    global _client_loop
+    if _client_loop is None:
+        with _client_loop_lock:
+            if _client_loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="client-loop", daemon=True).start()
+                _client_loop = loop
+    return _client_loop
+
+
+def run_in_client_loop(coro):
+    """
+    在后台事件循环中运行协程并等待其结果（供同步代码与 GUI 工作线程调用，不能在该循环内调用）。
+    与每次 asyncio.run 不同，循环一直存在，其上缓存的异步客户端与 keep-alive 连接可以跨调用复用。
+    协程在调用方的 contextvars 上下文中运行（与 asyncio.run 一样），指标记到调用方当前的运行上。
+    """
+    done = concurrent.futures.Future()
+
+    def start():
+        task = asyncio.ensure_future(coro)
+
+        def finish(task):
+            if task.cancelled():
+                done.cancel()
+            elif task.exception() is not None:
+                done.set_exception(task.exception())
+            else:
+                done.set_result(task.result())
+        task.add_done_callback(finish)
+
+    get_client_loop().call_soon_threadsafe(start, context=contextvars.copy_context())
+    return done.result()
+
+
+async def close_async_clients():
+    """关闭当前事件循环中缓存的异步客户端（在 asyncio.run 的协程结束前调用）。"""
+    clients = _async_clients.pop(asyncio.get_running_loop(), {})
+    for _, client in clients.values():
+        await client.close()
+
+
+def close_clients():
+    """关闭全部缓存的客户端（程序退出前调用）。"""
+    with _clients_lock:
+        entries = list(_clients.values())
+        _clients.clear()
+    for _, client in entries:
+        client.close()
@@ -0,0 +1,181 @@
+import re
+import asyncio
+from collections import Counter
+
+from molecule import parse_formula, hill_formula, formula_unsaturation, formula_nominal_mass
+from isotopeMASS import molecular_ion_offset
+
+# 分子式 / 结构简式候选：以大写字母或括号开头，由元素、数字、括号与键符号组成
+FORMULA_TOKEN = re.compile(r"(?<![A-Za-z0-9])[A-Z(\[][A-Za-z0-9₀-₉()\[\]\-=#≡]*")
+# 含这些字样的行被视为给出答案的行，其后的候选排在正文中顺带提到的片段之前
+ANSWER_MARKERS = re.compile(r"SMILES|结构|分子式|答案|名称|structure|formula|answer|name", re.IGNORECASE)
+# 排名分数中证据吻合度的权重（票数占比的权重为 1）
+AGREEMENT_WEIGHT = 0.5
+
+
+def after_answer_marker(text, position):
+    """text 中 position 处是否位于答案行上、且在该行的 ANSWER_MARKERS（如 "分子式："、"SMILES:"）之后。"""
+    start = text.rfind("\n", 0, position) + 1
+    return bool(ANSWER_MARKERS.search(text, start, position))
+
+
+def extract_candidates(text):
+    """
+    从一次回答中提取候选分子，返回 [(hill_formula, structure_text), ...]（按分子式去重）。
+    只保留含 C、H 且不饱和度为非负整数的写法，以排除 CH3、CO、NMR 之类的片段或缩写。
+    同一分子式出现多种写法时保留原子写得最展开的那个（通常是结构简式而非分子式）。
+    答案行上标记之后的候选排在前面（见 after_answer_marker），其余按出现顺序，
+    因此推理过程中先提到的 "OCH2" 之类片段不会成为首选；写法只是其它候选写法一部分的分子式也去掉。
+    """
+    text = text or ""
+    found = {}
+    first = {}
+    for match in FORMULA_TOKEN.finditer(text):
+        token = match.group(0).rstrip("-=#≡")
+        try:
+            counts = parse_formula(token)
+        except ValueError:
+            continue
+        if not counts.get("C") or not counts.get("H"):
+            continue
+        dbe = formula_unsaturation(counts)
+        if dbe < 0 or dbe != int(dbe):
+            continue
+        formula = hill_formula(counts)
+        key = (not after_answer_marker(text, match.start()), match.start())
+        if formula not in found:
+            first[formula] = key
+            found[formula] = token
+        else:
+            first[formula] = min(first[formula], key)
+            if len(token) > len(found[formula]):
+                found[formula] = token
+    fragments = {formula for formula, token in found.items()
+                 if any(token in other and formula != f for f, other in found.items())}
+    order = sorted((f for f in found if f not in fragments), key=first.get)
+    return [(formula, found[formula]) for formula in order]
+
+
+def _structure_key(token):
+    return re.sub(r"[-=#≡\s]", "", token)
+
+
+def evidence_agreement(formula, data):
+    """
+    分子式与原始输入数据的吻合度 (0~1)，无可用证据时返回 None。
+    检查项：质谱最大 m/z 与名义分子量一致（含 Cl/Br/S/Si 时也可以是 M+2、M+4 同位素峰）；13C 谱线数不超过碳数；1H 积分总和能整除氢数。
+    """
+    counts = parse_formula(formula)
+    checks = []
+    mass = (data or {}).get("mass")
+    if mass:
+        values = [float(m[0] if isinstance(m, (list, tuple)) else m) for m in mass]
+        offset = molecular_ion_offset(counts, formula_nominal_mass(counts), max(values))
+        checks.append(0.0 if offset is None else 1.0)
+    c_nmr = (data or {}).get("c_nmr")
+    if isinstance(c_nmr, dict) and c_nmr.get("bb"):
+        checks.append(1.0 if counts.get("C", 0) >= len(c_nmr["bb"]) else 0.0)
+    h_nmr = (data or {}).get("h_nmr")
+    if h_nmr:
+        areas = []
+        for item in h_nmr:
+            try:
+                areas.append(float(item.get("area")))
+            except (TypeError, ValueError):
+                pass
+        total = round(sum(areas))
+        if total > 0:
+            checks.append(1.0 if counts.get("H", 0) % total == 0 else 0.0)
+    if not checks:
+        return None
+    return sum(checks) / len(checks)
+
+
+def rank_answers(answers, data=None):
+    """
+    汇总多次回答：每次回答的首个候选计 1 票，其余被提及的候选计入 mentions。
+    分数 = 票数 / 回答数 + AGREEMENT_WEIGHT * 证据吻合度，按分数、票数、提及数降序。
+    同一分子式下取得票最多的结构简式作为代表结构。
+    """
+    votes = Counter()
+    mentions = Counter()
+    structures = {}
+    for text in answers:
+        candidates = extract_candidates(text)
+        for rank, (formula, token) in enumerate(candidates):
+            mentions[formula] += 1
+            votes[formula] += rank == 0
+            # 只被提及的写法计 0 票，仍保留为该分子式的备选代表结构
+            structures.setdefault(formula, Counter())[_structure_key(token)] += rank == 0
+    ranking = []
+    for formula in mentions:
+        agreement = evidence_agreement(formula, data)
+        score = votes[formula] / max(len(answers), 1) + AGREEMENT_WEIGHT * (agreement or 0.0)
+        ranking.append({
+            "formula": formula,
+            "structure": structures[formula].most_common(1)[0][0],
+            "votes": votes[formula],
+            "mentions": mentions[formula],
+            "agreement": agreement,
+            "score": round(score, 4),
+        })
+    ranking.sort(key=lambda r: (-r["score"], -r["votes"], -r["mentions"]))
+    return ranking
+
+
+def _top_formula(text):
+    candidates = extract_candidates(text)
+    return candidates[0][0] if candidates else None
+
+
+async def self_consistency(attempt, n, *, quorum=None, data=None):
+    """
+    并发发起 n 次回答并投票。attempt(i) 为返回回答文本的协程函数（i = 0..n-1）。
+    任一分子式的首选票数达到 quorum（默认过半）时取消其余尚未完成的请求。
+    返回 {"answer", "ranking", "answers", "failed", "cancelled", "quorum_reached"}，
+    answer 为首选候选与排名第一一致的第一条回答（都不一致时取第一条回答）。
+    全部失败时抛出最后一个异常。
+    """
+    assert n >= 1, "n 必须 >= 1"
+    quorum = quorum or n // 2 + 1
+    tasks = {asyncio.ensure_future(attempt(i)) for i in range(n)}
+    answers = []
+    votes = Counter()
+    failed = 0
+    last_error = None
+    reached = False
+    try:
+        while tasks and not reached:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    failed += 1
+                    last_error = task.exception()
+                    continue
+                text = task.result()
+                if not text:
+                    continue
+                answers.append(text)
+                formula = _top_formula(text)
+                if formula is not None:
+                    votes[formula] += 1
+                    reached = reached or votes[formula] >= quorum
+    finally:
+        for task in tasks:
+            task.cancel()
+    if not answers:
+        if last_error is not None:
+            raise last_error
+        return {"answer": "", "ranking": [], "answers": [], "failed": failed, "cancelled": len(tasks),
+                "quorum_reached": False}
+    ranking = rank_answers(answers, data)
+    best = ranking[0]["formula"] if ranking else None
+    answer = next((text for text in answers if _top_formula(text) == best), answers[0])
+    return {
+        "answer": answer,
+        "ranking": ranking,
+        "answers": answers,
+        "failed": failed,
+        "cancelled": len(tasks),
+        "quorum_reached": reached,
+    }
@@ -0,0 +1,851 @@
+import sys
+import json
+import os
+import time
+import itertools
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from molecule import (Molecule, AROMATIC_BOND, parse_formula, parse_smiles, hill_formula, formula_unsaturation,
+                      is_carbonyl, perceive_aromaticity, _rank, _implicit_hydrogens)
+from processC_DEPR_NMR import interpret_dept_data, dept_tolerances
+from processH_NMR import estimate_proton_counts
+from predictC_NMR import rank_c_candidates
+
+def load_locales():
+    try:
+        if getattr(sys, 'frozen', False):
+            base_dir = os.path.dirname(sys.executable)
+        else:
+            base_dir = os.path.dirname(__file__)
+        path = os.path.join(base_dir, "locales.json")
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+    except Exception:
+        pass
+    return {}
+
+LOCALES = load_locales()
+
+def tr(key, lang='zh', *args):
+    lang_data = LOCALES.get(lang, {})
+    text = lang_data.get(key, key)
+    if args:
+        try:
+            return text.format(*args)
+        except:
+            return text
+    return text
+
+# 枚举支持的元素及其价态（只取最常见的价态；硝基、亚砜、砜等高价态不枚举）
+ENUM_VALENCES = {"C": 4, "N": 3, "O": 2, "S": 2, "F": 1, "Cl": 1, "Br": 1, "I": 1}
+# 杂原子上允许的 H 数
+HETERO_H = {"N": (0, 1, 2), "O": (0, 1), "S": (0, 1), "F": (0,), "Cl": (0,), "Br": (0,), "I": (0,)}
+
+# 碳的杂化方式与其 13C 位移范围 (ppm)；范围有意重叠，只排除明显不可能的组合
+#   sp3: 全部单键；sp2: 一个 C=C 或 C=N；carbonyl: 一个 C=O / C=S；sp: 一个三键
+HYBRID_SHIFT_RANGES = {
+    "sp3": (-10.0, 110.0),
+    "sp2": (80.0, 170.0),
+    "carbonyl": (155.0, 240.0),
+    "sp": (65.0, 125.0),
+}
+ALL_PATTERNS = frozenset(HYBRID_SHIFT_RANGES)
+
+# 常见氘代溶剂的 13C 位移；位于其附近、计数写成 ">n" 的季碳峰视为溶剂峰
+SOLVENT_C_SHIFTS = (77.16, 39.52, 49.00, 29.84, 128.06, 206.26)
+SOLVENT_TOLERANCE = 1.0
+
+# 搜索默认值：最小环大小（排除三、四元环）、每个子任务的搜索节点上限、可作为短名单的候选数
+DEFAULT_MIN_RING = 5
+DEFAULT_MAX_NODES = 200000
+# 每个样品的枚举时限（秒），超时的搜索记为不完整；由质谱推测的分子式较多时主要耗在不对的分子式上
+DEFAULT_TIME_LIMIT = 1.0
+SHORTLIST_SIZE = 8
+# 候选不超过该数时才逐个做 13C 预测排序
+RANK_LIMIT = 50
+# 由分子量推算分子式时考虑的 N / O 原子数上限
+MAX_FORMULA_N = 2
+MAX_FORMULA_O = 4
+# 在进程池中拆分单个搜索时，父进程先展开的键数
+SPLIT_DEPTH = 3
+
+TYPE_H = {"CH3": 3, "CH2": 2, "CH": 1, "Cq": 0}
+BOND_SYMBOLS = {1: "", 2: "=", 3: "#", AROMATIC_BOND: ""}
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+def _hetero_patterns(element, h, carbonyl=None):
+    """杂原子可参与的键型：O 可为醚/醇氧或 =O（carbonyl=False 时不允许），N 可为胺、亚胺或腈氮，其余只连单键。"""
+    if element == "O":
+        return frozenset(("sp3", "carbonyl")) if h == 0 and carbonyl is not False else frozenset(("sp3",))
+    if element == "N":
+        return {0: frozenset(("sp3", "sp2", "sp")), 1: frozenset(("sp3", "sp2"))}.get(h, frozenset(("sp3",)))
+    return frozenset(("sp3",))
+
+
+def carbon_patterns(shift=None, carbonyl=None):
+    """由 13C 位移给出碳允许的杂化方式；没有位移时全部允许。carbonyl=False 时去掉 C=O。"""
+    if shift is None:
+        patterns = set(ALL_PATTERNS)
+    else:
+        patterns = {name for name, (low, high) in HYBRID_SHIFT_RANGES.items() if low <= shift <= high}
+    if carbonyl is False:
+        patterns.discard("carbonyl")
+    return frozenset(patterns)
+
+
+def _contains(outer, inner):
+    """多重集 inner 是否包含于 outer。"""
+    return all(outer.get(key, 0) >= count for key, count in inner.items())
+
+
+class _Search:
+    """
+    按价饱和顺序枚举分子图：依次取第一个仍有剩余价的原子，只向编号更大的原子连键，
+    每个标号图只生成一次；候选伙伴中类型与当前邻居完全相同的"孪生"原子只试第一个。
+    剪枝：元素价态与杂化方式（来自 13C 位移）、杂原子之间不成键、最小环大小、
+    提前封闭的连通分量；叶子上再按 13C 峰的对称性检查并用规范 SMILES 去重。
+    """
+
+    def __init__(self, atoms, min_ring=DEFAULT_MIN_RING, max_nodes=DEFAULT_MAX_NODES, symmetric=True,
+                 deadline=None):
+        # atoms: [(element, h, patterns, label)]，按剩余价降序排列以便末端原子作为伙伴最后连上
+        self.atoms = sorted(atoms, key=lambda a: (-(ENUM_VALENCES[a[0]] - a[1]), a[0], a[1], sorted(a[2]),
+                                                  -1 if a[3] is None else a[3]))
+        self.n = len(self.atoms)
+        types = {}
+        self.type_ids = [types.setdefault((a[0], a[1], a[2], a[3]), len(types)) for a in self.atoms]
+        self.type_sizes = Counter(self.type_ids)
+        self.atoms_by_type = {t: a for t, a in zip(self.type_ids, self.atoms)}
+        self.rem = [ENUM_VALENCES[a[0]] - a[1] for a in self.atoms]
+        self.pi = [0] * self.n
+        self.pi_partner = [None] * self.n
+        self.adj = [dict() for _ in range(self.n)]
+        # 每个原子的邻居签名：邻居类型 -> 个数；同一 13C 峰的碳最终签名必须相同。
+        # 不计键级，因为芳环的凯库勒式中等价原子的单双键并不相同
+        self.signature = [Counter() for _ in range(self.n)]
+        self.members = {}
+        if symmetric:
+            for i, a in enumerate(self.atoms):
+                if a[3] is not None:
+                    self.members.setdefault(a[3], []).append(i)
+        self.bonds = []
+        self.min_ring = min_ring
+        self.max_nodes = max_nodes
+        # deadline 为 time.time() 时刻（工作进程之间可比），None 表示不限时
+        self.deadline = deadline
+        self.symmetric = symmetric
+        self.nodes = 0
+        self.found = {}
+        assert all(r >= 0 for r in self.rem), "原子上的 H 数超过价态"
+
+    def _add(self, i, j, order):
+        self.adj[i][j] = order
+        self.adj[j][i] = order
+        self.rem[i] -= order
+        self.rem[j] -= order
+        self.signature[i][self.type_ids[j]] += 1
+        self.signature[j][self.type_ids[i]] += 1
+        if order > 1:
+            self.pi[i] = self.pi[j] = order
+            self.pi_partner[i], self.pi_partner[j] = j, i
+        self.bonds.append((i, j, order))
+
+    def _remove(self, i, j, order):
+        del self.adj[i][j]
+        del self.adj[j][i]
+        self.rem[i] += order
+        self.rem[j] += order
+        for a, b in ((i, j), (j, i)):
+            key = self.type_ids[b]
+            self.signature[a][key] -= 1
+            if not self.signature[a][key]:
+                del self.signature[a][key]
+        if order > 1:
+            self.pi[i] = self.pi[j] = 0
+            self.pi_partner[i] = self.pi_partner[j] = None
+        self.bonds.pop()
+
+    def _pattern(self, i):
+        if self.pi[i] == 3:
+            return "sp"
+        if self.pi[i] == 2:
+            # C=O 的两端都按 carbonyl 计：碳与氧允许的键型里都是 carbonyl
+            pair = (self.atoms[i][0], self.atoms[self.pi_partner[i]][0])
+            return "carbonyl" if "O" in pair or "S" in pair else "sp2"
+        return "sp3"
+
+    def _order_ok(self, i, j, order):
+        ei, ej = self.atoms[i][0], self.atoms[j][0]
+        if order > min(self.rem[i], self.rem[j]):
+            return False
+        if order == 1:
+            return True
+        if self.pi[i] or self.pi[j]:
+            return False
+        if order == 2:
+            if "O" in (ei, ej) or "S" in (ei, ej):
+                need = "carbonyl"
+            else:
+                need = "sp2"
+            return need in self.atoms[i][2] and need in self.atoms[j][2]
+        return "sp" in self.atoms[i][2] and "sp" in self.atoms[j][2]
+
+    def _feasible(self, i):
+        """加键后原子 i 的杂化要求是否仍能满足（饱和时检查最终键型），以及与同峰原子的签名是否相容。"""
+        patterns = self.atoms[i][2]
+        if self.rem[i] == 0:
+            if self._pattern(i) not in patterns:
+                return False
+        elif self.pi[i] == 0 and "sp3" not in patterns and self.rem[i] < 2:
+            return False
+        members = self.members.get(self.atoms[i][3])
+        if not members:
+            return True
+        mine = self.signature[i]
+        if self.rem[i] == 0:
+            # 刚饱和：同峰其它原子的现有邻居不能超出它的最终签名；
+            # 两个峰都已有饱和原子时，两峰之间的键数从两侧计算必须相等
+            if not all(_contains(mine, self.signature[m]) for m in members if m != i):
+                return False
+            t = self.type_ids[i]
+            for other, count in mine.items():
+                template = self._template(other)
+                if template is not None and self.type_sizes[t] * count != self.type_sizes[other] * template[t]:
+                    return False
+            return True
+        template = self._template(self.type_ids[i])
+        return template is None or _contains(template, mine)
+
+    def _template(self, type_id):
+        """同类原子中已饱和者的最终签名（同峰原子的签名都应与之相同）；没有则返回 None。"""
+        for m in self.members.get(self.atoms_by_type[type_id][3], ()):
+            if self.rem[m] == 0:
+                return self.signature[m]
+        return None
+
+    def _near(self, i):
+        """与 i 的距离不超过 min_ring - 2 的原子：和 i 成键会形成小于 min_ring 的环。"""
+        seen = {i}
+        frontier = [i]
+        for _ in range(self.min_ring - 2):
+            next_frontier = []
+            for a in frontier:
+                for b in self.adj[a]:
+                    if b not in seen:
+                        seen.add(b)
+                        next_frontier.append(b)
+            frontier = next_frontier
+        return seen
+
+    def _component_closed(self, i):
+        """i 所在连通分量已全部饱和但未覆盖全部原子时，分子不可能连通。"""
+        seen = {i}
+        stack = [i]
+        while stack:
+            a = stack.pop()
+            if self.rem[a]:
+                return False
+            for b in self.adj[a]:
+                if b not in seen:
+                    seen.add(b)
+                    stack.append(b)
+        return len(seen) < self.n
+
+    def run(self, state=None, split_depth=None):
+        """
+        生成 ("leaf", smiles) 或（给出 split_depth 时）("split", state)。
+        state 为之前拆分得到的 (bonds, i, last)，用于在工作进程中继续搜索。
+        """
+        i, last = 0, 0
+        if state is not None:
+            bonds, i, last = state
+            for a, b, order in bonds:
+                self._add(a, b, order)
+        yield from self._extend(i, last, split_depth)
+
+    def _extend(self, i, last, split_depth):
+        self.nodes += 1
+        if self.nodes > self.max_nodes:
+            raise BudgetExceeded()
+        if self.deadline is not None and time.time() > self.deadline:
+            raise BudgetExceeded()
+        while i < self.n and self.rem[i] == 0:
+            if self._component_closed(i):
+                return
+            i += 1
+            last = i
+        if i == self.n:
+            smiles = self._leaf()
+            if smiles is not None:
+                yield "leaf", smiles
+            return
+        if split_depth is not None and len(self.bonds) >= split_depth:
+            yield "split", (tuple(self.bonds), i, last)
+            return
+        element_i = self.atoms[i][0]
+        near = self._near(i)
+        tried = set()
+        for j in range(last + 1, self.n):
+            if self.rem[j] == 0 or j in near:
+                continue
+            if element_i != "C" and self.atoms[j][0] != "C":
+                continue
+            twin = (self.type_ids[j], tuple(sorted(self.adj[j].items())))
+            if twin in tried:
+                continue
+            tried.add(twin)
+            for order in (1, 2, 3):
+                if not self._order_ok(i, j, order):
+                    continue
+                self._add(i, j, order)
+                if self._feasible(i) and self._feasible(j):
+                    yield from self._extend(i, j, split_depth)
+                self._remove(i, j, order)
+
+    def _leaf(self):
+        mol = build_molecule([a[0] for a in self.atoms], [a[1] for a in self.atoms], self.bonds)
+        labels = [a[3] for a in self.atoms]
+        if not symmetry_consistent(mol, labels, self.symmetric):
+            return None
+        smiles = canonical_smiles(mol)
+        if smiles in self.found:
+            return None
+        self.found[smiles] = True
+        return smiles
+
+
+def build_molecule(symbols, hcounts, bonds):
+    """由枚举结果建 Molecule：全部由 C/N 组成、双键都在环内的六元环改为芳香键（见 perceive_aromaticity）。"""
+    aromatic, bonds = perceive_aromaticity(symbols, bonds)
+    return Molecule(symbols, aromatic, [0] * len(symbols), hcounts, bonds)
+
+
+def symmetry_consistent(mol, labels, symmetric=True):
+    """
+    labels[i] 为原子 i 所属的 13C 峰编号（无峰信息为 None）。
+    不同峰的碳不能拓扑等价（否则会只出一个峰）；symmetric=True 时同一峰的碳还必须拓扑等价。
+    """
+    classes = mol.symmetry_classes()
+    rotamers = _amide_substituents(mol)
+    by_label = {}
+    by_class = {}
+    for i, label in enumerate(labels):
+        if label is None:
+            continue
+        by_label.setdefault(label, set()).add(classes[i])
+        if i not in rotamers:
+            by_class.setdefault(classes[i], set()).add(label)
+    if any(len(labels_) > 1 for labels_ in by_class.values()):
+        return False
+    return not symmetric or all(len(c) == 1 for c in by_label.values())
+
+
+def _amide_substituents(mol):
+    """
+    酰胺氮上的原子（不含羰基碳）：C-N 键旋转受阻，拓扑等价的取代基（如 DMF 的两个甲基）可以出两个峰。
+    """
+    found = set()
+    for n, symbol in enumerate(mol.symbols):
+        if symbol != "N" or not any(is_carbonyl(mol, j) for j, _ in mol.neighbors[n]):
+            continue
+        found.update(j for j, _ in mol.neighbors[n] if not is_carbonyl(mol, j))
+    return found
+
+
+def _refine(mol, ranks):
+    count = len(set(ranks))
+    while True:
+        ranks = _rank([(ranks[i], tuple(sorted((ranks[j], o) for j, o in mol.neighbors[i])))
+                             for i in range(len(mol))])
+        refined = len(set(ranks))
+        if refined == count:
+            return ranks
+        count = refined
+
+
+def canonical_ranks(mol):
+    """
+    规范编号：Morgan 细化后，对第一个仍有并列的类逐个个体化并继续细化，
+    取编码（按编号排列的原子标签与键表）字典序最小的一种。小分子的并列类很少，分支数有限。
+    """
+    n = len(mol)
+    start = _refine(mol, _rank([(mol.symbols[i], mol.aromatic[i], mol.hcounts[i], mol.degree(i))
+                                      for i in range(n)]))
+    best = [None, None]
+
+    def code(ranks):
+        inverse = sorted(range(n), key=lambda i: ranks[i])
+        atoms = tuple((mol.symbols[i], mol.aromatic[i], mol.hcounts[i]) for i in inverse)
+        edges = tuple(sorted((min(ranks[i], ranks[j]), max(ranks[i], ranks[j]), order)
+                             for i, j, order in mol.bonds))
+        return atoms, edges
+
+    def search(ranks):
+        counts = Counter(ranks)
+        tied = [r for r, c in counts.items() if c > 1]
+        if not tied:
+            c = code(ranks)
+            if best[0] is None or c < best[0]:
+                best[0], best[1] = c, ranks
+            return
+        target = min(tied)
+        for i in range(n):
+            if ranks[i] != target:
+                continue
+            individual = [2 * r for r in ranks]
+            individual[i] = 2 * target - 1
+            search(_refine(mol, _rank(individual)))
+
+    search(start)
+    return best[1]
+
+
+def _atom_smiles(mol, i):
+    symbol = mol.symbols[i]
+    text = symbol.lower() if mol.aromatic[i] else symbol
+    if _implicit_hydrogens(symbol, mol.aromatic[i], [o for _, o in mol.neighbors[i]]) == mol.hcounts[i]:
+        return text
+    h = mol.hcounts[i]
+    return f"[{text}{'H' if h else ''}{h if h > 1 else ''}]"
+
+
+def canonical_smiles(mol):
+    """按规范编号深度优先写出 SMILES（芳香原子小写），同一分子得到同一字符串。"""
+    ranks = canonical_ranks(mol)
+    n = len(mol)
+    visited = [False] * n
+    ring_labels = {}
+    closures = {}
+    next_label = [1]
+    parent = [None] * n
+    order = []
+
+    # 第一遍：确定 DFS 树与环闭合键
+    def visit(a):
+        visited[a] = True
+        order.append(a)
+        for b, o in sorted(mol.neighbors[a], key=lambda x: ranks[x[0]]):
+            if b == parent[a]:
+                continue
+            if visited[b]:
+                if (b, a) not in ring_labels:
+                    ring_labels[(a, b)] = None
+                continue
+            parent[b] = a
+            visit(b)
+
+    # 从度数最小（通常是末端）且编号最小的原子开始，写出的 SMILES 更接近习惯写法
+    root = min(range(n), key=lambda i: (mol.degree(i), ranks[i]))
+    visit(root)
+    for (a, b) in ring_labels:
+        closures.setdefault(b, []).append((a, mol.bond_order(a, b)))
+        closures.setdefault(a, []).append((b, mol.bond_order(a, b)))
+
+    # 第二遍：输出；两个芳香原子之间的单键（如联苯）须写出 "-"，否则会被读成芳香键
+    open_labels = {}
+
+    def bond_symbol(a, b, order):
+        if order == 1 and mol.aromatic[a] and mol.aromatic[b]:
+            return "-"
+        return BOND_SYMBOLS[order]
+
+    def write(a):
+        text = _atom_smiles(mol, a)
+        for b, o in sorted(closures.get(a, []), key=lambda x: ranks[x[0]]):
+            key = (min(a, b), max(a, b))
+            if key in open_labels:
+                label = open_labels.pop(key)
+                text += bond_symbol(a, b, o) + (str(label) if label < 10 else f"%{label}")
+            else:
+                label = next_label[0]
+                next_label[0] += 1
+                open_labels[key] = label
+                text += bond_symbol(a, b, o) + (str(label) if label < 10 else f"%{label}")
+        children = [b for b, _ in sorted(mol.neighbors[a], key=lambda x: ranks[x[0]]) if parent[b] == a]
+        for k, b in enumerate(children):
+            branch = bond_symbol(a, b, mol.bond_order(a, b)) + write(b)
+            text += branch if k == len(children) - 1 else f"({branch})"
+        return text
+
+    return write(root)
+
+
+def is_solvent_peak(shift, tcode, count):
+    """interpret_dept_data 的一项是否为溶剂峰：位于常见氘代溶剂位移附近、计数写成 ">n" 的季碳。"""
+    return (tcode == 0 and not isinstance(count, int)
+            and any(abs(shift - s) <= SOLVENT_TOLERANCE for s in SOLVENT_C_SHIFTS))
+
+
+def carbon_peaks(c_nmr):
+    """由 c_nmr 数据得到 [[shift, type_code, 最少碳数], ...]，去掉溶剂峰。BB 计数 ">n" 记为至少 n+1。"""
+    resolved = interpret_dept_data(c_nmr.get("bb", []), c_nmr.get("dept90", []), c_nmr.get("dept135", []),
+                                   **dept_tolerances(c_nmr))
+    peaks = []
+    for shift, tcode, count in resolved:
+        if is_solvent_peak(shift, tcode, count):
+            continue
+        if isinstance(count, int):
+            minimum = max(count, 1)
+        else:
+            digits = "".join(ch for ch in str(count) if ch.isdigit())
+            minimum = int(digits) + 1 if digits else 1
+        peaks.append([shift, tcode, minimum])
+    return peaks
+
+
+def carbon_assignments(peaks, n_carbons, carbon_h):
+    """
+    把 n_carbons 个碳分配到各峰（每峰至少为其最少碳数），使碳上 H 总数为 carbon_h。
+    BB 计数常因对称性偏少，因此把给出的计数视为下限。产出每峰碳数的元组。
+    """
+    base = [p[2] for p in peaks]
+    extra = n_carbons - sum(base)
+    if extra < 0:
+        return
+    h_per = [p[1] for p in peaks]
+    base_h = sum(b * h for b, h in zip(base, h_per))
+
+    def place(k, left, h):
+        if k == len(peaks) - 1:
+            if h + left * h_per[k] == carbon_h:
+                yield (left,)
+            return
+        for add in range(left + 1):
+            h_next = h + add * h_per[k]
+            if h_next > carbon_h:
+                break
+            for rest in place(k + 1, left - add, h_next):
+                yield (add,) + rest
+
+    if not peaks:
+        return
+    for adds in place(0, extra, base_h):
+        yield tuple(b + a for b, a in zip(base, adds))
+
+
+def _integrals_fit(groups, integrals, optional):
+    """
+    1H 积分（整数 H 数）能否由各组 H 拼成：每组 H（同一 13C 峰上的全部 H）整体落入一个积分峰，
+    optional 中的组（杂原子上的活泼氢）可以不出现。
+    """
+    bins = sorted(integrals, reverse=True)
+    items = sorted([(h, False) for h in groups] + [(h, True) for h in optional], reverse=True)
+    fill = [0] * len(bins)
+
+    def place(k):
+        if k == len(items):
+            return all(f == b for f, b in zip(fill, bins))
+        h, may_skip = items[k]
+        seen = set()
+        for b in range(len(bins)):
+            if fill[b] + h <= bins[b] and (fill[b], bins[b]) not in seen:
+                seen.add((fill[b], bins[b]))
+                fill[b] += h
+                if place(k + 1):
+                    return True
+                fill[b] -= h
+        return may_skip and place(k + 1)
+
+    return place(0)
+
+
+def hetero_assignments(counts, hetero_h):
+    """杂原子上 H 的分配：产出 [(element, h), ...]，H 总数为 hetero_h。"""
+    elements = sorted(e for e in counts if e not in ("C", "H"))
+    per_element = []
+    for e in elements:
+        options = HETERO_H[e]
+        # 同种原子的 H 数以多重集枚举，避免同一分配的排列
+        per_element.append([combo for combo in itertools.combinations_with_replacement(options, counts[e])])
+    for choice in itertools.product(*per_element):
+        if sum(sum(c) for c in choice) != hetero_h:
+            continue
+        yield [(e, h) for e, combo in zip(elements, choice) for h in combo]
+
+
+def enumeration_jobs(formula, peaks=None, carbon_counts=None, hints=None, integrals=None):
+    """
+    把一个分子式展开为若干原子清单（每个清单一次图枚举）：
+    peaks 为 carbon_peaks 的结果（带位移，可推断杂化与对称性），或 carbon_counts 为
+    {"CH3": n, "CH2": n, "CH": n, "Cq": n}；hints: {"carbonyl": False 表示 IR 无羰基,
+    "xh": False 表示无 O-H/N-H, "hetero_h": 杂原子上的 H 总数}；integrals 为 1H 积分整数 H 数，用于筛选碳数分配。
+    """
+    counts = parse_formula(formula) if isinstance(formula, str) else dict(formula)
+    for e in counts:
+        if e != "H" and e not in ENUM_VALENCES:
+            raise ValueError(f"Element {e} is not supported by the enumerator.")
+    if peaks is None and carbon_counts is None:
+        raise ValueError("Either peaks or carbon_counts is required.")
+    hints = hints or {}
+    n_c, n_h = counts.get("C", 0), counts.get("H", 0)
+    max_hetero_h = sum(max(HETERO_H[e]) * k for e, k in counts.items() if e not in ("C", "H"))
+    if hints.get("hetero_h") is not None:
+        hetero_range = [hints["hetero_h"]]
+    elif hints.get("xh") is False:
+        hetero_range = [0]
+    else:
+        hetero_range = range(0, max_hetero_h + 1)
+
+    jobs = []
+    for hetero_h in hetero_range:
+        carbon_h = n_h - hetero_h
+        if carbon_h < 0:
+            continue
+        if peaks is not None:
+            carbon_sets = []
+            for assignment in carbon_assignments(peaks, n_c, carbon_h):
+                if integrals:
+                    groups = [k * p[1] for k, p in zip(assignment, peaks) if p[1]]
+                    if not _integrals_fit(groups, integrals, [1] * hetero_h):
+                        continue
+                carbon_sets.append([("C", p[1], carbon_patterns(p[0], hints.get("carbonyl")), label)
+                                    for label, (k, p) in enumerate(zip(assignment, peaks)) for _ in range(k)])
+        else:
+            total = sum(carbon_counts.get(t, 0) for t in TYPE_H)
+            if total != n_c or sum(carbon_counts.get(t, 0) * h for t, h in TYPE_H.items()) != carbon_h:
+                continue
+            carbon_sets = [[("C", h, carbon_patterns(carbonyl=hints.get("carbonyl")), None)
+                            for t, h in TYPE_H.items() for _ in range(carbon_counts.get(t, 0))]]
+        for hetero in hetero_assignments(counts, hetero_h):
+            hetero_atoms = [(e, h, _hetero_patterns(e, h, hints.get("carbonyl")), None) for e, h in hetero]
+            for carbons in carbon_sets:
+                jobs.append(carbons + hetero_atoms)
+    return jobs
+
+
+def _run_job(args):
+    """进程池中的子任务：(atoms, state, options) -> (smiles 列表, 节点数, 是否完整)。"""
+    atoms, state, options = args
+    search = _Search(atoms, **options)
+    found = []
+    try:
+        for kind, value in search.run(state):
+            if kind == "leaf":
+                found.append(value)
+    except BudgetExceeded:
+        return found, search.nodes, False
+    return found, search.nodes, True
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(max_workers):
+    """按进程数复用的进程池（首次使用时创建，线程安全）。不同线程中的样品共用同一组工作进程。"""
+    pool = _pools.get(max_workers)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(max_workers)
+            if pool is None:
+                pool = _pools[max_workers] = ProcessPoolExecutor(max_workers=max_workers)
+    return pool
+
+
+def enumerate_structures(jobs, *, min_ring=DEFAULT_MIN_RING, max_nodes=DEFAULT_MAX_NODES, symmetric=True,
+                         max_workers=None, time_limit=None):
+    """
+    枚举全部原子清单对应的不同构分子，返回 {"smiles": [...], "complete": bool, "nodes": int}。
+    complete 为 False 表示有子任务超出 max_nodes 或全部任务超出 time_limit 秒，结果可能不全。
+    max_workers 默认为 CPU 核数；大于 1 时在进程池中运行：每个清单先在本进程展开 SPLIT_DEPTH 个键，
+    各分支分别交给工作进程。为 1 时在本进程串行运行。
+    """
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    options = {"min_ring": min_ring, "max_nodes": max_nodes, "symmetric": symmetric,
+               "deadline": time.time() + time_limit if time_limit else None}
+    tasks = []
+    leaves = []
+    for atoms in jobs:
+        if max_workers > 1:
+            search = _Search(atoms, **options)
+            try:
+                for kind, value in search.run(split_depth=SPLIT_DEPTH):
+                    if kind == "split":
+                        tasks.append((atoms, value, options))
+                    else:
+                        leaves.append(value)
+            except BudgetExceeded:
+                return {"smiles": [], "complete": False, "nodes": search.nodes}
+        else:
+            tasks.append((atoms, None, options))
+
+    if max_workers > 1 and len(tasks) > 1:
+        results = list(get_pool(max_workers).map(_run_job, tasks, chunksize=max(1, len(tasks) // (4 * max_workers))))
+    else:
+        results = [_run_job(task) for task in tasks]
+
+    seen = dict.fromkeys(leaves)
+    nodes, complete = 0, True
+    for found, n, done in results:
+        seen.update(dict.fromkeys(found))
+        nodes += n
+        complete = complete and done
+    return {"smiles": list(seen), "complete": complete, "nodes": nodes}
+
+
+def _mass_values(mass):
+    return [float(m[0] if isinstance(m, (list, tuple)) else m) for m in mass or []]
+
+
+def ir_hints(wavenumbers):
+    """IR 的否定性提示：1650-1850 无吸收则无羰基，3200-3650 无吸收则无 O-H / N-H。只在有 IR 数据时给出。"""
+    values = [float(w[0] if isinstance(w, (list, tuple)) else w) for w in wavenumbers or []]
+    if not values:
+        return {}
+    hints = {}
+    if not any(1650 <= w <= 1850 for w in values):
+        hints["carbonyl"] = False
+    if not any(3200 <= w <= 3650 for w in values):
+        hints["xh"] = False
+    return hints
+
+
+def _integral_scale(n_h, integral_total, exchangeable):
+    """
+    1H 积分只给出相对比例：找最小的整数倍数 m，使 m * 积分总数与分子式 H 数之差在 [0, exchangeable] 内
+    （活泼氢可能交换掉而不出峰）。找不到返回 None。
+    """
+    for m in range(1, n_h // max(integral_total, 1) + 1):
+        if 0 <= n_h - m * integral_total <= exchangeable:
+            return m
+    return None
+
+
+def candidate_formulas(data, peaks=None, integral_total=None):
+    """
+    由输入数据推出候选分子式：JSON 中给出 "formula" 时直接使用；
+    否则由质谱最大 m/z（名义分子量）枚举 CcHhNnOo，要求碳数不少于 13C 峰所需的碳数、
+    H 数与 1H 积分总数相符（见 _integral_scale）、不饱和度为非负整数。
+    """
+    if data.get("formula"):
+        return [hill_formula(parse_formula(data["formula"]))]
+    masses = _mass_values(data.get("mass"))
+    if not masses:
+        return []
+    mw = int(round(max(masses)))
+    c_min = sum(p[2] for p in peaks) if peaks else 1
+    h_min = sum(p[1] * p[2] for p in peaks) if peaks else 0
+    formulas = []
+    for n in range(MAX_FORMULA_N + 1):
+        for o in range(MAX_FORMULA_O + 1):
+            for c in range(c_min, (mw - 14 * n - 16 * o) // 12 + 1):
+                h = mw - 12 * c - 14 * n - 16 * o
+                counts = {"C": c, "H": h, "N": n, "O": o}
+                dbe = formula_unsaturation(counts)
+                if h < h_min or dbe < 0 or dbe != int(dbe):
+                    continue
+                if integral_total and _integral_scale(h, integral_total, 2 * n + o) is None:
+                    continue
+                formulas.append(hill_formula({k: v for k, v in counts.items() if v}))
+    return formulas
+
+
+def _exhaustive(formula):
+    """
+    分子式的搜索能否覆盖全部异构体：杂原子之间不成键、高价态（硝基、砜等）都不枚举，
+    因此含两个及以上杂原子（如过氧化物 C-O-O-C 与醚醇）时结果不是穷举的。
+    """
+    return sum(k for e, k in parse_formula(formula).items() if e not in ("C", "H")) < 2
+
+
+def shortlist_structures(data, *, max_workers=None, min_ring=DEFAULT_MIN_RING, max_nodes=DEFAULT_MAX_NODES,
+                         time_limit=DEFAULT_TIME_LIMIT):
+    """
+    由一个样品的原始数据（mass / ir / h_nmr / c_nmr，可选 formula）在本地枚举候选结构，
+    候选不多时按 13C 预测吻合度排序。数据不足（没有 c_nmr 或推不出分子式）时返回 None，否则返回 dict：
+      formulas: 考虑过的分子式；count: 候选总数；complete: 搜索是否完整；
+      unique: 搜索完整、对这些分子式是穷举的（见 _exhaustive；排除了小环时另用 min_ring=3 复查）且只剩一个结构；
+      formula_given: 分子式是否由输入明确给出（而非由质谱推测）；
+      candidates: count 不超过 RANK_LIMIT 时为 [{"smiles", "formula", "cost"}]（cost 升序），否则为空。
+    """
+    c_nmr = data.get("c_nmr")
+    if not isinstance(c_nmr, dict) or not c_nmr.get("bb"):
+        return None
+    peaks = carbon_peaks(c_nmr)
+    integrals = None
+    if data.get("h_nmr"):
+        counts, total, _ = estimate_proton_counts([item.get("area") for item in data["h_nmr"]])
+        if total is not None and all(c is not None for c in counts):
+            integrals = counts
+    formulas = candidate_formulas(data, peaks, sum(integrals) if integrals else None)
+    if not formulas:
+        return None
+
+    hints = ir_hints(data.get("ir"))
+    jobs = []
+    for formula in formulas:
+        scaled = None
+        if integrals:
+            elements = parse_formula(formula)
+            m = _integral_scale(elements.get("H", 0), sum(integrals),
+                                sum(max(HETERO_H[e]) * k for e, k in elements.items() if e in HETERO_H))
+            scaled = [m * h for h in integrals] if m else None
+        jobs += enumeration_jobs(formula, peaks=peaks, hints=hints, integrals=scaled)
+
+    started = time.time()
+    result = enumerate_structures(jobs, min_ring=min_ring, max_nodes=max_nodes, max_workers=max_workers,
+                                  time_limit=time_limit)
+    unique = result["complete"] and len(result["smiles"]) == 1 and all(_exhaustive(f) for f in formulas)
+    if unique and min_ring > 3 and any(formula_unsaturation(parse_formula(f)) > 0 for f in formulas):
+        # 默认剪掉了三、四元环：在剩余时限内不剪枝重搜一次，仍只有一个结构才算唯一
+        remaining = time_limit - (time.time() - started) if time_limit else None
+        recheck = None
+        if remaining is None or remaining > 0:
+            recheck = enumerate_structures(jobs, min_ring=3, max_nodes=max_nodes, max_workers=max_workers,
+                                           time_limit=remaining)
+        unique = bool(recheck) and recheck["complete"] and len(recheck["smiles"]) == 1
+    candidates = []
+    if len(result["smiles"]) <= RANK_LIMIT:
+        resolved = interpret_dept_data(c_nmr.get("bb", []), c_nmr.get("dept90", []), c_nmr.get("dept135", []),
+                                       **dept_tolerances(c_nmr))
+        resolved = [p for p in resolved if not is_solvent_peak(*p)]
+        candidates = [{"smiles": r["smiles"], "formula": _formula_of(r["smiles"]), "cost": float(r["cost"])}
+                      for r in rank_c_candidates(result["smiles"], resolved) if "error" not in r]
+    return {
+        "formulas": formulas,
+        "count": len(result["smiles"]),
+        "complete": result["complete"],
+        "unique": unique,
+        "formula_given": bool(data.get("formula")),
+        "candidates": candidates,
+        "nodes": result["nodes"],
+    }
+
+
+def _formula_of(smiles):
+    return parse_smiles(smiles).formula_string()
+
+
+def format_shortlist(result, lang='zh', shortlist_size=SHORTLIST_SIZE):
+    """
+    把 shortlist_structures 的结果写成交给 AI 的几行文字；候选过多、为空或搜索不完整时返回 []。
+    """
+    if not result or not result["complete"] or not result["candidates"] or result["count"] > shortlist_size:
+        return []
+    lines = [tr("enum_shortlist_title", lang)]
+    for k, c in enumerate(result["candidates"], 1):
+        lines.append(tr("enum_shortlist_line", lang, k, c["smiles"], c["formula"]))
+    return lines
+
+
+def format_unique(result, lang='zh'):
+    c = result["candidates"][0]
+    return tr("enum_unique_answer", lang, c["smiles"], c["formula"])
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("用法: python enumerateStructure.py <输入 JSON (含 c_nmr，及 formula 或 mass)>")
+        sys.exit(1)
+    with open(sys.argv[1], "r", encoding="utf-8") as f:
+        sample = json.load(f)
+    found = shortlist_structures(sample)
+    print(json.dumps(found, ensure_ascii=False, indent=2))
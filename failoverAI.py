@@ -0,0 +1,251 @@
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+
+from metricsAI import current_metrics
+
+# 容错调用的默认参数，可在 API.json 中用同名键覆盖（见 failover_options）
+DEFAULT_FAILOVER_OPTIONS = {
+    # 单个端点在该时间内没有任何增量（思考或正文）即视为失败
+    "first_token_timeout": 60.0,
+    # 是否在主端点迟迟没有首个增量时向备用端点发出同一请求
+    "hedge": True,
+    # 历史样本不足时的对冲等待时间；样本足够后改用该端点首个增量时间的 hedge_quantile 分位数
+    "hedge_delay": 10.0,
+    "hedge_quantile": 0.95,
+    "hedge_min_samples": 5,
+    # 首个增量前失败时最多尝试的轮数，轮与轮之间按指数退避并加随机抖动
+    "max_attempts": 3,
+    "backoff_base": 0.5,
+    "backoff_max": 8.0,
+    # 连续失败 breaker_threshold 次后断路 breaker_cooldown 秒，期间不再向该端点发请求
+    "breaker_threshold": 3,
+    "breaker_cooldown": 30.0,
+}
+
+
+class EndpointUnavailableError(RuntimeError):
+    """全部端点都处于断路状态，或在允许的尝试次数内都没有开始输出。"""
+
+
+def failover_options(config=None):
+    """从配置中取出容错选项，缺省项使用 DEFAULT_FAILOVER_OPTIONS。"""
+    options = dict(DEFAULT_FAILOVER_OPTIONS)
+    for name in DEFAULT_FAILOVER_OPTIONS:
+        if config and config.get(name) is not None:
+            options[name] = type(DEFAULT_FAILOVER_OPTIONS[name])(config[name])
+    return options
+
+
+class EndpointHealth:
+    """
+    单个端点的近期表现：最近若干次首个增量时间 (TTFT) 与连续失败计数（断路器）。
+    GUI 各工作线程共用同一实例，所有方法线程安全。
+    """
+
+    def __init__(self, window=50):
+        self._lock = threading.Lock()
+        self._ttft = deque(maxlen=window)
+        self._failures = 0
+        self._opened_at = None
+
+    def available(self, options):
+        """断路期间返回 False；冷却结束后进入半开状态，允许请求试探。"""
+        with self._lock:
+            return self._opened_at is None or time.monotonic() - self._opened_at >= options["breaker_cooldown"]
+
+    def reopens_in(self, options):
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            return max(0.0, options["breaker_cooldown"] - (time.monotonic() - self._opened_at))
+
+    def success(self, ttft):
+        with self._lock:
+            self._ttft.append(ttft)
+            self._failures = 0
+            self._opened_at = None
+
+    def failure(self, options):
+        """记录一次失败，返回 True 表示断路器因此打开（半开状态下的失败会重新打开）。"""
+        with self._lock:
+            self._failures += 1
+            if self._failures >= options["breaker_threshold"]:
+                opened = self._opened_at is None or time.monotonic() - self._opened_at >= options["breaker_cooldown"]
+                if opened:
+                    self._opened_at = time.monotonic()
+                return opened
+            return False
+
+    def hedge_delay(self, options):
+        """对冲前等待的时间：样本足够时取 TTFT 的 hedge_quantile 分位数，否则取 hedge_delay。"""
+        with self._lock:
+            values = sorted(self._ttft)
+        if len(values) < options["hedge_min_samples"]:
+            return options["hedge_delay"]
+        k = min(len(values) - 1, int(round(options["hedge_quantile"] * (len(values) - 1))))
+        return values[k]
+
+
+_health = {}
+_health_lock = threading.Lock()
+
+
+def endpoint_health(key):
+    """按端点 key（如 "model@base_url"）取进程级共享的 EndpointHealth。"""
+    health = _health.get(key)
+    if health is None:
+        with _health_lock:
+            health = _health.setdefault(key, EndpointHealth())
+    return health
+
+
+def backoff_delay(attempt, options, rng=random):
+    """第 attempt 次（从 0 开始）重试前的等待：指数退避，乘以 [0.5, 1.5) 的随机抖动，避免多个客户端同时重试。"""
+    delay = min(options["backoff_max"], options["backoff_base"] * (2 ** attempt))
+    return delay * (0.5 + rng.random())
+
+
+class _Attempt:
+    """一次对某端点的流式请求。赢得竞速前增量先缓存，赢得后回放并直接转发。"""
+
+    def __init__(self, endpoint, key, timeout, first_token):
+        self.endpoint = endpoint
+        self.key = key
+        self.started = time.monotonic()
+        self.deadline = self.started + timeout
+        self.first_token = first_token
+        self.settled = False
+        self.first = None
+        self.events = []
+        self.forward = None
+        self.task = None
+        # 回复来自本地缓存回放（没有真正发出请求）时为 True，其 TTFT 不计入端点统计
+        self.cached = False
+
+    def emit(self, kind, text):
+        if self.first is None:
+            self.first = time.monotonic()
+            self.first_token.set()
+        if self.forward is not None:
+            self.forward(kind, text)
+        else:
+            self.events.append((kind, text))
+
+    def win(self, forward):
+        for kind, text in self.events:
+            forward(kind, text)
+        self.events = []
+        self.forward = forward
+
+
+async def failover_stream(endpoints, stream, *, key=None, on_delta=None, on_thinking=None, options=None):
+    """
+    对 endpoints 中的端点做带对冲、重试与断路的流式请求，返回胜出请求的完整正文。
+
+    stream(endpoint, on_delta, on_thinking, on_cached) 为发起一次流式请求的协程函数（如包装后的 ask_AI_async），
+    回复从缓存回放时应调用 on_cached()：回放的 TTFT 不足 1 ms，计入统计会把对冲延迟压到 0；
+    key(endpoint) 给出统计 TTFT 与断路状态用的键，默认为端点本身。
+    每一轮从可用端点中按顺序选主端点（重试时轮换）；主端点在对冲延迟内没有首个增量时，
+    向下一个可用端点发出同一请求，先产生增量的一方胜出，另一方被取消。
+    首个增量之前的失败与超时计入断路器，并在退避后进入下一轮；
+    增量已经转发给调用方之后的失败无法透明重试，直接抛出。
+    """
+    options = dict(DEFAULT_FAILOVER_OPTIONS, **(options or {}))
+    key = key or (lambda endpoint: endpoint)
+    assert endpoints, "至少需要一个端点"
+    assert options["max_attempts"] >= 1, "max_attempts 必须 >= 1"
+    metrics = current_metrics()
+
+    def forward(kind, text):
+        callback = on_thinking if kind == "thinking" else on_delta
+        if callback is not None:
+            callback(text)
+
+    def launch(endpoint, first_token):
+        attempt = _Attempt(endpoint, key(endpoint), options["first_token_timeout"], first_token)
+        def on_cached():
+            attempt.cached = True
+
+        attempt.task = asyncio.ensure_future(stream(endpoint, lambda text: attempt.emit("content", text),
+                                                    lambda text: attempt.emit("thinking", text), on_cached))
+        return attempt
+
+    def fail(attempt, error):
+        nonlocal last_error
+        attempt.settled = True
+        last_error = error
+        if endpoint_health(attempt.key).failure(options):
+            metrics.incr("failover_breaker_open", endpoint=str(attempt.key))
+
+    last_error = None
+    for round_no in range(options["max_attempts"]):
+        candidates = [e for e in endpoints if endpoint_health(key(e)).available(options)]
+        if not candidates:
+            wait = min(endpoint_health(key(e)).reopens_in(options) for e in endpoints)
+            raise EndpointUnavailableError(f"All endpoints are circuit-open; retry in {wait:.0f} s.")
+        primary = candidates[round_no % len(candidates)]
+        backups = [e for e in candidates if e is not primary] if options["hedge"] else []
+        first_token = asyncio.Event()
+        attempts = [launch(primary, first_token)]
+        hedge_at = attempts[0].started + endpoint_health(key(primary)).hedge_delay(options) if backups else None
+        winner = None
+        try:
+            while True:
+                winner = next((a for a in attempts if a.first is not None), None)
+                if winner is not None:
+                    break
+                now = time.monotonic()
+                for a in attempts:
+                    if a.settled:
+                        continue
+                    if a.task.done():
+                        error = None if a.task.cancelled() else a.task.exception()
+                        fail(a, error or ValueError(f"Empty answer from {a.key}."))
+                    elif now >= a.deadline:
+                        a.task.cancel()
+                        fail(a, TimeoutError(f"No token from {a.key} within {options['first_token_timeout']} s."))
+                live = [a for a in attempts if not a.settled]
+                if hedge_at is not None and (now >= hedge_at or not live):
+                    # 主端点迟迟没有输出（或已失败）：向备用端点发出同一请求
+                    attempts.append(launch(backups.pop(0), first_token))
+                    metrics.incr("failover_hedges", endpoint=str(attempts[-1].key))
+                    hedge_at = None
+                    continue
+                if not live:
+                    break
+                points = [a.deadline for a in live] + ([hedge_at] if hedge_at is not None else [])
+                waiter = asyncio.ensure_future(first_token.wait())
+                try:
+                    await asyncio.wait([a.task for a in live] + [waiter], timeout=max(0.0, min(points) - now),
+                                       return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    waiter.cancel()
+        finally:
+            for a in attempts:
+                if a is not winner and not a.task.done():
+                    a.task.cancel()
+
+        if winner is None:
+            # 本轮全部在首个增量前失败：退避后换端点重试
+            if round_no + 1 < options["max_attempts"]:
+                metrics.incr("failover_retries")
+                await asyncio.sleep(backoff_delay(round_no, options))
+            continue
+
+        winner.win(forward)
+        try:
+            text = await winner.task
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            fail(winner, e)
+            raise
+        if not winner.cached:
+            endpoint_health(winner.key).success(winner.first - winner.started)
+        metrics.incr("failover_wins", endpoint=str(winner.key), hedged=len(attempts) > 1)
+        return text
+
+    raise EndpointUnavailableError(f"No endpoint produced output after {options['max_attempts']} attempts: {last_error}")
@@ -1,11 +1,29 @@
 from processC_DEPR_NMR import processC_DEPR_NMR
 from processH_NMR import processH_NMR
 from processIR import processIR
+from profileIR import processIRSpectrum
+from profileH_NMR import processH_NMRSpectrum
+from readJCAMP import load_jcamp_input
 from processMASS import processMASS
+from profileMASS import DEFAULT_TOP_N, processMASSProfile
+from cacheAI import get_cache, cache_key
+from consensusAI import self_consistency
+from promptAI import DEFAULT_PROMPT_BUDGET, gen_prompt_1_budget, gen_prompt_2_budget
+from structuredAI import (DEFAULT_STRUCTURED_MAX_TOKENS, JsonStreamScanner, gen_prompt_1_structured,
+                          parse_functional_groups, format_functional_groups,
+                          response_format as structured_response_format)
 import sys
 import json
 import os
-from openai import OpenAI
+import time
+import asyncio
+from clientAI import load_api_config, get_client, get_async_client, close_async_clients, pool_options, \
+    run_in_client_loop
+from metricsAI import StreamMeter, current_metrics, start_run, write_metrics
+from failoverAI import failover_options, failover_stream
+from enumerateStructure import shortlist_structures, format_shortlist, format_unique
+from verifyStructure import verify_answer
+from referenceLibrary import search_library, library_options, format_library_hits, format_library_match
 
 def load_locales():
     try:
@@ -53,64 +71,255 @@ def gen_prompt_2(findings, lang='zh'):
     
     return prompt
     
+def _resolve_api(api_config_path, api_key, base_url, model):
+    """读取配置并补全 api_key / base_url / model（显式参数优先），返回 (config, api_key, base_url, model)。"""
+    # 配置文件按修改时间缓存，未变化时不重复读盘
+    config = load_api_config(api_config_path)
+
+    api_key = api_key or config.get("api_key")
+    base_url = base_url or config.get("base_url")
+    model = model or config.get("model")
+
+    if not api_key or not base_url or not model:
+        raise ValueError("API 配置不完整，请提供 api_key、base_url 和 model。")
+    return config, api_key, base_url, model
+
+def _replay_cached(hit, on_delta, on_thinking):
+    """hit 为缓存条目 (正文, 思考内容)：一次性回放并返回正文；未命中 (None) 返回 None。"""
+    if hit is None:
+        return None
+    text, reasoning = hit
+    if reasoning and on_thinking:
+        on_thinking(reasoning)
+    if text and on_delta is not None:
+        on_delta(text)
+    return text
+
+def _messages(prompt):
+    return [
+        {"role": "system", "content": "You are a helpful assistant."},
+        {"role": "user", "content": prompt},
+    ]
+
+def _request_options(max_tokens, response_format):
+    options = {}
+    if max_tokens:
+        options["max_tokens"] = max_tokens
+    if response_format:
+        options["response_format"] = response_format
+    return options
+
 def ask_AI(prompt, *, api_config_path: str = "API.json", api_key: str = None,
-           base_url: str = None, model: str = None, on_delta=None, on_thinking=None, thinking:str = "enabled") -> str:
+           base_url: str = None, model: str = None, on_delta=None, on_thinking=None, thinking:str = "enabled",
+           use_cache: bool = True, refresh_cache: bool = False, cache_path: str = None,
+           max_tokens: int = None, response_format: dict = None, stop_when=None) -> str:
     """调用 AI 模型，支持流式回调，并返回完整字符串。
 
     参数优先级：显式参数 > 配置文件。
     on_delta: 可选回调函数，签名为 on_delta(text: str)，每次增量输出调用一次。
     on_thinking: 可选回调函数，签名为 on_thinking(text: str)，每次增量思考内容调用一次。
     thinking: 控制思考内容的显示，"enabled" 或 "disabled"。
+    use_cache: 相同 prompt/model/base_url/thinking/max_tokens/response_format 的回复从磁盘缓存直接回放，
+               False 则完全绕过缓存；被 max_tokens 截断的回复不缓存。
+    refresh_cache: 忽略已有缓存重新请求，并用新回复覆盖缓存。
+    cache_path: 缓存文件路径，默认为程序目录下的 ai_cache.sqlite3。
+    max_tokens / response_format: 原样传给 chat.completions.create（为 None 时不传）。
+    stop_when: 可选回调 stop_when(delta) -> bool，返回 True 时立即关闭流并以已收到的正文返回
+               （例如 structuredAI.JsonStreamScanner.feed，在 JSON 对象闭合时停止）。
     """
-    config = {}
-    if api_config_path:
-        try:
-            with open(api_config_path, "r", encoding="utf-8") as f:
-                config = json.load(f)
-        except FileNotFoundError:
-            config = {}
+    config, api_key, base_url, model = _resolve_api(api_config_path, api_key, base_url, model)
 
-    api_key = api_key or config.get("api_key")
-    base_url = base_url or config.get("base_url")
-    model = model or config.get("model")
+    cache = get_cache(cache_path) if use_cache else None
+    options = _request_options(max_tokens, response_format)
+    key = cache_key(prompt, model, base_url, thinking, options) if cache else None
+    if cache and not refresh_cache:
+        text = _replay_cached(cache.get(key), on_delta, on_thinking)
+        if text is not None:
+            current_metrics().incr("ai_cache_hits", endpoint=base_url, model=model)
+            print(text, end="", flush=True)
+            return text
 
-    if not api_key or not base_url or not model:
-        raise ValueError("API 配置不完整，请提供 api_key、base_url 和 model。")
+    # 同一端点复用客户端与 keep-alive 连接池
+    client = get_client(api_key, base_url, pool_options(config))
 
-    client = OpenAI(
-        api_key=api_key,
-        base_url=base_url,
-    )
+    full_text_parts = []
+    reasoning_parts = []
+    finish_reason = None
+    meter = StreamMeter(base_url, model)
+    status = "error"
+    try:
+        completion = client.chat.completions.create(
+            model=model,
+            messages=_messages(prompt),
+            stream=True,
+            extra_body={"thinking": {"type": thinking}},
+            **options,
+        )
+        meter.opened()
 
-    completion = client.chat.completions.create(
-        model=model,
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant."},
-            {"role": "user", "content": prompt},
-        ],
-        stream=True,
-        extra_body={"thinking": {"type": thinking}},
-    )
+        status = "ok"
+        for chunk in completion:
+            # 尝试获取思考内容 (DeepSeek 等模型使用 reasoning_content)
+            reasoning = getattr(chunk.choices[0].delta, 'reasoning_content', None)
+            if reasoning:
+                meter.reasoning(reasoning)
+                reasoning_parts.append(reasoning)
+                if on_thinking:
+                    on_thinking(reasoning)
+
+            finish_reason = chunk.choices[0].finish_reason or finish_reason
+            delta = chunk.choices[0].delta.content or ""
+            if not delta:
+                continue
+            meter.content(delta)
+            full_text_parts.append(delta)
+            if on_delta is not None:
+                on_delta(delta)
+            # 兼容原先命令行使用
+            print(delta, end="", flush=True)
+            if stop_when is not None and stop_when(delta):
+                # 需要的内容已经完整，关闭连接不再为剩余输出付费
+                completion.close()
+                status = "stopped"
+                break
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        meter.finish(status)
+
+    full_text = "".join(full_text_parts)
+    # 只缓存完整结束且有正文的回复；因 max_tokens 被截断 (finish_reason "length") 的不缓存
+    if cache and full_text and finish_reason != "length":
+        cache.put(key, full_text, "".join(reasoning_parts), model=model, base_url=base_url)
+    return full_text
+
+async def ask_AI_async(prompt, *, api_config_path: str = "API.json", api_key: str = None,
+                       base_url: str = None, model: str = None, on_delta=None, on_thinking=None, thinking: str = "enabled",
+                       use_cache: bool = True, refresh_cache: bool = False, cache_path: str = None,
+                       max_tokens: int = None, response_format: dict = None, stop_when=None,
+                       max_retries: int = None, on_cached=None) -> str:
+    """ask_AI 的 asyncio 版本，参数、回调与缓存行为相同。
+
+    多个请求会并发交错输出，因此不向标准输出打印增量，需要显示时请使用 on_delta / on_thinking。
+    max_retries: 覆盖客户端自身的重试次数（None 取配置文件），与缓存的客户端共用连接池。
+    on_cached: 可选回调 on_cached()，回复从磁盘缓存回放（没有发出请求）时在回放前调用。
+    """
+    config, api_key, base_url, model = _resolve_api(api_config_path, api_key, base_url, model)
+
+    cache = get_cache(cache_path) if use_cache else None
+    options = _request_options(max_tokens, response_format)
+    key = cache_key(prompt, model, base_url, thinking, options) if cache else None
+    if cache and not refresh_cache:
+        hit = cache.get(key)
+        if hit is not None and on_cached is not None:
+            on_cached()
+        text = _replay_cached(hit, on_delta, on_thinking)
+        if text is not None:
+            current_metrics().incr("ai_cache_hits", endpoint=base_url, model=model)
+            return text
+
+    # 同一事件循环内按端点复用异步客户端
+    client = get_async_client(api_key, base_url, pool_options(config))
+    if max_retries is not None:
+        client = client.with_options(max_retries=max_retries)
 
     full_text_parts = []
-    for chunk in completion:
-        # 尝试获取思考内容 (DeepSeek 等模型使用 reasoning_content)
-        reasoning = getattr(chunk.choices[0].delta, 'reasoning_content', None)
-        if reasoning:
-            if on_thinking:
-                on_thinking(reasoning)
+    reasoning_parts = []
+    finish_reason = None
+    meter = StreamMeter(base_url, model)
+    status = "error"
+    completion = None
+    try:
+        completion = await client.chat.completions.create(
+            model=model,
+            messages=_messages(prompt),
+            stream=True,
+            extra_body={"thinking": {"type": thinking}},
+            **options,
+        )
+        meter.opened()
+
+        status = "ok"
+        async for chunk in completion:
+            reasoning = getattr(chunk.choices[0].delta, 'reasoning_content', None)
+            if reasoning:
+                meter.reasoning(reasoning)
+                reasoning_parts.append(reasoning)
+                if on_thinking:
+                    on_thinking(reasoning)
+
+            finish_reason = chunk.choices[0].finish_reason or finish_reason
+            delta = chunk.choices[0].delta.content or ""
+            if not delta:
+                continue
+            meter.content(delta)
+            full_text_parts.append(delta)
+            if on_delta is not None:
+                on_delta(delta)
+            if stop_when is not None and stop_when(delta):
+                await completion.close()
+                status = "stopped"
+                break
+    except asyncio.CancelledError:
+        # 自洽采样达到法定票数或对冲请求落败后被取消：立即释放连接，不等垃圾回收
+        status = "cancelled"
+        if completion is not None:
+            await completion.close()
+        raise
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        meter.finish(status)
+
+    full_text = "".join(full_text_parts)
+    if cache and full_text and finish_reason != "length":
+        cache.put(key, full_text, "".join(reasoning_parts), model=model, base_url=base_url)
+    return full_text
         
-        delta = chunk.choices[0].delta.content or ""
-        if not delta:
+async def ask_AI_failover_async(prompt, endpoints, *, api_config_path: str = "API.json", on_delta=None,
+                                on_thinking=None, thinking: str = "enabled", use_cache: bool = True,
+                                options: dict = None, **request) -> str:
+    """
+    在多组端点之间容错地调用 AI（见 failoverAI.failover_stream）：首个增量超时、抖动退避重试、断路器，
+    以及主端点超过其历史 p95 首 token 时间仍无输出时向备用端点发出对冲请求，先输出者胜出。
+    endpoints: [(api_key, base_url, model), ...]，按优先顺序排列，缺项时回退到配置文件。
+    options: 容错参数，默认取配置文件中的同名键（见 DEFAULT_FAILOVER_OPTIONS）。
+    其余参数与 ask_AI_async 相同。
+    """
+    config = load_api_config(api_config_path)
+    # 不完整的备用端点直接跳过，相同的端点只保留一次
+    resolved = []
+    for endpoint in endpoints:
+        try:
+            endpoint = _resolve_api(api_config_path, *endpoint)[1:]
+        except ValueError:
             continue
-        full_text_parts.append(delta)
-        if on_delta is not None:
-            on_delta(delta)
-        # 兼容原先命令行使用
-        print(delta, end="", flush=True)
+        if endpoint not in resolved:
+            resolved.append(endpoint)
+    if not resolved:
+        raise ValueError("API 配置不完整，请提供 api_key、base_url 和 model。")
+
+    async def stream(endpoint, delta_callback, thinking_callback, cached_callback):
+        api_key, base_url, model = endpoint
+        # 重试与切换端点由 failover_stream 负责，SDK 自身不再重试，否则每次尝试会变成多次 HTTP 请求
+        return await ask_AI_async(prompt, api_config_path=api_config_path, api_key=api_key, base_url=base_url,
+                                  model=model, on_delta=delta_callback, on_thinking=thinking_callback,
+                                  thinking=thinking, use_cache=use_cache, max_retries=0, on_cached=cached_callback,
+                                  **request)
+
+    return await failover_stream(resolved, stream, key=lambda endpoint: f"{endpoint[2]}@{endpoint[1]}",
+                                 on_delta=on_delta, on_thinking=on_thinking,
+                                 options=options or failover_options(config))
+
+def ask_AI_failover(prompt, endpoints, **kwargs) -> str:
+    """
+    ask_AI_failover_async 的同步入口（供 GUI 工作线程使用），参数相同。
+    在常驻的后台事件循环中运行，多次调用之间复用异步客户端与 keep-alive 连接。
+    """
+    return run_in_client_loop(ask_AI_failover_async(prompt, endpoints, **kwargs))
 
-    return "".join(full_text_parts)
-        
 def get_data_from_json(file_path):
     with open(file_path, 'r', encoding='utf-8') as f:
         data = json.load(f)
@@ -118,16 +327,40 @@ def get_data_from_json(file_path):
 
 def gen_datas(data, lang='zh'):
     datas = []
+    # 每个处理器的耗时记入当前运行的指标（见 metricsAI）
+    metrics = current_metrics()
+    # JCAMP-DX：JSON: "jcamp" -> 文件路径或路径列表，按数据类型解码后与其余键合并（JSON 中显式给出的键优先）
+    if "jcamp" in data:
+        with metrics.timer("gen_datas", processor="jcamp"):
+            jcamp = load_jcamp_input(data["jcamp"])
+        # 谱图文件自动取峰得到的质谱与 mass_profile 一样，只保留前 DEFAULT_TOP_N 条丢失线索
+        mass_top_n = DEFAULT_TOP_N if "mass" in jcamp and "mass" not in data else None
+        data = {**jcamp, **{k: v for k, v in data.items() if k != "jcamp"}}
+    else:
+        mass_top_n = None
+
     # 质谱：JSON: "mass" -> processMASS: 列表[数值]
     if "mass" in data:
         mass_data = data["mass"]
-        mass_result = processMASS(mass_data, lang=lang)
+        with metrics.timer("gen_datas", processor="mass"):
+            mass_result = processMASS(mass_data, lang=lang, top_n=mass_top_n)
+        datas.append(mass_result)
+    # 质谱原始 profile：JSON: "mass_profile" -> processMASSProfile: dict(path, ...)，自动取峰
+    elif "mass_profile" in data:
+        with metrics.timer("gen_datas", processor="mass_profile"):
+            mass_result = processMASSProfile(data["mass_profile"], lang=lang)
         datas.append(mass_result)
 
     # IR：JSON: "ir" -> processIR: 列表[数值]
     if "ir" in data:
         ir_data = data["ir"]
-        ir_result = processIR(ir_data, lang=lang)
+        with metrics.timer("gen_datas", processor="ir"):
+            ir_result = processIR(ir_data, lang=lang)
+        datas.append(ir_result)
+    # IR 原始谱线：JSON: "ir_spectrum" -> processIRSpectrum: dict(path 或 x/y, ...)，自动检峰
+    elif "ir_spectrum" in data:
+        with metrics.timer("gen_datas", processor="ir_spectrum"):
+            ir_result = processIRSpectrum(data["ir_spectrum"], lang=lang)
         datas.append(ir_result)
 
     # 1H NMR：JSON: "h_nmr" (dict 列表) -> processH_NMR: 列表[(shift, area, mult)]
@@ -139,7 +372,14 @@ def gen_datas(data, lang='zh'):
             area = item.get("area")
             mult = int(item.get("multiplicity", 1))
             h_nmr_data.append((shift, area, mult))
-        h_nmr_result = processH_NMR(h_nmr_data, lang=lang)
+        with metrics.timer("gen_datas", processor="h_nmr"):
+            h_nmr_result = processH_NMR(h_nmr_data, lang=lang)
+        datas.append(h_nmr_result)
+    # 1H NMR 原始数据：JSON: "h_nmr_spectrum" -> processH_NMRSpectrum: dict(fid / path / x,y / peaks, ...)
+    # 自动相位、基线、取峰、多重峰分组与积分
+    elif "h_nmr_spectrum" in data:
+        with metrics.timer("gen_datas", processor="h_nmr_spectrum"):
+            h_nmr_result = processH_NMRSpectrum(data["h_nmr_spectrum"], lang=lang)
         datas.append(h_nmr_result)
 
     # 13C/DEPT NMR：JSON: "c_nmr" (dict 列表) -> processC_DEPR_NMR: 列表[(shift, type_str)]
@@ -148,12 +388,528 @@ def gen_datas(data, lang='zh'):
         
         if isinstance(c_nmr_raw, dict):
             # 新格式：直接传递包含 bb, dept90, dept135 的字典
-            c_dept_nmr_result = processC_DEPR_NMR(c_nmr_raw, lang=lang)
+            with metrics.timer("gen_datas", processor="c_nmr"):
+                c_dept_nmr_result = processC_DEPR_NMR(c_nmr_raw, lang=lang)
             if isinstance(c_dept_nmr_result, list):
                 datas.append(f"13C/DEPT NMR Data: {json.dumps(c_dept_nmr_result)}")
             else:
                 datas.append(c_dept_nmr_result)
     return datas
+
+def endpoint_config(config, index):
+    """
+    取出第 index (1 或 2) 组端点配置 (api_key, base_url, model)。
+    与 GUI 一致：缺省时回退到不带序号的键，第 2 组的 api_key 还会回退到第 1 组。
+    """
+    api_key = config.get(f"api_key_{index}") or config.get("api_key") or config.get("api_key_1")
+    base_url = config.get(f"base_url_{index}") or config.get("base_url")
+    model = config.get(f"model_{index}") or config.get("model")
+    return api_key, base_url, model
+
+async def _ask_endpoint_async(prompt, config, index, *, api_config_path="API.json", semaphores=None,
+                              thinking="enabled", use_cache=True, **request):
+    """
+    用第 index 组端点配置请求 AI；给出 semaphores 时占用该端点的一个名额。
+    request 中的 max_tokens / response_format / stop_when 原样传给 ask_AI_async。
+    """
+    api_key, base_url, model = endpoint_config(config, index)
+    semaphore = (semaphores or {}).get(base_url)
+    if semaphore is None:
+        return await ask_AI_async(prompt, api_config_path=api_config_path, api_key=api_key, base_url=base_url,
+                                  model=model, thinking=thinking, use_cache=use_cache, **request)
+    # 等待端点名额的时间反映该端点的并发上限是否过小
+    waited = time.perf_counter()
+    async with semaphore:
+        current_metrics().observe("endpoint_wait", time.perf_counter() - waited, endpoint=base_url)
+        return await ask_AI_async(prompt, api_config_path=api_config_path, api_key=api_key, base_url=base_url,
+                                  model=model, thinking=thinking, use_cache=use_cache, **request)
+
+def structured_request(structured, max_tokens=DEFAULT_STRUCTURED_MAX_TOKENS):
+    """
+    结构化 Step 2 的请求参数与流扫描器：返回 (request kwargs, scanner)。
+    structured 为 "json_object" / "json_schema"（作为 response_format 发送）或 "prompt"（只靠 prompt 约束）。
+    """
+    scanner = JsonStreamScanner()
+    request = {"max_tokens": max_tokens, "stop_when": scanner.feed,
+               "response_format": structured_response_format(None if structured == "prompt" else structured)}
+    return request, scanner
+
+def ask_functional_groups(datas, lang='zh', *, structured="json_object", max_tokens=DEFAULT_STRUCTURED_MAX_TOKENS,
+                          budget=DEFAULT_PROMPT_BUDGET, **ask_kwargs):
+    """
+    同步的结构化 Step 2：返回 (解析结果 dict 或 None, 原始回答)。
+    ask_kwargs 传给 ask_AI（api_key、base_url、model、on_delta 等）。
+    """
+    request, _ = structured_request(structured, max_tokens)
+    prompt, _ = gen_prompt_1_structured(datas, lang, budget or float("inf"))
+    text = ask_AI(prompt, **request, **ask_kwargs)
+    try:
+        return parse_functional_groups(text), text
+    except ValueError:
+        return None, text
+
+async def ask_structure_consensus_async(prompt, data=None, *, n=5, quorum=None, endpoints=(1,),
+                                        api_config_path="API.json", semaphores=None, thinking="enabled"):
+    """
+    Step 3 自洽采样：同一 prompt 并发请求 n 次，按 endpoints 轮流分配到各组端点，
+    提取每次回答中的分子式 / 结构简式投票，并结合原始数据 data 的吻合度排名（见 consensusAI）。
+    某一分子式得票达到 quorum（默认过半）即取消其余请求。
+    各次采样必须是独立回答，因此不读写回复缓存。
+    """
+    config = load_api_config(api_config_path)
+
+    async def attempt(i):
+        return await _ask_endpoint_async(prompt, config, endpoints[i % len(endpoints)],
+                                         api_config_path=api_config_path, semaphores=semaphores,
+                                         thinking=thinking, use_cache=False)
+
+    return await self_consistency(attempt, n, quorum=quorum, data=data)
+
+def ask_structure_consensus(prompt, data=None, **kwargs):
+    """ask_structure_consensus_async 的同步入口，参数相同；与 ask_AI_failover 一样在后台事件循环中运行。"""
+    return run_in_client_loop(ask_structure_consensus_async(prompt, data, **kwargs))
+
+def enumerate_sample(data, max_workers=None):
+    """本地结构枚举（在工作线程中调用，计时记入当前运行）；数据不支持枚举时返回 None。"""
+    metrics = current_metrics()
+    with metrics.timer("enumerate"):
+        try:
+            enumeration = shortlist_structures(data, max_workers=max_workers)
+        except ValueError:
+            enumeration = None
+    if enumeration is not None:
+        metrics.incr("enumerate_candidates", enumeration["count"])
+    return enumeration
+
+def accept_enumeration(enumeration, data, max_workers=None):
+    """
+    本地枚举的唯一结构能否不经 AI 直接作为答案：分子式须由输入明确给出（由质谱推测的分子式可能错，
+    搜索也只在自身的剪枝范围内完整），且与输入谱图核验的结论为吻合。可以时返回核验结果，否则返回 None。
+    """
+    if not enumeration or not enumeration["unique"] or not enumeration["formula_given"]:
+        return None
+    verification = verify_sample(format_unique(enumeration), data, max_workers)
+    return verification if verification["verdict"] == "consistent" else None
+
+def library_sample(data, api_config_path="API.json"):
+    """参考库检索（选项取自 API 配置，计时与结果记入当前运行）；没有参考库时返回 None。"""
+    metrics = current_metrics()
+    with metrics.timer("library"):
+        found = search_library(data, library_options(load_api_config(api_config_path)))
+    if found is not None:
+        metrics.incr("library", outcome="match" if found["match"] else "hit" if found["hits"] else "miss")
+    return found
+
+def verify_sample(structure, data, max_workers=None):
+    """核验 Step 3 的回答（在工作线程中调用，计时与结论记入当前运行）。"""
+    metrics = current_metrics()
+    with metrics.timer("verify"):
+        # 批量运行时各样品同时提交，单个候选也交给进程池
+        verification = verify_answer(structure, data, max_workers=max_workers, min_parallel=1)
+    metrics.incr("verify", verdict=verification["verdict"] or "none")
+    return verification
+
+async def run_sample_async(sample_id, data, *, api_config_path="API.json", lang='zh', semaphores=None,
+                           step2_endpoint=2, step3_endpoint=1, thinking="enabled", use_cache=True,
+                           resume=None, on_step=None, step3_samples=1, quorum=None, step3_endpoints=None,
+                           prompt_budget=DEFAULT_PROMPT_BUDGET, structured=None,
+                           structured_max_tokens=DEFAULT_STRUCTURED_MAX_TOKENS, enumerate_candidates=True,
+                           enumerate_workers=None, verify=True, verify_workers=None, library=True):
+    """
+    对单个样品依次执行 gen_datas、Step 2 (官能团) 与 Step 3 (分子式和结构)，返回结果 dict：
+    {"id", "datas", "functional_groups", "structure", "error"}。
+    端点分配与 GUI 相同：Step 2 默认用第 2 组配置，Step 3 用第 1 组。
+    semaphores: {base_url: asyncio.Semaphore}，只在请求 AI 时占用对应端点的名额。
+    resume: 已完成步骤的结果 {"functional_groups": ..., "structure": ...}，其中的步骤不再请求 AI。
+    on_step: 可选回调 on_step(sample_id, step, text)，每个 AI 步骤新完成时调用（用于写检查点）。
+    step3_samples > 1 时 Step 3 改用自洽采样（见 ask_structure_consensus_async），
+    结果中增加 "consensus" 排名；step3_endpoints 为采样轮流使用的端点组，默认只用 step3_endpoint。
+    prompt_budget: 按该 token 预算构建紧凑 prompt（见 promptAI），结果中 "prompt_tokens" 为两步的估计 token 数；
+    为 None 或 0 时使用原始的完整 prompt。
+    structured: 结构化 Step 2（见 structured_request）。回答按 JSON Schema 解析为 "groups"，
+    JSON 对象一闭合就关闭流，且受 structured_max_tokens 限制；Step 3 只收到解析出的基团与化学式。
+    解析失败时退回把原回答交给 Step 3。
+    enumerate_candidates: 与 Step 2 并行地在本地枚举候选结构（见 enumerateStructure.shortlist_structures，
+    enumerate_workers 为其进程池大小），结果记入 "enumeration"。答案唯一、分子式由输入给出且核验吻合时
+    （见 accept_enumeration）直接作为 Step 3 结果，不再请求 AI（进行中的 Step 2 被取消）；
+    否则只剩少数候选时作为短名单加入 Step 3 的 prompt。
+    verify: Step 3 完成后把回答中的候选与输入谱图逐项比对（见 verifyStructure.verify_answer，
+    verify_workers 为进程池大小），结果记入 "verification"。本地枚举得到的唯一答案不再核验。
+    library: 在请求 AI 之前检索参考谱图库（见 referenceLibrary.search_library），结果记入 "library"。
+    高置信度命中直接作为 Step 3 结果，不再请求 AI；其余达到报告阈值的命中加入 Step 3 的 prompt。
+    """
+    result = {"id": sample_id, "datas": None, "functional_groups": None, "structure": None, "error": None}
+    config = load_api_config(api_config_path)
+    resume = resume or {}
+    started = time.perf_counter()
+
+    async def call(step, prompt, index, **request):
+        if resume.get(step):
+            return resume[step]
+        text = await _ask_endpoint_async(prompt, config, index, api_config_path=api_config_path,
+                                         semaphores=semaphores, thinking=thinking, use_cache=use_cache, **request)
+        if text and on_step is not None:
+            on_step(sample_id, step, text)
+        return text
+
+    try:
+        # 谱图处理是 CPU 密集的同步代码，放到线程里避免阻塞事件循环
+        datas = await asyncio.to_thread(gen_datas, data, lang)
+        result["datas"] = datas
+
+        request = {}
+        if structured:
+            request, _ = structured_request(structured, structured_max_tokens)
+            prompt_1, report_1 = gen_prompt_1_structured(datas, lang, prompt_budget or float("inf"))
+            result["prompt_tokens"] = {"functional_groups": report_1["tokens"]}
+        elif prompt_budget:
+            prompt_1, report_1 = gen_prompt_1_budget(datas, lang, prompt_budget)
+            result["prompt_tokens"] = {"functional_groups": report_1["tokens"]}
+        else:
+            prompt_1 = gen_prompt_1(datas, lang=lang)
+            result["prompt_tokens"] = {}
+        shortlist = []
+        if library and not resume.get("structure"):
+            # 检索只需几毫秒，先于 Step 2 进行，命中时一个请求都不发
+            found = await asyncio.to_thread(library_sample, data, api_config_path)
+            result["library"] = found
+            if found and found["match"]:
+                result["structure"] = format_library_match(found, lang)
+                if on_step is not None:
+                    on_step(sample_id, "structure", result["structure"])
+                current_metrics().observe("sample", time.perf_counter() - started, status="library")
+                return result
+            shortlist = format_library_hits(found, lang)
+        step2 = asyncio.ensure_future(call("functional_groups", prompt_1, step2_endpoint, **request))
+        if enumerate_candidates and not resume.get("structure"):
+            try:
+                enumeration = await asyncio.to_thread(enumerate_sample, data, enumerate_workers)
+            except BaseException:
+                step2.cancel()
+                raise
+            result["enumeration"] = enumeration
+            verification = None
+            if enumeration and enumeration["unique"]:
+                try:
+                    verification = await asyncio.to_thread(accept_enumeration, enumeration, data, verify_workers)
+                except BaseException:
+                    step2.cancel()
+                    raise
+            if verification is not None:
+                step2.cancel()
+                result["structure"] = format_unique(enumeration, lang)
+                result["verification"] = verification
+                if on_step is not None:
+                    on_step(sample_id, "structure", result["structure"])
+                current_metrics().observe("sample", time.perf_counter() - started, status="enumerated")
+                return result
+            shortlist = shortlist + format_shortlist(enumeration, lang)
+        fg = await step2
+        result["functional_groups"] = fg
+
+        if structured:
+            try:
+                result["groups"] = parse_functional_groups(fg)
+                fg = format_functional_groups(result["groups"], lang)
+            except ValueError:
+                result["groups"] = None
+
+        if prompt_budget:
+            prompt_2, report_2 = gen_prompt_2_budget(fg, datas, lang, prompt_budget, shortlist=shortlist)
+            result["prompt_tokens"]["structure"] = report_2["tokens"]
+        else:
+            findings = ((fg or "") + tr("text_evidence_chain", lang) + "\n".join(datas) + "\n"
+                        + "".join(line + "\n" for line in shortlist))
+            prompt_2 = gen_prompt_2(findings.splitlines(), lang=lang)
+        if step3_samples <= 1:
+            result["structure"] = await call("structure", prompt_2, step3_endpoint)
+        elif resume.get("structure"):
+            result["structure"] = resume["structure"]
+            result["consensus"] = resume.get("consensus")
+        else:
+            consensus = await ask_structure_consensus_async(
+                prompt_2, data, n=step3_samples, quorum=quorum, endpoints=step3_endpoints or (step3_endpoint,),
+                api_config_path=api_config_path, semaphores=semaphores, thinking=thinking,
+            )
+            result["structure"] = consensus["answer"]
+            result["consensus"] = consensus["ranking"]
+            if consensus["answer"] and on_step is not None:
+                on_step(sample_id, "consensus", consensus["ranking"])
+                on_step(sample_id, "structure", consensus["answer"])
+        if verify and result["structure"]:
+            result["verification"] = await asyncio.to_thread(verify_sample, result["structure"], data,
+                                                             verify_workers)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    current_metrics().observe("sample", time.perf_counter() - started, status="error" if result["error"] else "ok")
+    return result
+
+def endpoint_concurrency(config, endpoints=(1, 2), concurrency=None):
+    """
+    每个不同 base_url 的并发请求上限 {base_url: n}。
+    concurrency: None 时取配置中的 max_concurrency；可为 int，或 {base_url: int} 分别指定。
+    同一 base_url 被两个步骤共用时共享同一个名额池。
+    """
+    default = pool_options(config)["max_concurrency"]
+    sizes = {}
+    for index in endpoints:
+        base_url = endpoint_config(config, index)[1]
+        if not base_url or base_url in sizes:
+            continue
+        if isinstance(concurrency, dict):
+            size = concurrency.get(base_url, default)
+        else:
+            size = concurrency or default
+        assert size >= 1, "并发数必须 >= 1"
+        sizes[base_url] = size
+    return sizes
+
+def endpoint_semaphores(sizes):
+    """按 endpoint_concurrency 的结果为每个端点建一个信号量（须在事件循环中调用）。"""
+    return {base_url: asyncio.Semaphore(size) for base_url, size in sizes.items()}
+
+async def run_samples_async(samples, *, api_config_path="API.json", lang='zh', concurrency=None, on_result=None,
+                            step2_endpoint=2, step3_endpoint=1, thinking="enabled", use_cache=True,
+                            resume=None, on_step=None, max_pending=None, collect=True,
+                            step3_samples=1, quorum=None, step3_endpoints=None,
+                            prompt_budget=DEFAULT_PROMPT_BUDGET, structured=None,
+                            structured_max_tokens=DEFAULT_STRUCTURED_MAX_TOKENS, enumerate_candidates=True,
+                            enumerate_workers=None, verify=True, verify_workers=None, library=True):
+    """
+    并发处理多个样品。samples 为 (sample_id, data) 的可迭代对象，按需逐个读取。
+    每个端点的并发请求数由信号量限制（见 endpoint_concurrency），
+    不同样品的 Step 2 与 Step 3 可以在两个端点上同时进行。
+    on_result: 可选回调 on_result(result)，每个样品完成时调用一次（完成顺序）。
+    resume: {str(sample_id): 已完成步骤 dict}，见 run_sample_async；on_step 同 run_sample_async。
+    max_pending: 同时在处理中的样品数上限，默认为各端点名额之和的 2 倍，避免一次性载入全部样品。
+    collect: False 时不保留结果（大批量只依赖 on_result 时使用），返回空列表。
+    step3_samples / quorum / step3_endpoints / prompt_budget / structured / structured_max_tokens /
+    enumerate_candidates / enumerate_workers / verify / verify_workers / library: 见 run_sample_async。
+    返回按输入顺序排列的结果列表。
+    """
+    config = load_api_config(api_config_path)
+    sizes = endpoint_concurrency(config, (step2_endpoint, step3_endpoint) + tuple(step3_endpoints or ()), concurrency)
+    semaphores = endpoint_semaphores(sizes)
+    if max_pending is None:
+        max_pending = 2 * max(1, sum(sizes.values()))
+    resume = resume or {}
+    results = []
+
+    async def one(position, sample_id, data):
+        result = await run_sample_async(sample_id, data, api_config_path=api_config_path, lang=lang,
+                                        semaphores=semaphores, step2_endpoint=step2_endpoint,
+                                        step3_endpoint=step3_endpoint, thinking=thinking, use_cache=use_cache,
+                                        resume=resume.get(str(sample_id)), on_step=on_step,
+                                        step3_samples=step3_samples, quorum=quorum, step3_endpoints=step3_endpoints,
+                                        prompt_budget=prompt_budget, structured=structured,
+                                        structured_max_tokens=structured_max_tokens,
+                                        enumerate_candidates=enumerate_candidates,
+                                        enumerate_workers=enumerate_workers,
+                                        verify=verify, verify_workers=verify_workers, library=library)
+        if on_result is not None:
+            on_result(result)
+        if collect:
+            results[position] = result
+
+    pending = set()
+    try:
+        for position, (sample_id, data) in enumerate(samples):
+            if len(pending) >= max_pending:
+                _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            if collect:
+                results.append(None)
+            pending.add(asyncio.create_task(one(position, sample_id, data)))
+        if pending:
+            await asyncio.gather(*pending)
+    finally:
+        for task in pending:
+            task.cancel()
+        await close_async_clients()
+    return results
+
+def run_samples(samples, **kwargs):
+    """run_samples_async 的同步入口，参数相同。"""
+    return asyncio.run(run_samples_async(samples, **kwargs))
+
+def iter_samples(path):
+    """
+    逐个读取批量样品，产出 (sample_id, data)：
+    - 目录：其中每个 .json 文件为一个样品，按文件名排序，sample_id 为文件名（不含扩展名）；
+    - .jsonl 文件：每行一个样品，sample_id 取 "id" 字段（缺省为行号），数据取 "data" 字段，缺省为除 "id" 外的其余键；
+    - 其它文件：按单个 JSON 样品读取。
+    """
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            if name.lower().endswith(".json"):
+                yield os.path.splitext(name)[0], get_data_from_json(os.path.join(path, name))
+    elif path.lower().endswith(".jsonl"):
+        with open(path, "r", encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line)
+                sample_id = record.get("id", line_no)
+                data = record["data"] if "data" in record else {k: v for k, v in record.items() if k != "id"}
+                yield sample_id, data
+    else:
+        yield os.path.splitext(os.path.basename(path))[0], get_data_from_json(path)
+
+def _read_jsonl(path):
+    """读取 JSONL，跳过空行与中断写入造成的残缺末行。"""
+    if not path or not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+def load_checkpoint(checkpoint_path, output_path=None):
+    """
+    读取检查点与已有输出，返回 (finished, resume)：
+    finished 为输出文件中已无错误完成的样品 id 集合（本次跳过）；
+    resume 为 {sample_id: {step: text}}，记录中断前已完成的 AI 步骤，续跑时不再重复请求。
+    id 统一按 str 比较，避免 JSON 往返后 1 与 "1" 不一致。
+    """
+    finished = {str(record["id"]) for record in _read_jsonl(output_path)
+                if not record.get("error") and record.get("structure")}
+    resume = {}
+    for record in _read_jsonl(checkpoint_path):
+        resume.setdefault(str(record["id"]), {})[record["step"]] = record["text"]
+    return finished, resume
+
+class JsonlWriter:
+    """追加写 JSONL，每条立即 flush，进程中断时已写入的记录不会丢失。"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8") if path else None
+
+    def write(self, record):
+        if self._file is None:
+            return
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+def run_batch(input_path, output_path, *, checkpoint_path=None, api_config_path="API.json", lang='zh',
+              concurrency=None, thinking="enabled", use_cache=True, step3_samples=1, quorum=None,
+              step3_endpoints=None, prompt_budget=DEFAULT_PROMPT_BUDGET, structured=None,
+              structured_max_tokens=DEFAULT_STRUCTURED_MAX_TOKENS, metrics_path=None, prometheus_path=None,
+              openmetrics=False, enumerate_candidates=True, enumerate_workers=None, verify=True,
+              verify_workers=None, library=True):
+    """
+    命令行批量模式：读取 input_path 中的全部样品，并发执行三步流程，
+    每完成一个样品就向 output_path 追加一行结果；每完成一个 AI 步骤就向检查点追加一行。
+    重新运行同一命令时跳过已完成的样品，并复用检查点中已付费得到的 Step 2 / Step 3 结果。
+    metrics_path / prometheus_path: 结束（包括中断）时把本次运行的指标写成 JSON / Prometheus 文本，
+    openmetrics=True 时后者按 OpenMetrics 格式（见 metricsAI）。
+    enumerate_candidates / enumerate_workers / verify / verify_workers / library: 见 run_sample_async。
+    返回 (完成数, 失败数, 跳过数)。
+    """
+    checkpoint_path = checkpoint_path or output_path + ".ckpt"
+    # asyncio.run 与 to_thread 会复制当前上下文，各样品的计时都记入这一次运行
+    metrics = start_run(os.path.basename(input_path))
+    finished, resume = load_checkpoint(checkpoint_path, output_path)
+    counts = {"done": 0, "failed": 0, "skipped": 0}
+
+    def samples():
+        for sample_id, data in iter_samples(input_path):
+            if str(sample_id) in finished:
+                counts["skipped"] += 1
+                continue
+            yield sample_id, data
+
+    output = JsonlWriter(output_path)
+    checkpoint = JsonlWriter(checkpoint_path)
+
+    def on_step(sample_id, step, text):
+        checkpoint.write({"id": sample_id, "step": step, "text": text})
+
+    def on_result(result):
+        output.write(result)
+        counts["failed" if result["error"] else "done"] += 1
+        status = result["error"] or "ok"
+        print(tr("batch_progress", lang, counts["done"] + counts["failed"], result["id"], status),
+              file=sys.stderr, flush=True)
+
+    try:
+        asyncio.run(run_samples_async(
+            samples(), api_config_path=api_config_path, lang=lang, concurrency=concurrency,
+            on_result=on_result, thinking=thinking, use_cache=use_cache,
+            resume=resume, on_step=on_step, collect=False,
+            step3_samples=step3_samples, quorum=quorum, step3_endpoints=step3_endpoints,
+            prompt_budget=prompt_budget, structured=structured, structured_max_tokens=structured_max_tokens,
+            enumerate_candidates=enumerate_candidates, enumerate_workers=enumerate_workers,
+            verify=verify, verify_workers=verify_workers, library=library,
+        ))
+    finally:
+        output.close()
+        checkpoint.close()
+        write_metrics(metrics, metrics_path, prometheus_path, openmetrics)
+    return counts["done"], counts["failed"], counts["skipped"]
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Spectra -> functional groups -> structure (batch mode)")
+    parser.add_argument("input", nargs="?", default="input_template.json",
+                        help="单个 JSON 样品、样品目录或 JSONL 文件")
+    parser.add_argument("-o", "--output", help="结果 JSONL 路径；省略时只处理单个样品并打印证据链")
+    parser.add_argument("--checkpoint", help="检查点路径，默认为 <output>.ckpt")
+    parser.add_argument("--api-config", default="API.json")
+    parser.add_argument("--lang", default="zh", choices=["zh", "en"])
+    parser.add_argument("-j", "--concurrency", type=int, help="每个端点的并发请求数，默认取 API.json 的 max_concurrency")
+    parser.add_argument("--no-thinking", action="store_true")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("-n", "--samples", type=int, default=1, help="Step 3 自洽采样次数，>1 时并发请求并投票")
+    parser.add_argument("--quorum", type=int, help="提前结束所需的同一分子式票数，默认过半")
+    parser.add_argument("--spread", action="store_true", help="Step 3 采样轮流使用两组端点")
+    parser.add_argument("--budget", type=int, default=DEFAULT_PROMPT_BUDGET,
+                        help="紧凑 prompt 的 token 预算，0 表示使用完整的原始 prompt")
+    parser.add_argument("--structured", nargs="?", const="json_object", choices=["json_object", "json_schema", "prompt"],
+                        help="Step 2 按 JSON Schema 输出并在对象闭合时提前结束流")
+    parser.add_argument("--structured-max-tokens", type=int, default=DEFAULT_STRUCTURED_MAX_TOKENS)
+    parser.add_argument("--metrics", help="把本次运行的计时与计数写入该 JSON 文件")
+    parser.add_argument("--prometheus", help="把本次运行的指标写成 Prometheus 文本格式")
+    parser.add_argument("--openmetrics", action="store_true", help="--prometheus 输出使用 OpenMetrics 格式")
+    parser.add_argument("--no-enumerate", action="store_true", help="不在本地枚举候选结构（全部交给 AI）")
+    parser.add_argument("--enumerate-workers", type=int, help="本地结构枚举的进程数，默认为 CPU 核数")
+    parser.add_argument("--no-verify", action="store_true", help="不把 Step 3 的回答与输入谱图比对核验")
+    parser.add_argument("--verify-workers", type=int, help="结构核验的进程数，默认为 CPU 核数")
+    parser.add_argument("--no-library", action="store_true", help="不检索参考谱图库")
+    args = parser.parse_args(argv)
+
+    if not args.output:
+        # 兼容原先用法：只生成并打印证据链
+        metrics = start_run(os.path.basename(args.input))
+        for _, data in iter_samples(args.input):
+            print("\n".join(gen_datas(data, lang=args.lang)))
+        write_metrics(metrics, args.metrics, args.prometheus, args.openmetrics)
+        return 0
+
+    done, failed, skipped = run_batch(
+        args.input, args.output, checkpoint_path=args.checkpoint, api_config_path=args.api_config,
+        lang=args.lang, concurrency=args.concurrency, thinking="disabled" if args.no_thinking else "enabled",
+        use_cache=not args.no_cache, step3_samples=args.samples, quorum=args.quorum,
+        step3_endpoints=(1, 2) if args.spread else None, prompt_budget=args.budget,
+        structured=args.structured, structured_max_tokens=args.structured_max_tokens,
+        metrics_path=args.metrics, prometheus_path=args.prometheus, openmetrics=args.openmetrics,
+        enumerate_candidates=not args.no_enumerate, enumerate_workers=args.enumerate_workers,
+        verify=not args.no_verify, verify_workers=args.verify_workers, library=not args.no_library,
+    )
+    print(tr("batch_summary", args.lang, done, failed, skipped), file=sys.stderr)
+    return 1 if failed else 0
+
 """ 
     data = get_data_from_json(file_path)
     datas = gen_datas(data)
@@ -172,15 +928,4 @@ def gen_datas(data, lang='zh'):
 """
 
 if __name__ == "__main__":
-    file_path = "input_template.json"  # 替换为实际 JSON 文件路径
-    data = get_data_from_json(file_path)
-    datas = gen_datas(data)
-    print("=== 证据链 ===")
-    findings_chain = "\n".join(datas)
-
-    # promt_1 = gen_prompt_1(datas)
-    # print("=== 基团推测 ===")
-    # fg_result = ask_AI(promt_1)
-    
-    
-
+    sys.exit(main())
@@ -3,11 +3,18 @@ import os
 import sys
 import threading
 import queue
+import multiprocessing
 import time
 import tkinter as tk
 from tkinter import filedialog, messagebox, scrolledtext, ttk
 
-from guess import get_data_from_json, gen_datas, gen_prompt_1, gen_prompt_2, ask_AI
+from guess import get_data_from_json, gen_datas, gen_prompt_1, gen_prompt_2, ask_AI_failover, enumerate_sample, \
+    verify_sample, library_sample, accept_enumeration
+from enumerateStructure import format_shortlist, format_unique
+from verifyStructure import format_verification
+from referenceLibrary import format_library_hits, format_library_match
+from promptAI import gen_prompt_1_budget, gen_prompt_2_budget, format_report
+from metricsAI import start_run, current_metrics
 
 
 class RedirectStdout:
@@ -64,7 +71,11 @@ class App(tk.Tk):
         # 缓存中间结果，方便逐步分析
         self.cached_datas = None
         self.cached_fg_result = None
+        self.cached_enumeration = None
+        self.cached_library = None
         self._last_json_content = None
+        # 最近一次运行的计时与计数（metricsAI.RunMetrics）
+        self.last_metrics = None
 
         self._build_widgets()
         # 启动时尝试自动加载默认配置
@@ -354,9 +365,11 @@ class App(tk.Tk):
         # 重置缓存
         self.cached_datas = None
         self.cached_fg_result = None
+        self.cached_enumeration = None
+        self.cached_library = None
         self._last_json_content = json_content
 
-        threading.Thread(target=self._run_pipeline, args=(json_content,), daemon=True).start()
+        threading.Thread(target=self._run_measured, args=(self._run_pipeline, json_content), daemon=True).start()
 
     def start_step1(self):
         json_content = self.text_json.get("1.0", tk.END).strip()
@@ -370,7 +383,7 @@ class App(tk.Tk):
 
         # 线程执行 step1
         self._last_json_content = json_content
-        threading.Thread(target=self._run_step1, args=(json_content,), daemon=True).start()
+        threading.Thread(target=self._run_measured, args=(self._run_step1, json_content), daemon=True).start()
 
     def start_step2(self):
         json_content = self.text_json.get("1.0", tk.END).strip()
@@ -385,7 +398,8 @@ class App(tk.Tk):
         if json_content:
             self._last_json_content = json_content
 
-        threading.Thread(target=self._run_step2, args=(self._last_json_content,), daemon=True).start()
+        threading.Thread(target=self._run_measured, args=(self._run_step2, self._last_json_content),
+                         daemon=True).start()
 
     def start_step3(self):
         json_content = self.text_json.get("1.0", tk.END).strip()
@@ -400,12 +414,28 @@ class App(tk.Tk):
         if json_content:
             self._last_json_content = json_content
 
-        threading.Thread(target=self._run_step3, args=(self._last_json_content,), daemon=True).start()
+        threading.Thread(target=self._run_measured, args=(self._run_step3, self._last_json_content),
+                         daemon=True).start()
+
+    def _run_measured(self, target, json_content: str):
+        """在工作线程中执行 target 并记录本次运行的指标，结束后在控制台末尾附上耗时摘要。"""
+        metrics = start_run(target.__name__.lstrip("_"))
+        try:
+            target(json_content)
+        finally:
+            self.last_metrics = metrics
+            lines = metrics.summary_lines()
+            if lines:
+                self._append_text(self.console, "\n" + self.tr("metrics_title") + "\n" + "\n".join(lines) + "\n",
+                                  tags="thinking")
 
     def _run_pipeline(self, json_content: str):
         # 顺序执行三步，利用已有的 step helpers
         try:
             self._run_step1(json_content)
+            # 参考库高置信度命中或本地枚举只剩一个结构时不再请求 AI
+            if self._show_library(json_content) or self._show_unique(json_content):
+                return
             # small pause to ensure UI updated before continuing
             time.sleep(0.1)
             self._run_step2(json_content)
@@ -420,6 +450,9 @@ class App(tk.Tk):
         full_text_parts = []
         buffer = []
         last_update_time = [time.time()]
+        # 第一个未显示增量的到达时间，用于统计缓冲造成的显示延迟
+        first_buffered = [None]
+        metrics = current_metrics()
 
         def flush_buffer():
             if not buffer:
@@ -440,43 +473,45 @@ class App(tk.Tk):
             for text, tags in merged:
                 self._append_text(target_widget, text, tags=tags)
                 self._append_text(self.console, text, tags=tags)
-            
+            # 缓冲延迟在此记录；界面队列延迟由主线程处理到该标记时记录
+            now = time.perf_counter()
+            metrics.observe("ui_flush_lag", now - first_buffered[0])
+            self.ui_queue.put((self._observe_queue_lag, metrics, now))
+
             buffer.clear()
+            first_buffered[0] = None
             last_update_time[0] = time.time()
 
         def on_delta(text: str):
             full_text_parts.append(text)
+            if first_buffered[0] is None:
+                first_buffered[0] = time.perf_counter()
             buffer.append((text, None))
             if time.time() - last_update_time[0] >= 2.0:
                 flush_buffer()
 
         def on_thinking(text: str):
+            if first_buffered[0] is None:
+                first_buffered[0] = time.perf_counter()
             buffer.append((text, "thinking"))
             if time.time() - last_update_time[0] >= 2.0:
                 flush_buffer()
 
+        key_2 = self.api_key_2.get().strip() or self.api_key_1.get().strip()
+        endpoint_1 = (self.api_key_1.get().strip() or None, self.base_url_1.get().strip() or None,
+                      self.model_1.get().strip() or None)
+        endpoint_2 = (key_2 or None, self.base_url_2.get().strip() or None, self.model_2.get().strip() or None)
+        # 本步骤的端点优先，另一组作为对冲与故障转移的备用端点
+        endpoints = [endpoint_1, endpoint_2] if type == 1 else [endpoint_2, endpoint_1]
+
         try:
-            if type == 1:
-                result = ask_AI(
-                    prompt,
-                    api_key=self.api_key_1.get().strip() or None,
-                    base_url=self.base_url_1.get().strip() or None,
-                    model=self.model_1.get().strip() or None,
-                    on_delta=on_delta,
-                    on_thinking=on_thinking,
-                )
-            else:
-                key_2 = self.api_key_2.get().strip()
-                if not key_2:
-                    key_2 = self.api_key_1.get().strip()
-                result = ask_AI(
-                    prompt,
-                    api_key=key_2 or None,
-                    base_url=self.base_url_2.get().strip() or None,
-                    model=self.model_2.get().strip() or None,
-                    on_delta=on_delta,
-                    on_thinking=on_thinking,
-                )
+            result = ask_AI_failover(
+                prompt,
+                endpoints,
+                api_config_path=self.default_config_path,
+                on_delta=on_delta,
+                on_thinking=on_thinking,
+            )
         except Exception as e:
             messagebox.showerror(self.tr("title_error"), self.tr("msg_ai_fail", e))
             return ""
@@ -519,10 +554,12 @@ class App(tk.Tk):
 
         self.cached_datas = datas
 
-        # 调用 AI 推测官能团
+        # 调用 AI 推测官能团；证据链按 token 预算压缩，发送前先报告估计长度
+        prompt, report = gen_prompt_1_budget(datas, lang=self.lang)
+        self._append_text(self.console, format_report(report, gen_prompt_1(datas, lang=self.lang), self.lang))
         self._append_text(self.text_fg, self.tr("status_calling_ai_fg"))
         fg_result = self._call_ai_stream(
-            gen_prompt_1(datas, lang=self.lang),
+            prompt,
             target_widget=self.text_fg,
             type=0
         )
@@ -543,6 +580,11 @@ class App(tk.Tk):
                 messagebox.showerror(self.tr("title_error"), self.tr("msg_gen_data_fail", e))
                 return
 
+        if self._show_library(json_content) or self._show_unique(json_content):
+            return
+        shortlist = (format_library_hits(self._search_library(json_content), self.lang)
+                     + format_shortlist(self._enumerate(json_content), self.lang))
+
         # 确保有 fg_result
         fg = self.cached_fg_result
         if not fg:
@@ -550,13 +592,59 @@ class App(tk.Tk):
             fg = self._run_step2(json_content)
 
         findings_chain = "\n".join(datas)
-        findings = (fg or "") + self.tr("text_evidence_chain") + findings_chain + "\n"
+        findings = (fg or "") + self.tr("text_evidence_chain") + findings_chain + "\n" + "".join(
+            line + "\n" for line in shortlist)
+        # Step 2 回答与证据链去重后按预算压缩；本地枚举的候选不多时作为短名单一并给出
+        prompt, report = gen_prompt_2_budget(fg, datas, lang=self.lang, shortlist=shortlist)
+        self._append_text(self.console, format_report(report, gen_prompt_2(findings.splitlines(), lang=self.lang), self.lang))
         self._append_text(self.text_struct, self.tr("status_calling_ai_struct"))
-        self._call_ai_stream(
-            gen_prompt_2(findings.splitlines(), lang=self.lang),
+        structure = self._call_ai_stream(
+            prompt,
             target_widget=self.text_struct,
             type=1
         )
+        if structure:
+            # 把回答中的候选与输入谱图逐项比对，结论附在结构框末尾
+            verification = verify_sample(structure, json.loads(json_content))
+            self._append_text(self.text_struct, "\n\n" + format_verification(verification, self.lang) + "\n")
+
+    def _enumerate(self, json_content: str):
+        """本地结构枚举（见 enumerateStructure），按输入内容缓存；数据不支持枚举时返回 None。"""
+        if self.cached_enumeration is None or self.cached_enumeration[0] != json_content:
+            try:
+                enumeration = enumerate_sample(json.loads(json_content))
+            except ValueError:
+                enumeration = None
+            self.cached_enumeration = (json_content, enumeration)
+        return self.cached_enumeration[1]
+
+    def _search_library(self, json_content: str):
+        """参考库检索（见 referenceLibrary），按输入内容缓存；没有参考库时返回 None。"""
+        if self.cached_library is None or self.cached_library[0] != json_content:
+            found = library_sample(json.loads(json_content), api_config_path=self.default_config_path)
+            self.cached_library = (json_content, found)
+            lines = format_library_hits(found, self.lang)
+            if lines:
+                self._append_text(self.console, "\n".join(lines) + "\n")
+        return self.cached_library[1]
+
+    def _show_library(self, json_content: str) -> bool:
+        """参考库有高置信度命中时直接显示在结构框中并返回 True。"""
+        found = self._search_library(json_content)
+        if not found or not found["match"]:
+            return False
+        self._set_text(self.text_struct, format_library_match(found, self.lang) + "\n")
+        return True
+
+    def _show_unique(self, json_content: str) -> bool:
+        """本地枚举只得到一个结构、分子式由输入给出且核验吻合时直接显示在结构框中并返回 True。"""
+        enumeration = self._enumerate(json_content)
+        verification = accept_enumeration(enumeration, json.loads(json_content))
+        if verification is None:
+            return False
+        self._set_text(self.text_struct, format_unique(enumeration, self.lang) + "\n\n"
+                       + format_verification(verification, self.lang) + "\n")
+        return True
 
     def _process_ui_queue(self):
         try:
@@ -570,6 +658,9 @@ class App(tk.Tk):
         finally:
             self.after(50, self._process_ui_queue)
 
+    def _observe_queue_lag(self, metrics, queued: float):
+        metrics.observe("ui_queue_lag", time.perf_counter() - queued)
+
     def _set_text(self, widget: scrolledtext.ScrolledText, content: str):
         self.ui_queue.put((self._do_set_text, widget, content))
 
@@ -592,4 +683,6 @@ def main():
 
 
 if __name__ == "__main__":
+    # 本地结构枚举使用进程池，打包为可执行文件时需要
+    multiprocessing.freeze_support()
     main()
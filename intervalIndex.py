@@ -0,0 +1,53 @@
+import numpy as np
+
+
+class IntervalIndex:
+    """
+    (min, max, ...) 区间表的有序端点索引，供 IR 相关表与 NMR 位移表共用。
+
+    把所有区间端点排序后，数轴被切成"端点本身"和"相邻端点之间的开区间"两类基本段，
+    预先计算每段被哪些条目覆盖 (CSR 形式)。查询时一次 searchsorted 即可批量定位，
+    与表的大小无关。区间为闭区间 [min, max]，条目的其余字段原样保存在 table 中。
+    """
+
+    def __init__(self, table):
+        self.table = list(table)
+        lo = np.array([e[0] for e in self.table], dtype=np.float64)
+        hi = np.array([e[1] for e in self.table], dtype=np.float64)
+        self.breaks = np.unique(np.concatenate((lo, hi)))
+
+        # 基本段编号: 2i 为 breaks[i] 之前的开区间, 2i+1 为端点 breaks[i] 本身
+        n = self.breaks.size
+        reps = np.empty(2 * n + 1)
+        reps[1::2] = self.breaks
+        reps[0] = self.breaks[0] - 1.0
+        reps[2:-1:2] = (self.breaks[:-1] + self.breaks[1:]) / 2.0
+        reps[-1] = self.breaks[-1] + 1.0
+
+        cover = (lo[None, :] <= reps[:, None]) & (reps[:, None] <= hi[None, :])
+        segment, entry = np.nonzero(cover)
+        self.indices = entry
+        self.offsets = np.concatenate(([0], np.cumsum(np.bincount(segment, minlength=reps.size))))
+
+    def _segments(self, values):
+        i = np.searchsorted(self.breaks, values, side="left")
+        on_break = (i < self.breaks.size) & (self.breaks[np.minimum(i, self.breaks.size - 1)] == values)
+        return 2 * i + on_break
+
+    def query(self, values):
+        """
+        批量查询。返回 (offsets, indices)：第 k 个值命中的条目下标为
+        indices[offsets[k]:offsets[k+1]]，按表中顺序排列。
+        """
+        values = np.asarray(values, dtype=np.float64)
+        seg = self._segments(values)
+        starts = self.offsets[seg]
+        counts = self.offsets[seg + 1] - starts
+        offsets = np.concatenate(([0], np.cumsum(counts)))
+        within = np.arange(offsets[-1]) - np.repeat(offsets[:-1], counts)
+        return offsets, self.indices[np.repeat(starts, counts) + within]
+
+    def match(self, value):
+        """单个值命中的条目下标列表。"""
+        seg = int(self._segments(np.array([value], dtype=np.float64))[0])
+        return self.indices[self.offsets[seg]:self.offsets[seg + 1]].tolist()
@@ -0,0 +1,236 @@
+import itertools
+from functools import lru_cache
+
+import numpy as np
+
+# 同位素丰度，按相对最轻同位素的整数质量偏移排列
+# 格式: element -> (nominal_mass, [abundance at +0, +1, +2, ...])
+ISOTOPES = {
+    "C": (12, [0.9893, 0.0107]),
+    "H": (1, [0.999885, 0.000115]),
+    "O": (16, [0.99757, 0.00038, 0.00205]),
+    "S": (32, [0.9499, 0.0075, 0.0425, 0.0, 0.0001]),
+    "Si": (28, [0.92223, 0.04685, 0.03092]),
+    "Cl": (35, [0.7576, 0.0, 0.2424]),
+    "Br": (79, [0.5069, 0.0, 0.4931]),
+}
+
+# 同位素簇比较的长度：M, M+1, ..., M+5
+PATTERN_LENGTH = 6
+
+# 参与枚举的杂原子及其最大个数
+HETERO_RANGES = {
+    "Cl": range(0, 5),
+    "Br": range(0, 5),
+    "S": range(0, 4),
+    "Si": range(0, 3),
+    "O": range(0, 7),
+}
+MAX_HALOGENS = 4
+MAX_CARBONS = 100
+
+# 缺失的簇峰视为低于该相对强度；每多一个杂原子加一点误差，使结论偏向简单组成
+DETECTION_LIMIT = 0.03
+HETEROATOM_PENALTY = 0.1
+
+# 只把这些元素写入结论；O 只用于修正 M+2，不足以单独判断
+REPORTED_ELEMENTS = ("Cl", "Br", "S", "Si")
+
+
+@lru_cache(maxsize=1024)
+def element_pattern(element, count, length=PATTERN_LENGTH):
+    """element 原子 count 个的同位素分布（截断到 length 个偏移），使用平方求幂卷积。"""
+    result = np.zeros(length)
+    result[0] = 1.0
+    base = np.zeros(length)
+    abundances = ISOTOPES[element][1][:length]
+    base[: len(abundances)] = abundances
+    n = count
+    while n:
+        if n & 1:
+            result = np.convolve(result, base)[:length]
+        n >>= 1
+        if n:
+            base = np.convolve(base, base)[:length]
+    result.setflags(write=False)
+    return result
+
+
+@lru_cache(maxsize=4096)
+def combination_pattern(counts, length=PATTERN_LENGTH):
+    """counts 为 ((element, n), ...) 元组，返回整体同位素分布。"""
+    result = np.zeros(length)
+    result[0] = 1.0
+    for element, n in counts:
+        if n:
+            result = np.convolve(result, element_pattern(element, n, length))[:length]
+    result.setflags(write=False)
+    return result
+
+
+@lru_cache(maxsize=1)
+def _hetero_table(length=PATTERN_LENGTH):
+    """预先计算全部杂原子组合的分布矩阵与名义质量。"""
+    names = list(HETERO_RANGES)
+    combos = []
+    for values in itertools.product(*(HETERO_RANGES[e] for e in names)):
+        counts = dict(zip(names, values))
+        if counts["Cl"] + counts["Br"] > MAX_HALOGENS:
+            continue
+        combos.append(tuple((e, counts[e]) for e in names))
+    patterns = np.array([combination_pattern(c, length) for c in combos])
+    masses = np.array([sum(ISOTOPES[e][0] * n for e, n in c) for c in combos])
+    return combos, patterns, masses
+
+
+@lru_cache(maxsize=1)
+def _carbon_toeplitz(length=PATTERN_LENGTH):
+    """C_n 分布的 Toeplitz 形式 T[n, k, j] = P_C^n[k - j]，便于批量卷积。"""
+    carbons = np.array([element_pattern("C", n, length) for n in range(MAX_CARBONS + 1)])
+    idx = np.arange(length)[:, None] - np.arange(length)[None, :]
+    valid = idx >= 0
+    toeplitz = np.where(valid[None, :, :], carbons[:, np.clip(idx, 0, None)], 0.0)
+    return toeplitz
+
+
+@lru_cache(maxsize=1)
+def _pattern_grid(length=PATTERN_LENGTH):
+    """
+    全部 (杂原子组合, 碳数) 的理论同位素簇，只计算一次，以 M 归一为 1。
+
+    同时给出每个组合的"报告元素签名"编号，用于合并只差 O 个数的组合。
+    """
+    combos, hetero, hetero_mass = _hetero_table(length)
+    patterns = np.einsum("hj,ckj->hck", hetero, _carbon_toeplitz(length))
+    patterns = patterns / patterns[:, :, :1]
+    patterns.setflags(write=False)
+
+    signatures = [tuple((e, n) for e, n in c if e in REPORTED_ELEMENTS and n) for c in combos]
+    unique = sorted(set(signatures))
+    index = {sig: i for i, sig in enumerate(unique)}
+    signature_ids = np.array([index[sig] for sig in signatures])
+    penalty = np.array([HETEROATOM_PENALTY * sum(n for _, n in sig) for sig in signatures])
+    return combos, hetero_mass, patterns, signature_ids, unique, penalty
+
+
+def predict_patterns(molecular_mass, length=PATTERN_LENGTH):
+    """
+    对给定名义分子量，给出所有 (杂原子组合, 碳数) 的理论同位素簇及质量可行性。
+
+    H/N 的贡献很小，这里不单独枚举（剩余质量默认由 H/N 补足）。
+    返回 (combos, carbons, patterns, feasible)，patterns 形状为 (组合数, 碳数, length)。
+    """
+    combos, hetero_mass, patterns = _pattern_grid(length)[:3]
+    # 只取质量上可能的碳数范围，避免对整张表做无用计算
+    max_c = int(min(MAX_CARBONS, max(molecular_mass, 0) // 12))
+    carbons = np.arange(max_c + 1)
+    patterns = patterns[:, : max_c + 1]
+
+    # 质量可行性：C 与杂原子的名义质量不能超过分子量
+    budget = molecular_mass - hetero_mass[:, None] - 12 * carbons[None, :]
+    feasible = (budget >= 0) & (carbons[None, :] >= 1)
+    return combos, carbons, patterns, feasible
+
+
+def extract_cluster(peaks, length=PATTERN_LENGTH):
+    """
+    从 (m/z, 强度) 列表中取出最高质量端的同位素簇，按整数质量合并。
+
+    返回 (nominal_masses, intensities)，两者均按质量升序。
+    """
+    if not peaks:
+        return np.empty(0, dtype=int), np.empty(0)
+    mz = np.array([p[0] for p in peaks], dtype=np.float64)
+    intensity = np.array([p[1] for p in peaks], dtype=np.float64)
+    nominal = np.rint(mz).astype(int)
+    top = nominal.max()
+    in_cluster = nominal > top - length
+    nominal, intensity = nominal[in_cluster], intensity[in_cluster]
+    masses = np.unique(nominal)
+    summed = np.array([intensity[nominal == m].sum() for m in masses])
+    return masses, summed
+
+
+def fit_isotope_pattern(peaks, length=PATTERN_LENGTH, max_results=5):
+    """
+    用分子离子簇拟合杂原子组成。
+
+    簇内每个峰都尝试作为 M（含 Cl/Br 时最高质量峰往往是 M+2），
+    观测缺失的位置只在理论值超过簇内最弱峰时才计入误差。
+
+    返回 list of dict: mw, elements (dict), carbons, rmsd (% of M)，
+    按 rmsd 加杂原子惩罚升序排列，每个 (M, 杂原子组合) 只保留最佳碳数。
+    """
+    masses, intensity = extract_cluster(peaks, length)
+    if masses.size < 2 or intensity.max() <= 0:
+        return []
+
+    _, _, _, signature_ids, signatures, penalty = _pattern_grid(length)
+
+    hits = []
+    for base_index, base_mass in enumerate(masses):
+        base_intensity = intensity[base_index]
+        if base_intensity <= 0:
+            continue
+        observed = np.zeros(length)
+        present = np.zeros(length, dtype=bool)
+        offsets = masses - base_mass
+        inside = (offsets >= 0) & (offsets < length)
+        observed[offsets[inside]] = intensity[inside] / base_intensity
+        present[offsets[inside]] = True
+        if present.sum() < 2:
+            continue
+        detect_limit = min(observed[present].min(), DETECTION_LIMIT)
+
+        combos, carbons, patterns, feasible = predict_patterns(int(base_mass), length)
+        if not feasible.any():
+            continue
+        residual = np.where(present, patterns - observed,
+                            np.clip(patterns - detect_limit, 0, None))
+        rmsd = np.sqrt(np.mean(residual ** 2, axis=-1)) * 100.0
+        rmsd = np.where(feasible, rmsd, np.inf)
+        # M-2 / M-4 处若有可观强峰，该峰更可能是卤素簇中的 M+2 而非 M
+        lower = intensity[np.isin(masses, (base_mass - 2, base_mass - 4))]
+        if lower.size:
+            rmsd = rmsd + 100.0 * lower.max() / base_intensity
+
+        best_c = np.argmin(rmsd, axis=1)
+        best = rmsd[np.arange(len(combos)), best_c]
+        score = best + penalty
+
+        # 每个报告元素签名只保留得分最好的组合
+        order = np.lexsort((score, signature_ids))
+        first = np.ones(order.size, dtype=bool)
+        first[1:] = signature_ids[order][1:] != signature_ids[order][:-1]
+        for h in order[first]:
+            if np.isfinite(score[h]):
+                hits.append((float(score[h]), float(best[h]), int(base_mass),
+                             signatures[signature_ids[h]], int(carbons[best_c[h]])))
+
+    hits.sort(key=lambda x: x[0])
+    return [{"mw": mw, "elements": dict(sig), "carbons": n_c, "rmsd": rmsd}
+            for _, rmsd, mw, sig, n_c in hits[:max_results]]
+
+
+def format_elements(elements):
+    """{'Cl': 1, 'S': 2} -> 'Cl1 S2'；无杂原子返回 '-'。"""
+    if not elements:
+        return "-"
+    return " ".join(f"{e}{n}" for e, n in elements.items())
+
+
+def molecular_ion_offsets(counts, limit=DETECTION_LIMIT):
+    """
+    分子式 counts ({元素: 个数}) 的同位素簇中相对 M 峰不低于 limit 的偏移（含 0），
+    即最大 m/z 可能落在 M、M+2、M+4 ... 上。只计 REPORTED_ELEMENTS（Cl、Br、S、Si），
+    碳的 M+1 不计，否则相差 1 的分子式也会被放过。
+    """
+    heavy = tuple((e, counts[e]) for e in REPORTED_ELEMENTS if counts.get(e))
+    pattern = combination_pattern(heavy)
+    return [k for k in range(PATTERN_LENGTH) if pattern[k] >= limit * pattern[0]]
+
+
+def molecular_ion_offset(counts, nominal_mass, max_mz):
+    """最大 m/z 相对名义分子量的偏移若是分子式的同位素峰（见 molecular_ion_offsets）则返回该偏移，否则返回 None。"""
+    offset = int(round(max_mz)) - nominal_mass
+    return offset if offset in molecular_ion_offsets(counts) else None
@@ -0,0 +1,141 @@
+import sys
+import os
+import csv
+import threading
+import zipfile
+
+import numpy as np
+
+# 碎片库条目的类别（按位组合）
+KIND_LOSS = 1
+KIND_ION = 2
+KIND_CODES = {"loss": KIND_LOSS, "ion": KIND_ION, "both": KIND_LOSS | KIND_ION}
+
+LIBRARY_FILE = "fragments.csv"
+# 预编译缓存与库文件同目录，文件名后加此后缀
+CACHE_SUFFIX = ".cache.npz"
+
+
+def _base_dir():
+    if getattr(sys, 'frozen', False):
+        return os.path.dirname(sys.executable)
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+def default_library_path():
+    return os.path.join(_base_dir(), LIBRARY_FILE)
+
+
+class FragmentLibrary:
+    """
+    质谱中性丢失 / 特征离子库。
+
+    条目按质量升序保存在紧凑的 numpy 数组中，容差查找用 searchsorted，复杂度 O(log n)。
+    """
+
+    def __init__(self, masses, kinds, priorities, labels):
+        order = np.argsort(masses, kind="stable")
+        self.masses = np.asarray(masses, dtype=np.float64)[order]
+        self.kinds = np.asarray(kinds, dtype=np.int8)[order]
+        self.priorities = np.asarray(priorities, dtype=np.float32)[order]
+        self.labels = np.asarray(labels, dtype=str)[order]
+        self._subsets = {}
+
+    def __len__(self):
+        return self.masses.size
+
+    def lookup(self, mass, tolerance=0.5, kind=None):
+        """返回质量落在 [mass - tolerance, mass + tolerance] 内的条目下标。"""
+        left = np.searchsorted(self.masses, mass - tolerance, side="left")
+        right = np.searchsorted(self.masses, mass + tolerance, side="right")
+        idx = np.arange(left, right)
+        if kind is not None:
+            idx = idx[(self.kinds[idx] & kind) != 0]
+        return idx
+
+    def subset(self, kind):
+        """某一类条目的 (masses, priorities, labels)，按质量升序，结果会被缓存。"""
+        if kind not in self._subsets:
+            mask = (self.kinds & kind) != 0
+            self._subsets[kind] = (self.masses[mask], self.priorities[mask], self.labels[mask])
+        return self._subsets[kind]
+
+    def losses(self):
+        return self.subset(KIND_LOSS)
+
+    def ions(self):
+        return self.subset(KIND_ION)
+
+    def save_cache(self, path):
+        # np.savez 会自动补 .npz 后缀，这里用文件对象写入以保持文件名不变；
+        # 先写到带进程号的临时文件再 os.replace，多个进程同时重建缓存时读者不会看到写了一半的文件
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                np.savez(f, masses=self.masses, kinds=self.kinds,
+                         priorities=self.priorities, labels=self.labels)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    @classmethod
+    def from_cache(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["masses"], data["kinds"], data["priorities"], data["labels"])
+
+    @classmethod
+    def from_csv(cls, path):
+        """解析 CSV 库文件：列为 mass, kind, priority, label；# 开头的行为注释。"""
+        masses, kinds, priorities, labels = [], [], [], []
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            rows = csv.DictReader(line for line in f if line.strip() and not line.startswith("#"))
+            for row in rows:
+                kind = KIND_CODES.get(row["kind"].strip().lower())
+                if kind is None:
+                    raise ValueError(f"Unknown fragment kind: {row['kind']}")
+                masses.append(float(row["mass"]))
+                kinds.append(kind)
+                priorities.append(float(row.get("priority") or 1))
+                labels.append(row["label"].strip())
+        return cls(masses, kinds, priorities, labels)
+
+
+def load_library(path=None, use_cache=True):
+    """
+    读取碎片库。use_cache 为 True 时优先读取同目录下比库文件新的二进制缓存，
+    缓存缺失、过期或损坏时解析 CSV 并尝试重写缓存（目录不可写时静默跳过）。
+    """
+    path = path or default_library_path()
+    cache_path = path + CACHE_SUFFIX
+    if use_cache:
+        try:
+            if os.path.getmtime(cache_path) >= os.path.getmtime(path):
+                return FragmentLibrary.from_cache(cache_path)
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            pass
+
+    library = FragmentLibrary.from_csv(path)
+    if use_cache:
+        try:
+            library.save_cache(cache_path)
+        except OSError:
+            pass
+    return library
+
+
+_library = None
+_library_lock = threading.Lock()
+
+
+def get_library():
+    """第一次使用时才加载默认碎片库，之后复用同一份（线程安全）。"""
+    global _library
+    if _library is None:
+        with _library_lock:
+            if _library is None:
+                _library = load_library()
+    return _library
@@ -0,0 +1,242 @@
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Prometheus 指标名前缀
+METRIC_PREFIX = "spectra"
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+def _quantile(sorted_values, q):
+    k = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[k]
+
+
+class RunMetrics:
+    """
+    一次运行（GUI 一次分析或一次批量任务）的计时与计数。
+
+    observe(name, seconds, **labels) 记录一次耗时，incr(name, n, **labels) 累加计数；
+    同名不同标签分别统计。只做追加与加法，锁内开销为常数，可在每个流式增量上调用。
+    """
+
+    def __init__(self, run_id=None):
+        self.run_id = run_id
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._timings = {}
+        self._counters = {}
+
+    def observe(self, name, seconds, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._timings.setdefault(key, []).append(seconds)
+
+    def incr(self, name, n=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + n
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def record(self):
+        """汇总为可 JSON 序列化的 dict：每个计时给出 count/sum/min/max/p50/p95/p99，每个计数给出总数。"""
+        with self._lock:
+            timings = {key: sorted(values) for key, values in self._timings.items()}
+            counters = dict(self._counters)
+        record = {"run_id": self.run_id, "started": self.started, "elapsed": time.time() - self.started,
+                  "timings": [], "counters": []}
+        for (name, labels), values in sorted(timings.items()):
+            entry = {"name": name, "labels": dict(labels), "count": len(values), "sum": sum(values),
+                     "min": values[0], "max": values[-1]}
+            for q in QUANTILES:
+                entry[f"p{int(q * 100)}"] = _quantile(values, q)
+            record["timings"].append(entry)
+        for (name, labels), value in sorted(counters.items()):
+            record["counters"].append({"name": name, "labels": dict(labels), "value": value})
+        return record
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.record(), ensure_ascii=False, **kwargs)
+
+    def to_prometheus(self, openmetrics=False):
+        """
+        Prometheus 文本格式：计时输出为 summary（<name>_seconds，含分位数、_sum、_count），
+        计数输出为 counter（<name>_total）。openmetrics=True 时按 OpenMetrics 要求以 "# EOF" 结尾。
+        """
+        record = self.record()
+        lines = []
+        typed = set()
+
+        def fmt_labels(labels, extra=None):
+            items = list(labels.items()) + (list(extra.items()) if extra else [])
+            if not items:
+                return ""
+            escaped = [f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                       for k, v in items]
+            return "{" + ",".join(escaped) + "}"
+
+        for entry in record["timings"]:
+            metric = f"{METRIC_PREFIX}_{entry['name']}_seconds"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} summary")
+            for q in QUANTILES:
+                lines.append(f"{metric}{fmt_labels(entry['labels'], {'quantile': q})} {entry[f'p{int(q * 100)}']:.6f}")
+            lines.append(f"{metric}_sum{fmt_labels(entry['labels'])} {entry['sum']:.6f}")
+            lines.append(f"{metric}_count{fmt_labels(entry['labels'])} {entry['count']}")
+        for entry in record["counters"]:
+            family = f"{METRIC_PREFIX}_{entry['name']}"
+            if family not in typed:
+                typed.add(family)
+                lines.append(f"# TYPE {family} counter")
+            lines.append(f"{family}_total{fmt_labels(entry['labels'])} {entry['value']}")
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def summary_lines(self):
+        """每个计时一行的简短摘要（名称、标签、次数、p50、p95），供控制台显示。"""
+        lines = []
+        for entry in self.record()["timings"]:
+            labels = ",".join(f"{k}={v}" for k, v in entry["labels"].items())
+            lines.append(f"{entry['name']}{'[' + labels + ']' if labels else ''}: n={entry['count']} "
+                         f"p50={entry['p50'] * 1000:.1f}ms p95={entry['p95'] * 1000:.1f}ms")
+        return lines
+
+
+_default_metrics = RunMetrics("default")
+_current = contextvars.ContextVar("spectra_metrics", default=None)
+
+
+def current_metrics():
+    """当前上下文的 RunMetrics；未开始新的运行时返回进程级默认实例。"""
+    return _current.get() or _default_metrics
+
+
+def start_run(run_id=None):
+    """
+    开始新的一次运行并设为当前上下文的指标记录，返回 RunMetrics。
+    在线程或 asyncio 任务创建之前调用，子任务会继承同一个记录。
+    """
+    metrics = RunMetrics(run_id)
+    _current.set(metrics)
+    return metrics
+
+
+class StreamMeter:
+    """
+    一次流式 AI 请求的计时：响应头到达、首个思考增量、首个正文增量 (TTFT)、流持续时间，
+    以及思考 / 正文增量数（主流端点每个增量约为一个 token）。
+    增量回调只在本对象上做整数累加，finish() 时才一次性写入 RunMetrics。
+    """
+
+    __slots__ = ("metrics", "labels", "start", "headers", "first_reasoning", "first_content",
+                 "reasoning_deltas", "content_deltas", "reasoning_chars", "content_chars")
+
+    def __init__(self, endpoint, model, metrics=None):
+        self.metrics = metrics or current_metrics()
+        self.labels = {"endpoint": endpoint, "model": model}
+        self.start = time.perf_counter()
+        self.headers = self.first_reasoning = self.first_content = None
+        self.reasoning_deltas = self.content_deltas = 0
+        self.reasoning_chars = self.content_chars = 0
+
+    def opened(self):
+        """create() 返回即响应头已到达（包含建连、发送请求与服务端排队时间）。"""
+        self.headers = time.perf_counter()
+
+    def reasoning(self, text):
+        if self.first_reasoning is None:
+            self.first_reasoning = time.perf_counter()
+        self.reasoning_deltas += 1
+        self.reasoning_chars += len(text)
+
+    def content(self, text):
+        if self.first_content is None:
+            self.first_content = time.perf_counter()
+        self.content_deltas += 1
+        self.content_chars += len(text)
+
+    def finish(self, status="ok"):
+        """status: "ok" / "stopped"（stop_when 提前关闭）/ "error" / "cancelled"。"""
+        end = time.perf_counter()
+        m, labels = self.metrics, self.labels
+        m.observe("ai_request", end - self.start, **labels)
+        if self.headers is not None:
+            m.observe("ai_response_headers", self.headers - self.start, **labels)
+        if self.first_reasoning is not None:
+            m.observe("ai_first_reasoning", self.first_reasoning - self.start, **labels)
+        if self.first_content is not None:
+            m.observe("ai_ttft", self.first_content - self.start, **labels)
+        first = min((t for t in (self.first_reasoning, self.first_content) if t is not None), default=None)
+        if first is not None:
+            m.observe("ai_stream", end - first, **labels)
+        m.incr("ai_requests", status=status, **labels)
+        if self.reasoning_deltas:
+            m.incr("ai_reasoning_deltas", self.reasoning_deltas, **labels)
+            m.incr("ai_reasoning_chars", self.reasoning_chars, **labels)
+        if self.content_deltas:
+            m.incr("ai_content_deltas", self.content_deltas, **labels)
+            m.incr("ai_content_chars", self.content_chars, **labels)
+
+
+# httpcore 的 trace 事件 -> 指标名；只有新建连接才会出现这些事件，复用 keep-alive 连接时没有
+_CONNECT_EVENTS = {
+    "connection.connect_tcp": "ai_tcp_connect",
+    "connection.start_tls": "ai_tls_handshake",
+}
+
+
+class _ConnectTrace:
+    def __init__(self, host):
+        self.metrics = current_metrics()
+        self.host = host
+        self._starts = {}
+
+    def __call__(self, name, info):
+        stage, _, phase = name.rpartition(".")
+        metric = _CONNECT_EVENTS.get(stage)
+        if metric is None:
+            return
+        if phase == "started":
+            self._starts[stage] = time.perf_counter()
+        elif phase == "complete" and stage in self._starts:
+            self.metrics.observe(metric, time.perf_counter() - self._starts.pop(stage), host=self.host)
+
+
+def trace_request(request):
+    """httpx.Client 的 request 事件钩子：记录新建连接的 TCP 连接与 TLS 握手耗时。"""
+    request.extensions["trace"] = _ConnectTrace(request.url.netloc.decode("ascii"))
+
+
+async def atrace_request(request):
+    """trace_request 的 httpx.AsyncClient 版本（httpcore 要求异步回调）。"""
+    trace = _ConnectTrace(request.url.netloc.decode("ascii"))
+
+    async def callback(name, info):
+        trace(name, info)
+
+    request.extensions["trace"] = callback
+
+
+def write_metrics(metrics, json_path=None, prometheus_path=None, openmetrics=False):
+    """把一次运行的指标写成 JSON 和 / 或 Prometheus 文本文件。"""
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(metrics.record(), f, ensure_ascii=False, indent=2)
+    if prometheus_path:
+        with open(prometheus_path, "w", encoding="utf-8") as f:
+            f.write(metrics.to_prometheus(openmetrics=openmetrics))
@@ -0,0 +1,227 @@
+import sys
+import json
+import time
+import random
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# 模拟端点的默认行为：每秒 token 数（<= 0 表示不限速）、首 token 延迟 (秒)、延迟抖动比例、错误注入概率
+DEFAULT_MOCK_OPTIONS = {
+    "token_rate": 200.0,
+    "ttft": 0.3,
+    "jitter": 0.1,
+    "error_rate": 0.0,
+    "error_status": 500,
+    "disconnect_rate": 0.0,
+    "reasoning_tokens": 20,
+    "seed": None,
+}
+
+# 回答模板：结构化 Step 2 请求返回 JSON，其余返回名称与结构简式
+DEFAULT_REPLY = "Ethyl acetate\nStructural formula: CH3COOCH2CH3 (C4H8O2)"
+JSON_REPLY = '{"functional_groups": ["ester C=O", "C-O-C"], "formulas": ["C4H8O2"]}'
+
+
+def _tokens(text):
+    """把回答切成近似 token 的小段（单词与空白/标点分开），流式时每段一个 delta。"""
+    pieces = []
+    current = ""
+    for ch in text:
+        if ch.isalnum():
+            current += ch
+            if len(current) >= 4:
+                pieces.append(current)
+                current = ""
+        else:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(ch)
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+class MockServer:
+    """
+    本地 OpenAI 兼容 chat.completions 模拟服务（只用标准库），用于离线测量本程序自身的开销。
+
+    支持流式 (SSE) 与非流式请求、reasoning_content 增量、max_tokens 截断，
+    以及可配置的 token 速率、首 token 延迟、抖动、HTTP 错误与中途断流注入。
+    options 见 DEFAULT_MOCK_OPTIONS；reply 可为固定字符串或 reply(request_json) -> str。
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, options=None, reply=None):
+        self.options = dict(DEFAULT_MOCK_OPTIONS, **(options or {}))
+        self.reply = reply
+        self._random = random.Random(self.options["seed"])
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "errors": 0, "disconnects": 0, "tokens": 0}
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                server._handle(self)
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _roll(self, probability):
+        with self._lock:
+            return probability > 0 and self._random.random() < probability
+
+    def _delay(self, seconds):
+        if seconds <= 0:
+            return
+        with self._lock:
+            factor = 1.0 + self._random.uniform(-1.0, 1.0) * self.options["jitter"]
+        time.sleep(max(0.0, seconds * factor))
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self.stats[key] += n
+
+    def _reply_text(self, request):
+        if callable(self.reply):
+            return self.reply(request)
+        if self.reply is not None:
+            return self.reply
+        if request.get("response_format") or "JSON Schema" in json.dumps(request.get("messages", [])):
+            return JSON_REPLY
+        return DEFAULT_REPLY
+
+    def _handle(self, handler):
+        length = int(handler.headers.get("Content-Length") or 0)
+        try:
+            request = json.loads(handler.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(handler, 400, {"error": {"message": "invalid JSON"}})
+            return
+        self._count("requests")
+        if not handler.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(handler, 404, {"error": {"message": "not found"}})
+            return
+        if self._roll(self.options["error_rate"]):
+            self._count("errors")
+            self._send_json(handler, self.options["error_status"], {"error": {"message": "injected error"}})
+            return
+
+        pieces = _tokens(self._reply_text(request))
+        finish = "stop"
+        if request.get("max_tokens") and len(pieces) > request["max_tokens"]:
+            pieces = pieces[:request["max_tokens"]]
+            finish = "length"
+        thinking = (request.get("thinking") or {}).get("type", "enabled") != "disabled"
+        reasoning = ["thinking "] * (self.options["reasoning_tokens"] if thinking else 0)
+        model = request.get("model", "mock")
+
+        if not request.get("stream"):
+            rate = self.options["token_rate"]
+            self._delay(self.options["ttft"] + (len(pieces) / rate if rate > 0 else 0.0))
+            self._count("tokens", len(pieces))
+            message = {"role": "assistant", "content": "".join(pieces)}
+            if reasoning:
+                message["reasoning_content"] = "".join(reasoning)
+            self._send_json(handler, 200, {
+                "id": "mock", "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": message, "finish_reason": finish}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(pieces), "total_tokens": len(pieces)},
+            })
+            return
+
+        # 分块传输使连接在流结束后仍可 keep-alive 复用，与真实端点一致
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Cache-Control", "no-cache")
+        handler.send_header("Transfer-Encoding", "chunked")
+        handler.end_headers()
+        interval = 1.0 / self.options["token_rate"] if self.options["token_rate"] > 0 else 0.0
+        disconnect_at = None
+        if self._roll(self.options["disconnect_rate"]):
+            disconnect_at = self._random.randrange(len(pieces)) if pieces else 0
+        try:
+            self._delay(self.options["ttft"])
+            for kind, items in (("reasoning_content", reasoning), ("content", pieces)):
+                for i, piece in enumerate(items):
+                    if kind == "content" and i == disconnect_at:
+                        # 不写结束块直接断开，客户端会收到不完整的响应
+                        self._count("disconnects")
+                        handler.close_connection = True
+                        return
+                    self._send_event(handler, model, {kind: piece})
+                    self._count("tokens")
+                    self._delay(interval)
+            self._send_event(handler, model, {}, finish)
+            self._write_chunk(handler, b"data: [DONE]\n\n")
+            self._write_chunk(handler, b"")
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端提前关闭流（如结构化输出已完整），属正常情况
+            handler.close_connection = True
+
+    def _send_event(self, handler, model, delta, finish=None):
+        chunk = {
+            "id": "mock", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+        }
+        self._write_chunk(handler, b"data: " + json.dumps(chunk, ensure_ascii=False).encode("utf-8") + b"\n\n")
+
+    @staticmethod
+    def _write_chunk(handler, data):
+        handler.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        handler.wfile.flush()
+
+    def _send_json(self, handler, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Offline OpenAI-compatible mock endpoint")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    for name, value in DEFAULT_MOCK_OPTIONS.items():
+        if name == "seed":
+            parser.add_argument("--seed", type=int)
+        else:
+            parser.add_argument("--" + name.replace("_", "-"), type=type(value), default=value)
+    parser.add_argument("--reply", help="固定回答文本（默认按请求类型返回示例回答）")
+    args = parser.parse_args()
+    options = {name: getattr(args, name) for name in DEFAULT_MOCK_OPTIONS}
+    mock = MockServer(args.host, args.port, options, args.reply)
+    print(f"Mock endpoint: {mock.url}", file=sys.stderr)
+    try:
+        mock._httpd.serve_forever()
+    except KeyboardInterrupt:
+        mock.stop()
@@ -0,0 +1,506 @@
+from collections import Counter
+
+# 元素名义质量（最丰同位素）与平均原子量
+NOMINAL_MASS = {
+    "H": 1, "B": 11, "C": 12, "N": 14, "O": 16, "F": 19, "Si": 28, "P": 31,
+    "S": 32, "Cl": 35, "Br": 79, "I": 127,
+}
+AVERAGE_MASS = {
+    "H": 1.008, "B": 10.81, "C": 12.011, "N": 14.007, "O": 15.999, "F": 18.998, "Si": 28.085,
+    "P": 30.974, "S": 32.06, "Cl": 35.45, "Br": 79.904, "I": 126.904,
+}
+
+# 有机子集允许的价态（由小到大），用于计算隐式氢
+VALENCES = {
+    "B": (3,), "C": (4,), "N": (3, 5), "O": (2,), "P": (3, 5), "S": (2, 4, 6),
+    "F": (1,), "Cl": (1,), "Br": (1,), "I": (1,), "Si": (4,),
+}
+ORGANIC_SUBSET = ("Cl", "Br", "B", "C", "N", "O", "P", "S", "F", "I")
+AROMATIC_SUBSET = ("b", "c", "n", "o", "p", "s")
+BOND_ORDERS = {"-": 1, "=": 2, "#": 3, ":": 1.5, "/": 1, "\\": 1}
+AROMATIC_BOND = 1.5
+
+# 分子式中元素的书写顺序（Hill 顺序：C、H 在前，其余按字母）
+HILL_FIRST = ("C", "H")
+
+
+class Molecule:
+    """
+    以图表示的分子（只含重原子，氢以计数形式挂在原子上）。
+
+    symbols / aromatic / charges / hcounts 按原子下标排列；
+    neighbors[i] 为 [(j, order), ...]，芳香键的 order 为 1.5。
+    """
+
+    def __init__(self, symbols, aromatic, charges, hcounts, bonds):
+        self.symbols = list(symbols)
+        self.aromatic = list(aromatic)
+        self.charges = list(charges)
+        self.hcounts = list(hcounts)
+        self.bonds = list(bonds)
+        self.neighbors = [[] for _ in self.symbols]
+        for i, j, order in self.bonds:
+            self.neighbors[i].append((j, order))
+            self.neighbors[j].append((i, order))
+        self._classes = None
+        self._rings = None
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def degree(self, i):
+        return len(self.neighbors[i])
+
+    def bond_order(self, i, j):
+        for k, order in self.neighbors[i]:
+            if k == j:
+                return order
+        return 0
+
+    def formula(self):
+        """元素 -> 个数。"""
+        counts = Counter(self.symbols)
+        h = sum(self.hcounts)
+        if h:
+            counts["H"] += h
+        return dict(counts)
+
+    def formula_string(self):
+        return hill_formula(self.formula())
+
+    def nominal_mass(self):
+        return sum(NOMINAL_MASS[e] * n for e, n in self.formula().items())
+
+    def average_mass(self):
+        return sum(AVERAGE_MASS[e] * n for e, n in self.formula().items())
+
+    def degree_of_unsaturation(self):
+        return formula_unsaturation(self.formula())
+
+    def symmetry_classes(self):
+        """
+        拓扑等价类（Morgan 迭代细化）：不变量相同且邻居类别多重集相同的原子归为一类。
+        返回与原子一一对应的整数类别编号，结果会被缓存。
+        """
+        if self._classes is not None:
+            return self._classes
+        invariants = [
+            (self.symbols[i], self.aromatic[i], self.degree(i), self.hcounts[i], self.charges[i])
+            for i in range(len(self))
+        ]
+        classes = _rank(invariants)
+        n_classes = len(set(classes))
+        while True:
+            refined = _rank([
+                (classes[i], tuple(sorted((classes[j], order) for j, order in self.neighbors[i])))
+                for i in range(len(self))
+            ])
+            n_refined = len(set(refined))
+            classes = refined
+            if n_refined == n_classes:
+                break
+            n_classes = n_refined
+        self._classes = classes
+        return classes
+
+    def ring_membership(self):
+        """每个原子所在的最小环大小（不在环上为 0），用 BFS 逐原子求。"""
+        if self._rings is not None:
+            return self._rings
+        sizes = [0] * len(self)
+        for start in range(len(self)):
+            best = 0
+            for j, _ in self.neighbors[start]:
+                # 去掉 start-j 这条键后 j 回到 start 的最短路径长度 + 1 即过该键的最小环
+                length = self._shortest_path(j, start, skip=(start, j))
+                if length and (not best or length + 1 < best):
+                    best = length + 1
+            sizes[start] = best
+        self._rings = sizes
+        return sizes
+
+    def _shortest_path(self, source, target, skip):
+        seen = {source: 0}
+        frontier = [source]
+        while frontier:
+            next_frontier = []
+            for a in frontier:
+                for b, _ in self.neighbors[a]:
+                    if (a, b) == skip or (b, a) == skip or b in seen:
+                        continue
+                    seen[b] = seen[a] + 1
+                    if b == target:
+                        return seen[b]
+                    next_frontier.append(b)
+            frontier = next_frontier
+        return 0
+
+
+def hill_formula(counts):
+    """元素 -> 个数 的 dict 按 Hill 顺序写成分子式字符串。"""
+    order = [e for e in HILL_FIRST if counts.get(e)] + sorted(e for e in counts if e not in HILL_FIRST and counts[e])
+    return "".join(e + (str(counts[e]) if counts[e] > 1 else "") for e in order)
+
+
+def formula_unsaturation(counts):
+    """由元素组成计算不饱和度（环 + π 键数）。"""
+    halogens = sum(counts.get(e, 0) for e in ("F", "Cl", "Br", "I"))
+    c = counts.get("C", 0) + counts.get("Si", 0)
+    n = counts.get("N", 0) + counts.get("P", 0)
+    return c - (counts.get("H", 0) + halogens) / 2.0 + n / 2.0 + 1
+
+
+def formula_nominal_mass(counts):
+    return sum(NOMINAL_MASS[e] * n for e, n in counts.items())
+
+
+def parse_formula(text):
+    """
+    解析分子式或结构简式（如 C4H8O2、CH3COOCH2CH3、(CH3)2CHOH、CH2=CH-CN），返回元素 -> 个数。
+    键符号 - = # ≡ 与下标数字 ₀-₉ 会被忽略 / 转换；含未知元素或括号不配对时抛出 ValueError。
+    """
+    text = text.translate(_SUBSCRIPTS)
+    stack = [Counter()]
+    pos = 0
+    while pos < len(text):
+        ch = text[pos]
+        if ch in "-=#≡·":
+            pos += 1
+            continue
+        if ch in "([":
+            stack.append(Counter())
+            pos += 1
+            continue
+        if ch in ")]":
+            if len(stack) == 1:
+                raise ValueError(f"括号不配对: {text}")
+            group = stack.pop()
+            pos, n = _read_count(text, pos + 1)
+            for e, k in group.items():
+                stack[-1][e] += k * n
+            continue
+        if ch.isupper():
+            symbol = text[pos:pos + 2] if text[pos + 1:pos + 2].islower() else ch
+            if symbol not in NOMINAL_MASS:
+                raise ValueError(f"未知元素 {symbol}: {text}")
+            pos, n = _read_count(text, pos + len(symbol))
+            stack[-1][symbol] += n
+            continue
+        raise ValueError(f"无法解析的字符 {ch!r}: {text}")
+    if len(stack) != 1:
+        raise ValueError(f"括号不配对: {text}")
+    return dict(stack[0])
+
+
+_SUBSCRIPTS = str.maketrans("₀₁₂₃₄₅₆₇₈₉", "0123456789")
+
+
+def _read_count(text, pos):
+    end = pos
+    while end < len(text) and text[end].isdigit():
+        end += 1
+    return end, int(text[pos:end]) if end > pos else 1
+
+
+def is_carbonyl(mol, atom):
+    """atom 是否为羰基碳 (C=O)。"""
+    return mol.symbols[atom] == "C" and any(
+        mol.symbols[j] == "O" and order == 2 for j, order in mol.neighbors[atom]
+    )
+
+
+def classify_substituent(mol, center, atom):
+    """从 center 看 atom 所代表的取代基类别（用于查增量表）。"""
+    symbol = mol.symbols[atom]
+    others = [(j, order) for j, order in mol.neighbors[atom] if j != center]
+    if symbol == "C":
+        if mol.aromatic[atom]:
+            return "aryl"
+        if is_carbonyl(mol, atom):
+            if mol.hcounts[atom]:
+                return "CHO"
+            for j, order in others:
+                if order == 1 and mol.symbols[j] == "O":
+                    return "COOH" if mol.hcounts[j] or mol.charges[j] < 0 else "COOR"
+                if order == 1 and mol.symbols[j] == "N":
+                    return "CONR2"
+            return "COR"
+        if any(order == 3 and mol.symbols[j] == "N" for j, order in others):
+            return "CN"
+        if any(order == 3 for _, order in others):
+            return "C#C"
+        if any(order == 2 for _, order in others):
+            return "C=C"
+        return "alkyl"
+    if symbol == "O":
+        if mol.hcounts[atom] or mol.charges[atom] < 0:
+            return "OH"
+        for j, _ in others:
+            if is_carbonyl(mol, j):
+                return "OCOR"
+            if mol.aromatic[j]:
+                return "OAr"
+        return "OR"
+    if symbol == "N":
+        if sum(1 for j, _ in others if mol.symbols[j] == "O") >= 2:
+            return "NO2"
+        if any(is_carbonyl(mol, j) for j, _ in others):
+            return "NCOR"
+        return "NR2"
+    if symbol == "S":
+        if sum(1 for j, order in others if mol.symbols[j] == "O" and order == 2) >= 2:
+            return "SO2"
+        return "SR"
+    if symbol in ("F", "Cl", "Br", "I"):
+        return symbol
+    return "alkyl"
+
+
+def aromatic_distances(mol, start, limit=3):
+    """沿芳香键 BFS，返回 {原子: 距离}（不超过 limit）。"""
+    distances = {start: 0}
+    frontier = [start]
+    for d in range(1, limit + 1):
+        next_frontier = []
+        for a in frontier:
+            for b, order in mol.neighbors[a]:
+                if order == AROMATIC_BOND and b not in distances:
+                    distances[b] = d
+                    next_frontier.append(b)
+        frontier = next_frontier
+    return distances
+
+
+def _rank(keys):
+    """把可比较的键映射为稠密的整数名次。"""
+    order = {key: rank for rank, key in enumerate(sorted(set(keys)))}
+    return [order[key] for key in keys]
+
+
+def _implicit_hydrogens(symbol, aromatic, bond_orders):
+    valences = VALENCES.get(symbol)
+    if valences is None:
+        return 0
+    if aromatic:
+        # 芳香原子：每根芳香键计 1，另加环上共享的一个 π 键；只取最低价态，
+        # 因此不带方括号的 s、o 不挂氢（噻吩的 s 不是 4 价），吡咯型 N 须写成 [nH]
+        total = sum(1 if o == AROMATIC_BOND else o for o in bond_orders) + 1
+        return int(max(valences[0] - total, 0))
+    total = sum(bond_orders)
+    for v in valences:
+        if v >= total:
+            return int(v - total)
+    return 0
+
+
+def perceive_aromaticity(symbols, bonds):
+    """
+    Kekulé 式的芳香环：全部由 C/N 组成、每个原子的双键都在环内（或在已判为芳香的稠环上）的六元环。
+    返回 (aromatic, bonds)：aromatic 为每个原子是否在这样的环上，bonds 中环上的键改为芳香键 (order 1.5)。
+    不识别五元杂环等其它芳香体系。
+    """
+    n = len(symbols)
+    neighbors = [dict() for _ in range(n)]
+    for i, j, order in bonds:
+        neighbors[i][j] = order
+        neighbors[j][i] = order
+    double_partner = {}
+    for i, j, order in bonds:
+        if order == 2:
+            double_partner[i], double_partner[j] = j, i
+
+    candidates = {i for i in double_partner if symbols[i] in ("C", "N") and symbols[double_partner[i]] in ("C", "N")}
+    rings = []
+    for start in sorted(candidates):
+        _six_rings(start, [start], neighbors, candidates, rings)
+    rings = list({tuple(sorted(r)): r for r in rings}.values())
+
+    aromatic_atoms = set()
+    aromatic_rings = []
+    changed = True
+    while changed:
+        changed = False
+        for ring in rings:
+            if ring in aromatic_rings:
+                continue
+            members = set(ring) | aromatic_atoms
+            if all(double_partner[a] in members for a in ring):
+                aromatic_rings.append(ring)
+                aromatic_atoms |= set(ring)
+                changed = True
+    aromatic_bonds = set()
+    for ring in aromatic_rings:
+        for k in range(6):
+            a, b = ring[k], ring[(k + 1) % 6]
+            aromatic_bonds.add((min(a, b), max(a, b)))
+
+    final = [(i, j, AROMATIC_BOND if (min(i, j), max(i, j)) in aromatic_bonds else order) for i, j, order in bonds]
+    return [i in aromatic_atoms for i in range(n)], final
+
+
+def _six_rings(start, path, neighbors, allowed, rings):
+    if len(path) == 6:
+        if start in neighbors[path[-1]]:
+            rings.append(list(path))
+        return
+    for b in neighbors[path[-1]]:
+        # 只从环上编号最小的原子出发，避免同一个环被重复找到太多次
+        if b in allowed and b > start and b not in path:
+            path.append(b)
+            _six_rings(start, path, neighbors, allowed, rings)
+            path.pop()
+
+
+def _parse_bracket(text, pos):
+    """解析 [..] 原子，返回 (symbol, aromatic, hcount, charge, new_pos)。"""
+    end = text.find("]", pos)
+    if end < 0:
+        raise ValueError(f"Unclosed bracket atom at position {pos}.")
+    body = text[pos + 1:end]
+    i = 0
+    while i < len(body) and body[i].isdigit():
+        i += 1
+    rest = body[i:]
+    symbol = None
+    for candidate in ("Cl", "Br", "Si", "se", "as"):
+        if rest.startswith(candidate):
+            symbol = candidate
+            break
+    if symbol is None:
+        if not rest or not rest[0].isalpha():
+            raise ValueError(f"Bad bracket atom: [{body}]")
+        symbol = rest[0]
+        if len(rest) > 1 and rest[1].islower() and rest[0].isupper() and rest[:2] in NOMINAL_MASS:
+            symbol = rest[:2]
+    rest = rest[len(symbol):]
+    aromatic = symbol[0].islower()
+    symbol = symbol.capitalize()
+    rest = rest.lstrip("@")
+    hcount = 0
+    if rest.startswith("H"):
+        rest = rest[1:]
+        digits = ""
+        while rest and rest[0].isdigit():
+            digits += rest[0]
+            rest = rest[1:]
+        hcount = int(digits) if digits else 1
+    charge = 0
+    while rest and rest[0] in "+-":
+        sign = 1 if rest[0] == "+" else -1
+        rest = rest[1:]
+        digits = ""
+        while rest and rest[0].isdigit():
+            digits += rest[0]
+            rest = rest[1:]
+        charge += sign * (int(digits) if digits else 1)
+    return symbol, aromatic, hcount, charge, end + 1
+
+
+def parse_smiles(smiles):
+    """
+    解析 SMILES（有机子集、方括号原子、分支、环闭合、芳香小写）为 Molecule。
+
+    不处理立体化学（@、/、\\ 被忽略）。Kekulé 式的六元 C/N 环按芳香处理（见 perceive_aromaticity）。
+    格式错误抛出 ValueError。
+    """
+    text = smiles.strip()
+    if not text:
+        raise ValueError("Empty SMILES.")
+    symbols, aromatic, charges, explicit_h, bracket = [], [], [], [], []
+    bonds = []
+    stack = []
+    rings = {}
+    prev = None
+    pending = None
+    pos = 0
+    while pos < len(text):
+        ch = text[pos]
+        atom = None
+        if ch == "[":
+            symbol, arom, h, charge, pos = _parse_bracket(text, pos)
+            atom = (symbol, arom, h, charge, True)
+        elif text.startswith(("Cl", "Br"), pos):
+            atom = (text[pos:pos + 2], False, 0, 0, False)
+            pos += 2
+        elif ch in ORGANIC_SUBSET:
+            atom = (ch, False, 0, 0, False)
+            pos += 1
+        elif ch in AROMATIC_SUBSET:
+            atom = (ch.upper(), True, 0, 0, False)
+            pos += 1
+        elif ch == "(":
+            if prev is None:
+                raise ValueError(f"Branch without atom at position {pos}.")
+            stack.append(prev)
+            pos += 1
+            continue
+        elif ch == ")":
+            if not stack:
+                raise ValueError(f"Unbalanced ')' at position {pos}.")
+            prev = stack.pop()
+            pos += 1
+            continue
+        elif ch in BOND_ORDERS:
+            pending = BOND_ORDERS[ch]
+            pos += 1
+            continue
+        elif ch == ".":
+            prev = None
+            pos += 1
+            continue
+        elif ch.isdigit() or ch == "%":
+            if prev is None:
+                raise ValueError(f"Ring closure without atom at position {pos}.")
+            if ch == "%":
+                label = text[pos + 1:pos + 3]
+                pos += 3
+            else:
+                label = ch
+                pos += 1
+            if label in rings:
+                other, order = rings.pop(label)
+                order = pending or order
+                if order is None:
+                    order = AROMATIC_BOND if aromatic[prev] and aromatic[other] else 1
+                bonds.append((other, prev, order))
+            else:
+                rings[label] = (prev, pending)
+            pending = None
+            continue
+        else:
+            raise ValueError(f"Unexpected character {ch!r} in SMILES at position {pos}.")
+
+        symbol, arom, h, charge, is_bracket = atom
+        if symbol not in NOMINAL_MASS:
+            raise ValueError(f"Unsupported element: {symbol}")
+        index = len(symbols)
+        symbols.append(symbol)
+        aromatic.append(arom)
+        charges.append(charge)
+        explicit_h.append(h)
+        bracket.append(is_bracket)
+        if prev is not None:
+            order = pending
+            if order is None:
+                order = AROMATIC_BOND if aromatic[prev] and arom else 1
+            bonds.append((prev, index, order))
+        pending = None
+        prev = index
+
+    if stack:
+        raise ValueError("Unbalanced '(' in SMILES.")
+    if rings:
+        raise ValueError(f"Unclosed ring bond(s): {', '.join(sorted(rings))}")
+
+    orders = [[] for _ in symbols]
+    for i, j, order in bonds:
+        orders[i].append(order)
+        orders[j].append(order)
+    hcounts = [
+        explicit_h[i] if bracket[i] else _implicit_hydrogens(symbols[i], aromatic[i], orders[i])
+        for i in range(len(symbols))
+    ]
+    # 隐式氢按写出的键级计算之后再识别 Kekulé 芳香环
+    kekule, bonds = perceive_aromaticity(symbols, bonds)
+    aromatic = [a or k for a, k in zip(aromatic, kekule)]
+    return Molecule(symbols, aromatic, charges, hcounts, bonds)
@@ -0,0 +1,448 @@
+import sys
+import json
+import os
+import threading
+from functools import lru_cache
+
+import numpy as np
+
+from molecule import parse_smiles, AROMATIC_BOND, aromatic_distances, classify_substituent, is_carbonyl
+from processC_DEPR_NMR import interpret_dept_data, dept_tolerances
+
+def load_locales():
+    try:
+        if getattr(sys, 'frozen', False):
+            base_dir = os.path.dirname(sys.executable)
+        else:
+            base_dir = os.path.dirname(__file__)
+        path = os.path.join(base_dir, "locales.json")
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+    except Exception:
+        pass
+    return {}
+
+LOCALES = load_locales()
+
+def tr(key, lang='zh', *args):
+    lang_data = LOCALES.get(lang, {})
+    text = lang_data.get(key, key)
+    if args:
+        try:
+            return text.format(*args)
+        except:
+            return text
+    return text
+
+# 第一层环境码 -> 13C 位移 (ppm)
+# 环境码: "中心|邻居类别,..."，中心为 CH3（sp3 甲基）、C=O、CH=O 或 C#N；
+# 邻居类别与 molecule.classify_substituent 一致，按字母序排列
+C_ENVIRONMENTS = [
+    # 甲基
+    ("CH3|C#C", 3.5), ("CH3|C=C", 18.0), ("CH3|CHO", 31.0), ("CH3|CN", 1.8), ("CH3|COOH", 20.8),
+    ("CH3|COOR", 20.9), ("CH3|COR", 29.8), ("CH3|CONR2", 22.5), ("CH3|Br", 10.0), ("CH3|Cl", 25.6),
+    ("CH3|F", 75.0), ("CH3|I", -20.5), ("CH3|NCOR", 35.0), ("CH3|NO2", 62.5), ("CH3|NR2", 41.5),
+    ("CH3|OAr", 55.2), ("CH3|OCOR", 51.8), ("CH3|OH", 50.4), ("CH3|OR", 58.5), ("CH3|SO2", 44.0),
+    ("CH3|SR", 15.5), ("CH3|aryl", 21.3),
+    # 酮、醛
+    ("C=O|alkyl,alkyl", 208.0), ("C=O|alkyl,aryl", 197.5), ("C=O|aryl,aryl", 196.5),
+    ("C=O|C=C,alkyl", 199.0), ("C=O|C=C,aryl", 190.0), ("CH=O|alkyl", 202.0), ("CH=O|aryl", 192.0),
+    ("CH=O|C=C", 193.5), ("CH=O|OR", 161.0), ("CH=O|NR2", 162.5),
+    # 羧酸及其衍生物
+    ("C=O|OH,alkyl", 179.0), ("C=O|OH,aryl", 172.0), ("C=O|C=C,OH", 171.0),
+    ("C=O|OR,alkyl", 171.5), ("C=O|OR,aryl", 166.8), ("C=O|C=C,OR", 166.5), ("C=O|OAr,alkyl", 169.5),
+    ("C=O|NR2,alkyl", 172.5), ("C=O|NR2,aryl", 168.5), ("C=O|C=C,NR2", 166.0), ("C=O|NR2,NR2", 158.0),
+    ("C=O|NR2,OR", 156.5), ("C=O|OR,OR", 155.5), ("C=O|Cl,alkyl", 170.5), ("C=O|Cl,aryl", 168.0),
+    ("C=O|OCOR,alkyl", 167.0), ("C=O|OCOR,aryl", 162.5),
+    # 腈
+    ("C#N|alkyl", 119.5), ("C#N|aryl", 118.8), ("C#N|C=C", 117.5),
+]
+
+# sp3 碳：Grant-Paul 加和规则 -2.3 + 9.1 n_alpha + 9.4 n_beta - 2.5 n_gamma + 0.3 n_delta
+ALKANE_BASE = -2.3
+ALKANE_INCREMENTS = (9.1, 9.4, -2.5, 0.3)
+# 立体修正：(本碳的重原子邻居数, 相邻烷基碳的邻居数) -> ppm
+STERIC_CORRECTIONS = {
+    (1, 3): -1.1, (1, 4): -3.4, (2, 3): -2.5, (2, 4): -7.2, (3, 2): -3.7, (3, 3): -9.5,
+    (3, 4): -15.0, (4, 1): -1.5, (4, 2): -8.4, (4, 3): -15.0, (4, 4): -25.0,
+}
+# 官能团对烷基碳的 (alpha, beta, gamma) 增量
+ALKANE_GROUP_INCREMENTS = {
+    "C=C": (20.0, 6.0, -0.5), "C#C": (4.5, 5.5, -3.5), "aryl": (23.0, 9.0, -2.0),
+    "CHO": (31.0, 0.0, -2.0), "COR": (30.0, 1.0, -2.0), "COOH": (21.0, 3.0, -2.0),
+    "COOR": (20.0, 3.0, -2.0), "CONR2": (22.0, 2.5, -0.5), "CN": (4.0, 3.0, -3.0),
+    "OH": (48.0, 10.0, -5.0), "OR": (58.0, 8.0, -4.0), "OAr": (56.0, 7.0, -4.0),
+    "OCOR": (51.0, 6.0, -3.0), "NR2": (29.0, 11.0, -5.0), "NCOR": (28.0, 8.0, -4.0),
+    "NO2": (63.0, 4.0, -4.0), "SR": (20.0, 7.0, -3.0), "SO2": (38.0, 1.0, -3.0),
+    "F": (68.0, 9.0, -4.0), "Cl": (31.0, 11.0, -4.0), "Br": (20.0, 11.0, -3.0), "I": (-6.0, 11.0, -1.0),
+}
+# 芳环：苯 128.5 + 取代基 (ipso, ortho, meta, para) 增量
+BENZENE_BASE = 128.5
+AROMATIC_INCREMENTS = {
+    "alkyl": (9.3, 0.7, -0.1, -2.9), "C=C": (8.9, -2.3, -0.1, -0.8), "C#C": (-6.1, 3.8, 0.4, -0.2),
+    "aryl": (13.0, -1.1, 0.5, -1.0), "CHO": (8.2, 1.2, 0.5, 5.8), "COR": (8.9, 0.1, -0.1, 4.4),
+    "COOH": (2.1, 1.6, -0.1, 5.2), "COOR": (2.0, 1.2, -0.1, 4.3), "CONR2": (5.0, -1.2, 0.1, 3.4),
+    "CN": (-15.7, 3.6, 0.7, 4.3), "OH": (26.9, -12.8, 1.4, -7.4), "OR": (31.4, -14.4, 1.0, -7.7),
+    "OAr": (27.6, -11.2, -0.3, -6.9), "OCOR": (22.4, -7.1, 0.4, -3.2), "NR2": (18.2, -13.4, 0.8, -10.0),
+    "NCOR": (9.7, -8.1, 0.2, -4.4), "NO2": (19.9, -4.9, 0.9, 6.1), "SR": (10.2, -1.9, 0.4, -3.6),
+    "SO2": (12.3, -1.4, 0.8, 5.1), "F": (35.1, -14.3, 0.9, -4.5), "Cl": (6.4, 0.2, 1.0, -2.0),
+    "Br": (-5.4, 3.3, 2.2, -1.0), "I": (-32.2, 9.9, 2.6, -7.3),
+}
+# 吡啶按到 N 的距离；五元杂芳环 (alpha, beta)
+AZINE_BASE = {1: 149.9, 2: 123.8, 3: 135.9}
+FIVE_RING_BASE = {"O": (142.8, 109.7), "S": (125.4, 127.2), "N": (118.2, 108.0)}
+# 稠环：稠合碳本身 / 邻位 / 间位
+FUSED_SELF = 5.0
+FUSED_ORTHO = -0.5
+FUSED_META = -2.6
+# 烯碳：123.3 + 同碳 (alpha) / 另一端 (alpha') 取代基增量
+ALKENE_BASE = 123.3
+ALKENE_INCREMENTS = {
+    "alkyl": (10.6, -7.9), "aryl": (12.5, -11.0), "C=C": (13.6, -7.0), "C#C": (-6.0, 3.6),
+    "CHO": (15.3, 14.5), "COR": (13.8, 4.7), "COOH": (5.0, 9.8), "COOR": (6.3, 7.0),
+    "CONR2": (8.0, 5.0), "CN": (-15.1, 14.2), "OH": (29.0, -38.9), "OR": (29.0, -38.9),
+    "OAr": (28.0, -36.0), "OCOR": (18.4, -26.7), "NR2": (28.0, -32.0), "NCOR": (6.5, -20.0),
+    "NO2": (22.3, -0.9), "SR": (9.0, -13.0), "SO2": (14.3, 7.9), "F": (24.9, -34.3),
+    "Cl": (2.8, -6.1), "Br": (-8.6, -0.9), "I": (-38.1, 7.0),
+}
+# 烷基取代基上的 beta 碳：同碳一侧 / 另一端
+ALKENE_BETA = (7.2, -1.8)
+# 炔碳：(本碳 H 数, 另一端是否为 H) 的基准值，芳基取代另加修正
+ALKYNE_TERMINAL = 68.5
+ALKYNE_INTERNAL = 84.0
+ALKYNE_DISUBSTITUTED = 80.0
+ALKYNE_ARYL = 6.0
+IMINE_SHIFT = 160.0
+# 查不到环境码时的羰基兜底值
+CARBONYL_WITH_HETERO = 170.0
+CARBONYL_DEFAULT = 205.0
+
+# 打分：位移误差尺度 (ppm)、未配对碳的代价 (ppm)
+C_SHIFT_SCALE = 5.0
+UNMATCHED_COST = 15.0
+
+TYPE_NAMES = {3: "CH3", 2: "CH2", 1: "CH", 0: "Cq"}
+
+
+class EnvironmentTable:
+    """
+    环境码 -> 位移的紧凑查找表：码按字典序存为 numpy 字符串数组，查找用 searchsorted。
+    """
+
+    def __init__(self, entries):
+        codes = np.array([code for code, _ in entries])
+        order = np.argsort(codes, kind="stable")
+        self.codes = codes[order]
+        self.shifts = np.array([shift for _, shift in entries], dtype=np.float32)[order]
+
+    def __len__(self):
+        return self.codes.size
+
+    def lookup(self, code):
+        """返回环境码对应的位移，没有则返回 None。"""
+        k = int(np.searchsorted(self.codes, code))
+        if k < self.codes.size and self.codes[k] == code:
+            return float(self.shifts[k])
+        return None
+
+
+_environment_table = None
+_environment_lock = threading.Lock()
+
+
+def get_environment_table():
+    """C_ENVIRONMENTS 的查找表，首次使用时构建（线程安全）。"""
+    global _environment_table
+    if _environment_table is None:
+        with _environment_lock:
+            if _environment_table is None:
+                _environment_table = EnvironmentTable(C_ENVIRONMENTS)
+    return _environment_table
+
+
+def _alkane_key(mol, atom):
+    """沿烷基碳 BFS 统计 alpha..delta 烷基碳数、沿途官能团与立体修正所需的支化度。"""
+    carbons = [0, 0, 0, 0]
+    groups = []
+    steric = []
+    visited = {atom}
+    frontier = [atom]
+    for d in range(1, 5):
+        next_frontier = []
+        for a in frontier:
+            for b, _ in mol.neighbors[a]:
+                if b in visited:
+                    continue
+                visited.add(b)
+                cls = classify_substituent(mol, a, b)
+                if cls == "alkyl":
+                    carbons[d - 1] += 1
+                    next_frontier.append(b)
+                    if d == 1:
+                        steric.append(min(mol.degree(b), 4))
+                elif d <= 3:
+                    groups.append((d, cls))
+        frontier = next_frontier
+    return ("sp3", min(mol.degree(atom), 4), tuple(carbons), tuple(sorted(groups)), tuple(sorted(steric)))
+
+
+def environment_key(mol, atom):
+    """
+    碳原子的环境键：(环境码或 None, 加和规则所需的子结构描述)。
+    相同的键给出相同的预测，predict_from_key 按键缓存。
+    """
+    nbrs = mol.neighbors[atom]
+    n_h = mol.hcounts[atom]
+
+    if mol.aromatic[atom]:
+        ring_size = mol.ring_membership()[atom]
+        distances = aromatic_distances(mol, atom)
+        hetero, fused, substituents = [], [], []
+        for a, d in distances.items():
+            if d and mol.symbols[a] != "C":
+                hetero.append((d, mol.symbols[a]))
+            if sum(1 for _, order in mol.neighbors[a] if order == AROMATIC_BOND) >= 3 and d <= 2:
+                fused.append(d)
+            for b, order in mol.neighbors[a]:
+                if order != AROMATIC_BOND:
+                    substituents.append((d, classify_substituent(mol, a, b)))
+        return None, ("Ar", ring_size, tuple(sorted(hetero)), tuple(sorted(fused)), tuple(sorted(substituents)))
+
+    if is_carbonyl(mol, atom):
+        others = sorted(classify_substituent(mol, atom, j) for j, order in nbrs if order != 2)
+        center = "CH=O" if n_h else "C=O"
+        return f"{center}|{','.join(others)}", ("C=O", any(mol.symbols[j] in ("O", "N") for j, o in nbrs if o == 1))
+
+    for j, order in nbrs:
+        if order == 3 and mol.symbols[j] == "N":
+            others = sorted(classify_substituent(mol, atom, k) for k, o in nbrs if k != j)
+            return f"C#N|{','.join(others)}", ("C#N",)
+        if order == 3:
+            far = [k for k, _ in mol.neighbors[j] if k != atom]
+            aryl = any(mol.aromatic[k] for k, _ in nbrs if k != j)
+            return None, ("C#C", n_h, bool(far), aryl)
+        if order == 2 and mol.symbols[j] == "N":
+            return None, ("C=N",)
+        if order == 2 and mol.symbols[j] == "C":
+            gem = [k for k, _ in nbrs if k != j]
+            far = [k for k, _ in mol.neighbors[j] if k != atom]
+            gem_cls = tuple(sorted(classify_substituent(mol, atom, k) for k in gem))
+            far_cls = tuple(sorted(classify_substituent(mol, j, k) for k in far))
+            gem_beta = sum(mol.degree(k) - 1 for k in gem if classify_substituent(mol, atom, k) == "alkyl")
+            far_beta = sum(mol.degree(k) - 1 for k in far if classify_substituent(mol, j, k) == "alkyl")
+            return None, ("C=C", gem_cls, far_cls, gem_beta, far_beta)
+
+    code = None
+    if n_h == 3 and len(nbrs) == 1:
+        code = f"CH3|{classify_substituent(mol, atom, nbrs[0][0])}"
+    return code, _alkane_key(mol, atom)
+
+
+@lru_cache(maxsize=8192)
+def predict_from_key(key):
+    """按环境键预测位移：先查环境码表，查不到再用加和规则。"""
+    code, detail = key
+    if code is not None:
+        shift = get_environment_table().lookup(code)
+        if shift is not None:
+            return shift
+
+    kind = detail[0]
+    if kind == "C=O":
+        return CARBONYL_WITH_HETERO if detail[1] else CARBONYL_DEFAULT
+    if kind == "C#N":
+        return 119.0
+    if kind == "C=N":
+        return IMINE_SHIFT
+    if kind == "C#C":
+        _, n_h, far_substituted, aryl = detail
+        if n_h:
+            shift = ALKYNE_TERMINAL
+        else:
+            shift = ALKYNE_DISUBSTITUTED if far_substituted else ALKYNE_INTERNAL
+        return shift + (ALKYNE_ARYL if aryl else 0.0)
+    if kind == "C=C":
+        _, gem, far, gem_beta, far_beta = detail
+        shift = ALKENE_BASE
+        shift += sum(ALKENE_INCREMENTS.get(s, (0.0, 0.0))[0] for s in gem)
+        shift += sum(ALKENE_INCREMENTS.get(s, (0.0, 0.0))[1] for s in far)
+        shift += ALKENE_BETA[0] * gem_beta + ALKENE_BETA[1] * far_beta
+        return shift
+    if kind == "Ar":
+        _, ring_size, hetero, fused, substituents = detail
+        if ring_size == 5 and hetero:
+            d, element = hetero[0]
+            alpha, beta = FIVE_RING_BASE.get(element, FIVE_RING_BASE["N"])
+            shift = alpha if d == 1 else beta
+        elif hetero:
+            shift = AZINE_BASE.get(hetero[0][0], BENZENE_BASE)
+        else:
+            shift = BENZENE_BASE
+        # 只计最近的稠合碳
+        if fused:
+            shift += (FUSED_SELF, FUSED_ORTHO, FUSED_META)[fused[0]]
+        shift += sum(AROMATIC_INCREMENTS.get(s, (0.0, 0.0, 0.0, 0.0))[d] for d, s in substituents if d <= 3)
+        return shift
+
+    _, degree, carbons, groups, steric = detail
+    shift = ALKANE_BASE + sum(n * z for n, z in zip(carbons, ALKANE_INCREMENTS))
+    shift += sum(ALKANE_GROUP_INCREMENTS.get(s, (0.0, 0.0, 0.0))[d - 1] for d, s in groups)
+    shift += sum(STERIC_CORRECTIONS.get((degree, n), 0.0) for n in steric)
+    return shift
+
+
+def predict_c_shifts(mol):
+    """
+    预测每个拓扑等价碳的 13C 位移与 DEPT 类型。
+
+    返回 list of [shift, type_code, count]（与 interpret_dept_data 的输出格式相同），按位移升序。
+    """
+    classes = mol.symmetry_classes()
+    groups = {}
+    for atom, c in enumerate(classes):
+        if mol.symbols[atom] == "C":
+            groups.setdefault(c, []).append(atom)
+    predicted = []
+    for atoms in groups.values():
+        atom = atoms[0]
+        shift = predict_from_key(environment_key(mol, atom))
+        predicted.append([round(float(shift), 1), min(mol.hcounts[atom], 3), len(atoms)])
+    predicted.sort(key=lambda p: p[0])
+    return predicted
+
+
+@lru_cache(maxsize=4096)
+def _predict_smiles(smiles):
+    return tuple(tuple(p) for p in predict_c_shifts(parse_smiles(smiles)))
+
+
+def predict_smiles(smiles):
+    """SMILES -> [[shift, type_code, count], ...]，同一 SMILES 的结果会被缓存。"""
+    return [list(p) for p in _predict_smiles(smiles.strip())]
+
+
+def _count_value(count):
+    """BB 峰数可能是 ">1" 之类的字符串，按至少 2 个碳处理。"""
+    try:
+        return max(int(count), 1)
+    except (TypeError, ValueError):
+        return 2
+
+
+def _align(pred, obs):
+    """两个升序位移序列的保序最小代价配对（未配对的一方代价为 UNMATCHED_COST）。"""
+    n, m = len(pred), len(obs)
+    cost = np.full((n + 1, m + 1), np.inf)
+    cost[0, :] = UNMATCHED_COST * np.arange(m + 1)
+    cost[:, 0] = UNMATCHED_COST * np.arange(n + 1)
+    diff = np.abs(np.subtract.outer(pred, obs))
+    for i in range(1, n + 1):
+        for j in range(1, m + 1):
+            cost[i, j] = min(cost[i - 1, j - 1] + diff[i - 1, j - 1],
+                             cost[i - 1, j] + UNMATCHED_COST, cost[i, j - 1] + UNMATCHED_COST)
+    pairs = []
+    i, j = n, m
+    while i and j:
+        if cost[i, j] == cost[i - 1, j - 1] + diff[i - 1, j - 1]:
+            pairs.append((i - 1, j - 1))
+            i, j = i - 1, j - 1
+        elif cost[i, j] == cost[i - 1, j] + UNMATCHED_COST:
+            i -= 1
+        else:
+            j -= 1
+    return pairs[::-1]
+
+
+def score_c_prediction(predicted, resolved):
+    """
+    预测 [shift, type_code, count] 与 interpret_dept_data 结果的差异打分。
+
+    同一 DEPT 类型内按位移保序配对；类型不同的峰不配对。
+    返回 dict: cost (越小越好), score (0-1), shift_error (ppm), unmatched (未配对的信号比例),
+    carbon_error (总碳数偏差比例)。
+    """
+    matched_error, matched, unmatched = 0.0, 0, 0
+    for t in (0, 1, 2, 3):
+        pred = [p[0] for p in predicted if p[1] == t]
+        obs = sorted(float(r[0]) for r in resolved if r[1] == t)
+        pairs = _align(np.array(pred), np.array(obs)) if pred and obs else []
+        matched += len(pairs)
+        matched_error += sum(abs(pred[i] - obs[j]) for i, j in pairs)
+        unmatched += len(pred) + len(obs) - 2 * len(pairs)
+
+    total = len(predicted) + len(resolved)
+    shift_error = matched_error / matched if matched else UNMATCHED_COST
+    unmatched_frac = unmatched / total if total else 1.0
+    n_pred = sum(p[2] for p in predicted)
+    n_obs = sum(_count_value(r[2]) for r in resolved)
+    carbon_error = abs(n_pred - n_obs) / max(n_pred, n_obs, 1)
+
+    cost = shift_error / C_SHIFT_SCALE + unmatched_frac + carbon_error
+    return {
+        "cost": float(cost),
+        "score": float(np.exp(-cost)),
+        "shift_error": float(shift_error),
+        "unmatched": float(unmatched_frac),
+        "carbon_error": float(carbon_error),
+    }
+
+
+def rank_c_candidates(candidates, resolved):
+    """
+    对候选结构 (SMILES 列表) 预测 13C 并与 resolved 打分，按 cost 升序返回。
+
+    每项为 dict: smiles, predicted 与 score_c_prediction 的各项；
+    无法解析的 SMILES 保留在末尾并带 error 字段。
+    """
+    ranked, failed = [], []
+    for smiles in candidates:
+        try:
+            predicted = predict_smiles(smiles)
+        except ValueError as e:
+            failed.append({"smiles": smiles, "error": str(e), "cost": np.inf, "score": 0.0})
+            continue
+        result = {"smiles": smiles, "predicted": predicted}
+        result.update(score_c_prediction(predicted, resolved))
+        ranked.append(result)
+    ranked.sort(key=lambda r: r["cost"])
+    return ranked + failed
+
+
+def format_c_prediction(predicted):
+    """[[shift, type_code, count], ...] -> '14.1 (CH3), 60.3 (CH2), 128.5 (CH x2)'"""
+    return ", ".join(
+        f"{shift:.1f} ({TYPE_NAMES.get(t, '?')}{' x' + str(n) if n > 1 else ''})" for shift, t, n in predicted
+    )
+
+
+def processC_NMRCandidates(candidates, data, lang='zh'):
+    """
+    与 processC_DEPR_NMR 风格一致：data 为 c_nmr 字典 (bb/dept90/dept135)，
+    打印候选结构按 13C/DEPT 吻合度的排序。
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Input data must be a dictionary with keys 'bb', 'dept90', 'dept135'.")
+    resolved = interpret_dept_data(data.get('bb', []), data.get('dept90', []), data.get('dept135', []),
+                                   **dept_tolerances(data))
+    ranked = rank_c_candidates(candidates, resolved)
+    lines = [tr("cnmr_candidate_title", lang, len(ranked))]
+    for k, r in enumerate(ranked, 1):
+        if "error" in r:
+            lines.append(tr("cnmr_candidate_invalid", lang, k, r["smiles"], r["error"]))
+            continue
+        lines.append(tr("cnmr_candidate_line", lang, k, r["smiles"], r["score"], r["shift_error"],
+                        r["unmatched"] * 100))
+        lines.append(tr("cnmr_candidate_predicted", lang, format_c_prediction(r["predicted"])))
+    result_text = "\n".join(lines)
+    print(result_text)
+    return result_text
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("用法: python predictC_NMR.py <输入 JSON (含 c_nmr)> <SMILES> [SMILES ...]")
+        sys.exit(1)
+    with open(sys.argv[1], "r", encoding="utf-8") as f:
+        data = json.load(f)
+    processC_NMRCandidates(sys.argv[2:], data["c_nmr"])
@@ -2,6 +2,8 @@ import sys
 import json
 import os
 
+import numpy as np
+
 def load_locales():
     try:
         if getattr(sys, 'frozen', False):
@@ -58,7 +60,94 @@ def analyze_c_nmr(peaks):
     return findings
 
 
-def interpret_dept_data(bb_peaks, dept90_shifts, dept135_peaks, tolerance=1.0):
+# BB 与 DEPT 峰配对的默认容差 (ppm)，与原先的 tolerance=1.0 一致；可按实验分别指定（如收窄）
+DEFAULT_DEPT90_TOLERANCE = 1.0
+DEFAULT_DEPT135_TOLERANCE = 1.0
+# 与最优配对的偏差相差不足该值 (ppm) 的竞争峰视为歧义
+AMBIGUITY_MARGIN = 0.2
+
+
+def match_peaks(reference, query, tolerance, margin=AMBIGUITY_MARGIN):
+    """
+    把升序的 reference 位移与升序的 query 位移做一对一配对。
+
+    先用 searchsorted 取出容差内的全部候选对，再在两个升序数组上做保序动态规划：
+    优先让配对数最多，其次让总偏差最小。一维位移上总存在不交叉的最优配对，
+    所以保序 DP 得到的就是最大一对一配对（贪心按偏差先取会把邻峰“抢走”），复杂度 O(n * m)。
+
+    返回 (partner, ambiguous)：partner[i] 为 reference[i] 配到的 query 下标（无则为 -1）；
+    ambiguous[i] 为 True 表示存在偏差相近（差值小于 margin）的竞争配对。
+    """
+    ref = np.asarray(reference, dtype=np.float64)
+    q = np.asarray(query, dtype=np.float64)
+    partner = np.full(ref.size, -1, dtype=np.intp)
+    ambiguous = np.zeros(ref.size, dtype=bool)
+    if ref.size == 0 or q.size == 0:
+        return partner, ambiguous
+
+    lo = np.searchsorted(q, ref - tolerance, side="left")
+    hi = np.searchsorted(q, ref + tolerance, side="right")
+    n_cand = hi - lo
+    total = int(n_cand.sum())
+    if total == 0:
+        return partner, ambiguous
+    i = np.repeat(np.arange(ref.size), n_cand)
+    j = np.arange(total) - np.repeat(np.cumsum(n_cand) - n_cand, n_cand) + np.repeat(lo, n_cand)
+    diff = np.abs(ref[i] - q[j])
+
+    # score[a][b] = 只用 ref[:a] 与 q[:b] 时的 (配对数, -总偏差)，取字典序最大
+    n, m = ref.size, q.size
+    lo_list, hi_list = lo.tolist(), hi.tolist()
+    ref_list, q_list = ref.tolist(), q.tolist()
+    score = [[(0, 0.0)] * (m + 1) for _ in range(n + 1)]
+    for a in range(1, n + 1):
+        row, prev = score[a], score[a - 1]
+        for b in range(1, m + 1):
+            cell = max(prev[b], row[b - 1])
+            if lo_list[a - 1] <= b - 1 < hi_list[a - 1]:
+                count, cost = prev[b - 1]
+                cell = max(cell, (count + 1, cost - abs(ref_list[a - 1] - q_list[b - 1])))
+            row[b] = cell
+
+    owner = np.full(q.size, -1, dtype=np.intp)
+    best = np.full(ref.size, np.inf)
+    a, b = n, m
+    while a > 0 and b > 0:
+        if score[a][b] == score[a - 1][b]:
+            a -= 1
+        elif score[a][b] == score[a][b - 1]:
+            b -= 1
+        else:
+            partner[a - 1] = b - 1
+            owner[b - 1] = a - 1
+            best[a - 1] = abs(ref_list[a - 1] - q_list[b - 1])
+            a -= 1
+            b -= 1
+
+    # 未被采用的候选对若与某一方的最优配对偏差相近，则双方都标为歧义
+    for a, b, d in zip(i.tolist(), j.tolist(), diff.tolist()):
+        if partner[a] == b:
+            continue
+        if partner[a] >= 0 and d - best[a] < margin:
+            ambiguous[a] = True
+        rival = owner[b]
+        if rival >= 0 and rival != a and d - best[rival] < margin:
+            ambiguous[rival] = True
+            ambiguous[a] = True
+    return partner, ambiguous
+
+
+def dept_tolerances(data):
+    """c_nmr 字典中按实验给出的配对容差 (dept90_tolerance / dept135_tolerance)，作为 interpret_dept_data 的关键字参数。"""
+    return {
+        "tolerance_90": float(data.get('dept90_tolerance', DEFAULT_DEPT90_TOLERANCE)),
+        "tolerance_135": float(data.get('dept135_tolerance', DEFAULT_DEPT135_TOLERANCE)),
+    }
+
+
+def interpret_dept_data(bb_peaks, dept90_shifts, dept135_peaks, tolerance=None,
+                        tolerance_90=DEFAULT_DEPT90_TOLERANCE, tolerance_135=DEFAULT_DEPT135_TOLERANCE,
+                        return_report=False):
     """
     解析 13C/DEPT 原始数据（新版输入格式），推断碳类型并保留峰数。
 
@@ -66,12 +155,20 @@ def interpret_dept_data(bb_peaks, dept90_shifts, dept135_peaks, tolerance=1.0):
     - bb_peaks: list of [shift, count]，count 可以是整数或字符串（如 ">1"）。
     - dept90_shifts: list of shift（仅列表，表示该位移在 DEPT-90 上出现）
     - dept135_peaks: list of [shift, polarity]，polarity 为 1 或 -1。
+    - tolerance_90 / tolerance_135: 各实验与 BB 配对的容差；给出 tolerance 时两者都用它。
+    - return_report: 为 True 时额外返回配对报告。
+
+    每个 DEPT 峰最多配给一个 BB 峰（一对一），见 match_peaks。
 
     返回:
     - list of [shift, type_code, count]
       type_code: 3=CH3, 2=CH2, 1=CH, 0=Cq
+    - return_report 时返回 (resolved, report)，report 为 dict:
+      "ambiguous": [(shift, "dept90"/"dept135"), ...] 配对存在歧义的 BB 峰，
+      "unmatched": {"dept90": [shift, ...], "dept135": [shift, ...]} 没有 BB 对应的 DEPT 峰。
     """
-    resolved = []
+    if tolerance is not None:
+        tolerance_90 = tolerance_135 = tolerance
 
     # 标准化并排序 bb_peaks
     norm_bb = []
@@ -92,51 +189,52 @@ def interpret_dept_data(bb_peaks, dept90_shifts, dept135_peaks, tolerance=1.0):
 
     norm_bb = sorted(norm_bb, key=lambda x: x[0])
 
-    # 便于匹配的 dept90 set（只要有位移就视为存在）
-    dept90_set = [float(s) for s in dept90_shifts] if dept90_shifts is not None else []
+    # dept90 只要有位移就视为存在
+    dept90 = sorted(float(s) for s in dept90_shifts) if dept90_shifts is not None else []
 
     # dept135 标准化为 (shift, polarity)
     norm_135 = []
-    for item in dept135_peaks:
+    for item in dept135_peaks or []:
         try:
             s = float(item[0])
             p = int(item[1])
             norm_135.append((s, p))
         except Exception:
             continue
+    norm_135.sort(key=lambda x: x[0])
+
+    bb_shifts = [s for s, _ in norm_bb]
+    partner90, ambiguous90 = match_peaks(bb_shifts, dept90, tolerance_90)
+    partner135, ambiguous135 = match_peaks(bb_shifts, [s for s, _ in norm_135], tolerance_135)
 
-    for shift_bb, count_val in norm_bb:
-        # 寻找是否在 DEPT-90 存在（按容差匹配）
-        found90 = False
-        for s in dept90_set:
-            if abs(s - shift_bb) <= tolerance:
-                found90 = True
-                break
-
-        # 寻找 DEPT-135 对应峰及其极性
-        found135_pol = 0
-        min_diff = float('inf')
-        for s, p in norm_135:
-            diff = abs(s - shift_bb)
-            if diff <= tolerance and diff < min_diff:
-                min_diff = diff
-                found135_pol = p
-
-        # 根据 DEPT 规则推断类型
-        # 优先 DEPT-90 为 CH
-        if found90:
+    resolved = []
+    for k, (shift_bb, count_val) in enumerate(norm_bb):
+        # 根据 DEPT 规则推断类型，优先 DEPT-90 为 CH
+        found135_pol = norm_135[partner135[k]][1] if partner135[k] >= 0 else 0
+        if partner90[k] >= 0:
             type_code = 1  # CH
+        elif found135_pol == -1:
+            type_code = 2  # CH2
+        elif found135_pol == 1:
+            type_code = 3  # CH3
         else:
-            if found135_pol == -1:
-                type_code = 2  # CH2
-            elif found135_pol == 1:
-                type_code = 3  # CH3
-            else:
-                type_code = 0  # Cq
+            type_code = 0  # Cq
 
         resolved.append([shift_bb, type_code, count_val])
 
-    return resolved
+    if not return_report:
+        return resolved
+
+    used90, used135 = set(partner90.tolist()), set(partner135.tolist())
+    report = {
+        "ambiguous": sorted([(bb_shifts[k], "dept90") for k in np.flatnonzero(ambiguous90)]
+                            + [(bb_shifts[k], "dept135") for k in np.flatnonzero(ambiguous135)]),
+        "unmatched": {
+            "dept90": [s for k, s in enumerate(dept90) if k not in used90],
+            "dept135": [s for k, (s, _) in enumerate(norm_135) if k not in used135],
+        },
+    }
+    return resolved, report
 
 
 def processC_DEPR_NMR(data, lang='zh'):
@@ -154,9 +252,9 @@ def processC_DEPR_NMR(data, lang='zh'):
     bb = data.get('bb', [])
     dept90 = data.get('dept90', [])
     dept135 = data.get('dept135', [])
-    
+
     # 解析数据
-    peaks_resolved = interpret_dept_data(bb, dept90, dept135)
+    peaks_resolved, report = interpret_dept_data(bb, dept90, dept135, return_report=True, **dept_tolerances(data))
     
     # 构建返回字符串
     type_map = {3: 'CH3', 2: 'CH2', 1: 'CH', 0: 'Cq'}
@@ -171,6 +269,15 @@ def processC_DEPR_NMR(data, lang='zh'):
         result_lines.append(line)
         peaks_for_analysis.append((shift, type_str))
 
+    # 配对歧义与无 BB 对应的 DEPT 峰一并写入证据链
+    experiment_names = {"dept90": "DEPT-90", "dept135": "DEPT-135"}
+    for shift, experiment in report["ambiguous"]:
+        result_lines.append(tr("cnmr_ambiguous_line", lang, shift, experiment_names[experiment]))
+    for experiment, shifts in report["unmatched"].items():
+        if shifts:
+            result_lines.append(tr("cnmr_unmatched_line", lang, experiment_names[experiment],
+                                   ", ".join(str(s) for s in shifts)))
+
     # 运行现有的化学位移到基团的分析并打印
     results = analyze_c_nmr(peaks_for_analysis)
 
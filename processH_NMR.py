@@ -2,6 +2,10 @@ import sys
 import json
 import os
 
+import numpy as np
+
+from intervalIndex import IntervalIndex
+
 def load_locales():
     try:
         if getattr(sys, 'frozen', False):
@@ -29,6 +33,8 @@ def tr(key, lang='zh', *args):
     return text
 
 # 常见 H-NMR 化学位移范围 (ppm)
+# 格式: (min, max, description[, singlet_only])
+#   singlet_only 为 True 的可交换质子 (OH/NH) 只归属给单峰，避免到处匹配
 COMMON_SHIFTS = [
     (0.5, 2.0, "Alkyl C-H (R-CH3, R-CH2-R, R3CH)"),
     (2.0, 2.5, "Alpha to Carbonyl (H-C-C=O) or Benzylic (Ar-C-H)"),
@@ -37,8 +43,115 @@ COMMON_SHIFTS = [
     (6.5, 8.5, "Aromatic (Ar-H)"),
     (9.0, 10.0, "Aldehyde (CHO)"),
     (10.0, 13.0, "Carboxylic Acid (COOH) or Phenol (Ar-OH)"),
+    # 细分环境
+    (-0.2, 0.3, "Si-CH3 (Silyl methyl)"),
+    (0.8, 1.0, "Terminal CH3 (CH3-C)"),
+    (1.2, 1.4, "Chain CH2 or (CH3)2CH- / (CH3)3C- methyl"),
+    (1.4, 1.8, "Alkyl methine (R3C-H)"),
+    (1.6, 1.9, "Allylic (C=C-C-H)"),
+    (1.9, 2.1, "Acetyl/Acetate CH3 (CH3-C(=O)O)"),
+    (2.0, 3.1, "Terminal alkyne (C≡C-H)"),
+    (2.1, 2.6, "Ketone alpha (H-C-C=O)"),
+    (2.2, 2.5, "Benzylic (Ar-CH3, Ar-CH2)"),
+    (2.2, 2.9, "Amine alpha (H-C-N)"),
+    (2.8, 3.2, "Benzylic methine (Ar-CH, e.g. isopropyl on ring)"),
+    (3.2, 3.6, "Halide alpha (H-C-Cl, H-C-Br)"),
+    (3.3, 4.0, "Alcohol/Ether alpha (H-C-O)"),
+    (3.6, 3.9, "Methoxy (CH3-O)"),
+    (3.7, 4.4, "Ester alkoxy (H-C-O-C=O) or Aryl ether (Ar-O-CH)"),
+    (4.2, 4.6, "Nitroalkane alpha (H-C-NO2)"),
+    (0.5, 5.0, "Alcohol O-H (exchangeable, often broad singlet)", True),
+    (4.0, 7.5, "Phenol O-H (exchangeable, often broad singlet)", True),
+    (0.5, 3.5, "Amine N-H (exchangeable)", True),
+    (5.5, 8.5, "Amide N-H", True),
+    (4.6, 5.0, "Terminal vinylic (=CH2)"),
+    (5.0, 6.0, "Internal vinylic (-CH=CH-)"),
+    (6.0, 7.0, "Aromatic H shielded by OH/OR/NH2 (ortho/para)"),
+    (7.0, 7.5, "Aromatic H (benzene-like)"),
+    (7.5, 8.3, "Aromatic H deshielded by C=O/NO2/CN"),
+    (8.0, 8.2, "Formate (H-C(=O)O)"),
+    (8.4, 8.8, "Heteroaromatic alpha-H (Pyridine)"),
+    (9.5, 10.5, "Aromatic aldehyde (Ar-CHO)"),
 ]
 
+# 积分换算：最小峰最多对应几个 H、允许的相对取整误差
+MAX_PROTONS_IN_SMALLEST = 9
+INTEGRAL_TOLERANCE = 0.15
+
+
+_shift_index = None
+
+
+def get_shift_index():
+    """COMMON_SHIFTS 的区间索引，首次使用时构建。"""
+    global _shift_index
+    if _shift_index is None:
+        _shift_index = IntervalIndex(COMMON_SHIFTS)
+    return _shift_index
+
+
+def parse_area(area):
+    """把积分面积转为 float；"N/A"、空值或 NaN 返回 None。"""
+    try:
+        value = float(area)
+    except (TypeError, ValueError):
+        return None
+    if value != value or value <= 0:
+        return None
+    return value
+
+
+def estimate_proton_counts(areas, total_h=None, tolerance=INTEGRAL_TOLERANCE):
+    """
+    把积分面积换算为整数 H 数。
+
+    - 给出 total_h（如由分子式得到）时，按总面积等比例分配并修正取整误差。
+    - 否则假设最小峰对应 k 个 H (k = 1..MAX_PROTONS_IN_SMALLEST)，一次性算出所有 k
+      下各峰的比值，取第一个使全部比值都接近整数的 k。
+
+    返回 (counts, total, unit)：counts 与 areas 等长，缺失的面积对应 None；
+    没有可用面积时 total 与 unit 为 None。
+    """
+    values = [parse_area(a) for a in areas]
+    known = [k for k, v in enumerate(values) if v is not None]
+    counts = [None] * len(values)
+    if not known:
+        return counts, None, None
+    a = np.array([values[k] for k in known])
+
+    if total_h:
+        unit = a.sum() / total_h
+        exact = a / unit
+        rounded = np.floor(exact).astype(int)
+        # 最大余数法，保证总数等于 total_h
+        remainder = int(total_h) - rounded.sum()
+        if remainder > 0:
+            rounded[np.argsort(-(exact - rounded))[:remainder]] += 1
+        rounded = np.maximum(rounded, 1)
+        # 小峰至少记 1 H 后总数可能超过 total_h：依次从取整后偏高最多（且多于 1 H）的峰扣回
+        excess = int(rounded.sum()) - int(total_h)
+        while excess > 0:
+            over = np.where(rounded > 1, rounded - exact, -np.inf)
+            k = int(np.argmax(over))
+            if over[k] == -np.inf:
+                break
+            rounded[k] -= 1
+            excess -= 1
+    else:
+        k = np.arange(1, MAX_PROTONS_IN_SMALLEST + 1)
+        units = a.min() / k
+        ratios = a[None, :] / units[:, None]
+        error = np.abs(ratios - np.rint(ratios)) / np.maximum(np.rint(ratios), 1)
+        worst = error.max(axis=1)
+        good = np.flatnonzero(worst <= tolerance)
+        best = good[0] if good.size else int(np.argmin(worst))
+        unit = units[best]
+        rounded = np.rint(ratios[best]).astype(int)
+
+    for k, c in zip(known, rounded):
+        counts[k] = int(c)
+    return counts, int(rounded.sum()), float(unit)
+
 
 def get_multiplicity_desc(n):
     """根据重峰数返回描述"""
@@ -61,16 +174,27 @@ def get_multiplicity_desc(n):
     return "Unknown"
 
 
-def analyze_h_nmr(peaks):
-    """分析 H-NMR 数据: peaks 为 (shift, area, multiplicity) 列表"""
-    findings = []
+def analyze_h_nmr(peaks, total_h=None, return_total=False):
+    """
+    分析 H-NMR 数据: peaks 为 (shift, area, multiplicity) 列表。
+
+    全部位移一次性在 COMMON_SHIFTS 的区间索引中查找，积分换算为整数 H 数。
+    返回 findings，每项为 dict: shift, area, h_count, mult, mult_desc, groups；
+    return_total 时返回 (findings, total)，total 为估计的总 H 数（无积分时为 None）。
+    """
     peaks = sorted(peaks, key=lambda x: x[0])
+    index = get_shift_index()
+    offsets, hits = index.query([p[0] for p in peaks])
+    offsets, hits = offsets.tolist(), hits.tolist()
+    counts, total, _ = estimate_proton_counts([p[1] for p in peaks], total_h=total_h)
+    findings = []
 
-    for shift, area, mult in peaks:
-        possible_groups = []
-        for min_s, max_s, desc in COMMON_SHIFTS:
-            if min_s <= shift <= max_s:
-                possible_groups.append(desc)
+    for k, (shift, area, mult) in enumerate(peaks):
+        possible_groups = [
+            index.table[i][2]
+            for i in hits[offsets[k]:offsets[k + 1]]
+            if mult == 1 or len(index.table[i]) < 4 or not index.table[i][3]
+        ]
 
         if not possible_groups:
             possible_groups.append("Unknown Region")
@@ -79,16 +203,23 @@ def analyze_h_nmr(peaks):
             {
                 "shift": shift,
                 "area": area,
+                "h_count": counts[k],
                 "mult": mult,
                 "mult_desc": get_multiplicity_desc(mult),
                 "groups": possible_groups,
             }
         )
+    if return_total:
+        return findings, total
     return findings
 
 
-def processH_NMR(peaks, lang='zh'):
-    """与 processMASS/processIR 风格一致的 H-NMR 处理函数。"""
+def processH_NMR(peaks, lang='zh', total_h=None, output="text"):
+    """
+    与 processMASS/processIR 风格一致的 H-NMR 处理函数。
+
+    output="records" 时返回 {"total_h": ..., "peaks": findings}。
+    """
     # 基本断言检查
     for p in peaks:
         assert isinstance(p, (list, tuple)) and len(p) == 3, "Each peak must be (shift, area, multiplicity)."
@@ -96,12 +227,21 @@ def processH_NMR(peaks, lang='zh'):
         assert isinstance(shift, (int, float)), "Shift must be numeric."
         assert isinstance(mult, int), "Multiplicity must be integer."
 
-    results = analyze_h_nmr(peaks)
+    results, total = analyze_h_nmr(peaks, total_h=total_h, return_total=True)
+    if output == "records":
+        return {"total_h": total, "peaks": results}
+    if output != "text":
+        raise ValueError("output must be 'text' or 'records'.")
 
     # 构造输出字符串
     lines = [tr("hnmr_result_title", lang, len(results))]
+    if total is not None:
+        lines.append(tr("hnmr_total_h", lang, total))
     for res in results:
-        header = tr("hnmr_peak_line", lang, res['shift'], res['area'], res['mult_desc'])
+        if res["h_count"] is not None:
+            header = tr("hnmr_peak_line_h", lang, res['shift'], res['area'], res['h_count'], res['mult_desc'])
+        else:
+            header = tr("hnmr_peak_line", lang, res['shift'], res['area'], res['mult_desc'])
         group_lines = [tr("hnmr_possible_line", lang, g) for g in res["groups"]]
         lines.append("\n".join([header] + group_lines))
 
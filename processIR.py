@@ -2,6 +2,8 @@ import sys
 import json
 import os
 
+from intervalIndex import IntervalIndex
+
 def load_locales():
     try:
         if getattr(sys, 'frozen', False):
@@ -29,34 +31,108 @@ def tr(key, lang='zh', *args):
     return text
 
 # 常见红外吸收峰范围 (单位: cm^-1)
-# 格式: (min, max, description)
+# 格式: (min, max, description, intensity, shape)
+#   intensity: "s" 强, "m" 中, "w" 弱, "v" 可变, "" 不标注
+#   shape: "broad" 宽峰, "sharp" 尖峰, "" 不标注
 COMMON_IR_PEAKS = [
-    (3200, 3650, "O-H stretch (Alcohol, Phenol) - Broad"),
-    (3300, 3500, "N-H stretch (Amine, Amide)"),
-    (3000, 3100, "C-H stretch (Alkene, Aromatic)"),
-    (2850, 3000, "C-H stretch (Alkane)"),
-    (2500, 3000, "O-H stretch (Carboxylic Acid) - Very Broad"),
-    (2100, 2260, "C≡C (Alkyne) or C≡N (Nitrile)"),
-    (1670, 1780, "C=O stretch (Carbonyl: Ketone, Aldehyde, Ester, Acid)"),
-    (1600, 1680, "C=C stretch (Alkene)"),
-    (1450, 1600, "C=C stretch (Aromatic Ring)"),
-    (1350, 1550, "N-O stretch (Nitro)"),
-    (1000, 1300, "C-O stretch (Alcohol, Ether, Ester, Acid)"),
-    (675, 1000, "C-H bend (Aromatic - out of plane)"),
-    (600, 800, "C-Cl stretch (Alkyl Halide)"),
+    (3200, 3650, "O-H stretch (Alcohol, Phenol)", "s", "broad"),
+    (3300, 3500, "N-H stretch (Amine, Amide)", "m", ""),
+    (3000, 3100, "C-H stretch (Alkene, Aromatic)", "m", ""),
+    (2850, 3000, "C-H stretch (Alkane)", "s", ""),
+    (2500, 3000, "O-H stretch (Carboxylic Acid)", "m", "broad"),
+    (2100, 2260, "C≡C (Alkyne) or C≡N (Nitrile)", "v", "sharp"),
+    (1670, 1780, "C=O stretch (Carbonyl: Ketone, Aldehyde, Ester, Acid)", "s", "sharp"),
+    (1600, 1680, "C=C stretch (Alkene)", "v", ""),
+    (1450, 1600, "C=C stretch (Aromatic Ring)", "m", "sharp"),
+    (1350, 1550, "N-O stretch (Nitro)", "s", ""),
+    (1000, 1300, "C-O stretch (Alcohol, Ether, Ester, Acid)", "s", ""),
+    (675, 1000, "C-H bend (Aromatic - out of plane)", "s", ""),
+    (600, 800, "C-Cl stretch (Alkyl Halide)", "s", ""),
+    # 细分条目
+    (3580, 3650, "O-H stretch (Free, non-H-bonded)", "m", "sharp"),
+    (3260, 3330, "≡C-H stretch (Terminal Alkyne)", "s", "sharp"),
+    (3150, 3350, "N-H stretch (Amide, H-bonded)", "m", "broad"),
+    (2695, 2830, "C-H stretch (Aldehyde, Fermi doublet)", "m", "sharp"),
+    (2550, 2600, "S-H stretch (Thiol)", "w", "sharp"),
+    (2210, 2260, "C≡N stretch (Nitrile)", "m", "sharp"),
+    (2240, 2275, "N=C=O stretch (Isocyanate)", "s", "broad"),
+    (1800, 1830, "C=O stretch (Anhydride, high band)", "s", "sharp"),
+    (1785, 1815, "C=O stretch (Acid Chloride)", "s", "sharp"),
+    (1735, 1750, "C=O stretch (Ester)", "s", "sharp"),
+    (1720, 1740, "C=O stretch (Aldehyde)", "s", "sharp"),
+    (1705, 1725, "C=O stretch (Ketone)", "s", "sharp"),
+    (1700, 1725, "C=O stretch (Carboxylic Acid, dimer)", "s", "broad"),
+    (1630, 1690, "C=O stretch (Amide I)", "s", ""),
+    (1510, 1580, "N-H bend (Amide II)", "m", ""),
+    (1580, 1650, "N-H bend (Primary Amine)", "m", ""),
+    (1500, 1550, "N-O asymmetric stretch (Nitro)", "s", "sharp"),
+    (1340, 1380, "N-O symmetric stretch (Nitro)", "s", "sharp"),
+    (1370, 1385, "C-H bend (gem-Dimethyl / Isopropyl doublet)", "m", "sharp"),
+    (1440, 1470, "C-H bend (CH2 scissoring, CH3 asymmetric)", "m", ""),
+    (1300, 1350, "S=O asymmetric stretch (Sulfone, Sulfonamide)", "s", ""),
+    (1140, 1180, "S=O symmetric stretch (Sulfone, Sulfonamide)", "s", ""),
+    (1200, 1275, "C-O stretch (Aryl Ether, Ester C-O-C asym.)", "s", ""),
+    (1050, 1150, "C-O stretch (Aliphatic Ether, Secondary/Tertiary Alcohol)", "s", ""),
+    (1000, 1075, "C-O stretch (Primary Alcohol)", "s", ""),
+    (960, 980, "=C-H bend (trans-Alkene)", "s", "sharp"),
+    (905, 920, "=C-H bend (Vinyl, monosubstituted Alkene)", "s", "sharp"),
+    (885, 895, "=C-H bend (1,1-Disubstituted Alkene)", "s", "sharp"),
+    (800, 860, "C-H bend (para-Disubstituted Benzene)", "s", "sharp"),
+    (735, 770, "C-H bend (ortho-Disubstituted / Monosubstituted Benzene)", "s", "sharp"),
+    (690, 710, "C-H bend (Monosubstituted / meta-Disubstituted Benzene)", "s", "sharp"),
+    (720, 730, "CH2 rock (long chain, n >= 4)", "w", ""),
+    (500, 600, "C-Br stretch (Alkyl Bromide)", "s", ""),
+    (485, 600, "C-I stretch (Alkyl Iodide)", "s", ""),
 ]
 
+INTENSITY_WORDS = {"s": "strong", "m": "medium", "w": "weak", "v": "variable"}
+
+
+def format_ir_entry(entry):
+    """把表中条目格式化为 "描述 [strong, broad]" 的形式。"""
+    desc, intensity, shape = entry[2], entry[3], entry[4]
+    qualifiers = [q for q in (INTENSITY_WORDS.get(intensity, intensity), shape) if q]
+    if qualifiers:
+        return f"{desc} [{', '.join(qualifiers)}]"
+    return desc
+
+
+_ir_index = None
+
+
+def get_ir_index():
+    """默认相关表的索引，首次使用时构建。"""
+    global _ir_index
+    if _ir_index is None:
+        _ir_index = IntervalIndex(COMMON_IR_PEAKS)
+    return _ir_index
 
-def analyze_ir(wavenumbers):
-    """分析红外光谱波数，推断可能的官能团。"""
-    wavenumbers = sorted(wavenumbers, reverse=True)
+
+def analyze_ir(wavenumbers, index=None, shapes=None):
+    """
+    分析红外光谱波数，推断可能的官能团。index 缺省时使用 COMMON_IR_PEAKS 的索引。
+
+    shapes 为与 wavenumbers 等长的峰形列表 ("broad"/"sharp"/"")，给出时会剔除
+    峰形明显矛盾的条目（如尖峰不归属为宽的 O-H），全部矛盾时仍保留原结果。
+    """
+    index = index or get_ir_index()
+    if shapes is None:
+        shapes = [""] * len(wavenumbers)
+    order = sorted(range(len(wavenumbers)), key=lambda k: -wavenumbers[k])
+    wavenumbers = [wavenumbers[k] for k in order]
+    shapes = [shapes[k] or "" for k in order]
+    offsets, hits = index.query(wavenumbers)
+    offsets, hits = offsets.tolist(), hits.tolist()
+    labels = [format_ir_entry(e) for e in index.table]
+    entry_shapes = [e[4] for e in index.table]
     findings = []
 
-    for wn in wavenumbers:
-        matched = []
-        for min_wn, max_wn, desc in COMMON_IR_PEAKS:
-            if min_wn <= wn <= max_wn:
-                matched.append(desc)
+    for k, wn in enumerate(wavenumbers):
+        entries = hits[offsets[k]:offsets[k + 1]]
+        if shapes[k]:
+            agreeing = [i for i in entries if not entry_shapes[i] or entry_shapes[i] == shapes[k]]
+            entries = agreeing or entries
+        matched = [labels[i] for i in entries]
 
         if matched:
             findings.append((wn, matched))
@@ -70,18 +146,42 @@ def analyze_ir(wavenumbers):
     return findings
 
 
+def _band_header(band, lang):
+    """带有强度/半高宽信息的峰标题；普通数值输入沿用旧格式。"""
+    if band is None:
+        return None
+    qualifiers = [q for q in (INTENSITY_WORDS.get(band.get("intensity"), ""), band.get("shape", "")) if q]
+    return tr("ir_band_line", lang, band["wn"], ", ".join(qualifiers) or "-", band.get("width", "N/A"))
+
+
 def processIR(wavenumbers, lang='zh'):
-    """与 processMASS 风格一致的 IR 处理函数。"""
+    """
+    与 processMASS 风格一致的 IR 处理函数。
+
+    元素可以是波数，也可以是自动检峰 (profileIR) 得到的 dict:
+    {"wn": ..., "intensity": "s"/"m"/"w", "width": 半高宽, "shape": "broad"/"sharp"/""}。
+    """
+    bands = {}
+    numbers = []
+    shapes = []
     for wn in wavenumbers:
+        if isinstance(wn, dict):
+            band = wn
+            wn = band.get("wn")
+            bands[wn] = band
+            shapes.append(band.get("shape", ""))
+        else:
+            shapes.append("")
         assert type(wn) == float or type(wn) == int, "Wavenumbers must be numbers."
         assert wn > 0, "Wavenumbers must be positive."
+        numbers.append(wn)
 
-    results = analyze_ir(wavenumbers)
+    results = analyze_ir(numbers, shapes=shapes)
 
     result_text = tr("ir_result_title", lang, len(results))
     result_text += "\n".join(
         [
-            tr("ir_wavenumber_line", lang, wn)
+            (_band_header(bands.get(wn), lang) or tr("ir_wavenumber_line", lang, wn))
             + "\n".join([tr("ir_possible_line", lang, g) for g in groups])
             for wn, groups in results
         ]
@@ -2,6 +2,11 @@ import sys
 import json
 import os
 
+import numpy as np
+
+from isotopeMASS import fit_isotope_pattern, format_elements
+from libraryMASS import get_library
+
 def load_locales():
     try:
         if getattr(sys, 'frozen', False):
@@ -28,51 +33,219 @@ def tr(key, lang='zh', *args):
             return text
     return text
 
-# 常见碎片及其质量
-COMMON_FRAGMENTS = {
-    14: "CH2 (Methylene)",
-    15: "CH3 (Methyl)",
-    16: "NH2 (Amino)",
-    17: "OH (Hydroxyl)",
-    18: "H2O (Water)",
-    28: "CO or C2H4",
-    29: "C2H5 (Ethyl) or CHO",
-    31: "OCH3 (Methoxy)",
-    41: "C3H5 (Allyl)",
-    43: "C3H7 (Propyl) or C2H3O (Acetyl)",
-    45: "COOH (Carboxyl) or OCH2CH3 (Ethoxy)",
-    57: "C4H9 (Butyl)",
-    77: "C6H5 (Phenyl)",
-    91: "C7H7 (Benzyl/Tropylium)"
-    
-}
+# 中性丢失搜索的默认容差：0.5 Da 与旧版 round(diff) 的整数匹配等价
+DEFAULT_TOLERANCE = 0.5
+DEFAULT_TOLERANCE_UNIT = "Da"
+# 特征离子只报告优先级不低于此值的条目，避免低诊断性的离子干扰推断
+MIN_ION_PRIORITY = 3
+
+
+def _split_peaks(masses):
+    """把输入拆成 m/z 与强度两个数组；元素可以是数值或 (m/z, 强度)。"""
+    mz = []
+    intensity = []
+    for item in masses:
+        if isinstance(item, (list, tuple)):
+            mz.append(float(item[0]))
+            intensity.append(float(item[1]) if len(item) > 1 else 1.0)
+        else:
+            mz.append(float(item))
+            intensity.append(1.0)
+    return np.asarray(mz, dtype=np.float64), np.asarray(intensity, dtype=np.float64)
+
 
-def analyze_masses(masses):
+def find_neutral_losses(mz, intensities=None, tolerance=DEFAULT_TOLERANCE,
+                        tolerance_unit=DEFAULT_TOLERANCE_UNIT, top_n=None):
     """
-    分析质谱数据，通过质量差推断可能的基团。
+    在排好序的峰数组上搜索所有质量差落在碎片库 (libraryMASS) 某个丢失容差内的峰对。
+
+    对每个库丢失 L，用 searchsorted 一次性为全部母峰 m 找出 [m-L-tol, m-L+tol]
+    内的子峰区间，复杂度为 O(|库| * n log n + 命中数)，不再两两比较。
+
+    参数:
+    - mz: m/z 数组
+    - intensities: 与 mz 等长的强度数组，缺省时全部视为 1
+    - tolerance: 容差数值
+    - tolerance_unit: "Da" 或 "ppm"（ppm 以母峰质量为基准）
+    - top_n: 仅保留得分（两峰强度之积乘以库条目优先级）最高的前 N 条
+
+    返回:
+    - list of dict: loss, group, m1, m2, error, score，按母峰、子峰质量降序排列
     """
-    masses = sorted(masses, reverse=True)
+    mz = np.asarray(mz, dtype=np.float64)
+    if intensities is None:
+        intensities = np.ones_like(mz)
+    intensities = np.asarray(intensities, dtype=np.float64)
+    if mz.size < 2:
+        return []
+
+    order = np.argsort(mz, kind="stable")
+    mz = mz[order]
+    intensities = intensities[order]
+
+    if tolerance_unit == "ppm":
+        tol = mz * (tolerance * 1e-6)
+    elif tolerance_unit == "Da":
+        tol = np.full_like(mz, float(tolerance))
+    else:
+        raise ValueError("tolerance_unit must be 'Da' or 'ppm'.")
+
+    losses, priorities, names = get_library().losses()
+    # 大于谱图跨度的丢失不可能命中，直接跳过
+    span = mz[-1] - mz[0] + tol.max()
+    n_losses = int(np.searchsorted(losses, span, side="right"))
+
+    hi_parts, lo_parts, loss_parts = [], [], []
+    for k in range(n_losses):
+        loss = losses[k]
+        target = mz - loss
+        left = np.searchsorted(mz, target - tol, side="left")
+        right = np.searchsorted(mz, target + tol, side="right")
+        # 子峰必须比母峰轻，避免容差过大时与自身配对
+        right = np.minimum(right, np.arange(mz.size))
+        counts = right - left
+        counts[counts < 0] = 0
+        total = int(counts.sum())
+        if total == 0:
+            continue
+        hi = np.repeat(np.arange(mz.size), counts)
+        # 每个母峰内部的偏移量 0..count-1
+        offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        lo = np.repeat(left, counts) + offsets
+        hi_parts.append(hi)
+        lo_parts.append(lo)
+        loss_parts.append(np.full(total, k))
+
+    if not hi_parts:
+        return []
+
+    hi = np.concatenate(hi_parts)
+    lo = np.concatenate(lo_parts)
+    loss_idx = np.concatenate(loss_parts)
+    error = (mz[hi] - mz[lo]) - losses[loss_idx]
+    score = intensities[hi] * intensities[lo] * priorities[loss_idx]
+
+    if top_n is not None and hi.size > top_n:
+        keep = np.argsort(-score, kind="stable")[:top_n]
+        hi, lo, loss_idx, error, score = hi[keep], lo[keep], loss_idx[keep], error[keep], score[keep]
+
+    # 与旧版输出顺序一致：母峰降序，其次子峰降序
+    rank = np.lexsort((-mz[lo], -mz[hi]))
     findings = []
-    
-    # 计算两两之间的差值
-    for i in range(len(masses)):
-        for j in range(i + 1, len(masses)):
-            diff = round(masses[i] - masses[j])
-            if diff in COMMON_FRAGMENTS:
-                findings.append((diff, COMMON_FRAGMENTS[diff], masses[i], masses[j]))
-    
+    for r in rank:
+        loss = losses[loss_idx[r]]
+        findings.append(
+            {
+                "loss": int(loss) if loss.is_integer() else float(loss),
+                "group": str(names[loss_idx[r]]),
+                "m1": _as_number(mz[hi[r]]),
+                "m2": _as_number(mz[lo[r]]),
+                "error": float(error[r]),
+                "score": float(score[r]),
+            }
+        )
+    return findings
+
+
+def find_characteristic_ions(mz, tolerance=DEFAULT_TOLERANCE, tolerance_unit=DEFAULT_TOLERANCE_UNIT,
+                             min_priority=MIN_ION_PRIORITY):
+    """
+    把每个峰与碎片库中的特征离子比对。
+
+    返回 list of dict: mz, group, priority，按 m/z 降序。
+    """
+    mz = np.sort(np.asarray(mz, dtype=np.float64))[::-1]
+    ions, priorities, names = get_library().ions()
+    keep = priorities >= min_priority
+    ions, priorities, names = ions[keep], priorities[keep], names[keep]
+    if mz.size == 0 or ions.size == 0:
+        return []
+
+    tol = mz * (tolerance * 1e-6) if tolerance_unit == "ppm" else np.full_like(mz, float(tolerance))
+    left = np.searchsorted(ions, mz - tol, side="left")
+    right = np.searchsorted(ions, mz + tol, side="right")
+    findings = []
+    for m, lo, hi in zip(mz, left, right):
+        for k in range(lo, hi):
+            findings.append({"mz": _as_number(m), "group": str(names[k]), "priority": float(priorities[k])})
     return findings
 
-def processMASS(masses, lang='zh'):
+
+def _as_number(value):
+    """整数质量保持整数显示，以免文本输出变成 77.0 之类。"""
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+def analyze_masses(masses, tolerance=DEFAULT_TOLERANCE, tolerance_unit=DEFAULT_TOLERANCE_UNIT, top_n=None):
+    """
+    分析质谱数据，通过质量差推断可能的基团。
+
+    masses 的元素可以是数值，也可以是 (m/z, 强度)。
+    返回 (diff, group, m1, m2) 列表，diff 为碎片库中的丢失质量。
+    """
+    mz, intensities = _split_peaks(masses)
+    findings = find_neutral_losses(mz, intensities, tolerance=tolerance,
+                                   tolerance_unit=tolerance_unit, top_n=top_n)
+    return [(f["loss"], f["group"], f["m1"], f["m2"]) for f in findings]
+
+
+def render_mass_text(findings, molecular_weight, lang='zh', ions=None):
+    """
+    旧版 processMASS 的文本输出。findings 为 (diff, group, m1, m2) 列表，
+    ions 为 find_characteristic_ions 的结果，附在丢失线索之后。
+    """
+    result_text = tr("mass_result_title", lang, len(findings))
+    result_text += tr("mass_possible_mw", lang, molecular_weight)
+    lines = [tr("mass_diff_line", lang, diff, group, m1, m2) for diff, group, m1, m2 in findings]
+    lines += [tr("mass_ion_line", lang, ion["mz"], ion["group"]) for ion in ions or []]
+    result_text += "\n".join(lines)
+    return result_text
+
+
+def render_isotope_text(fits, lang='zh'):
+    """同位素簇拟合结果的文本输出，每条一行。"""
+    if not fits:
+        return ""
+    lines = [tr("mass_isotope_title", lang)]
+    for fit in fits:
+        lines.append(tr("mass_isotope_line", lang, fit["mw"], format_elements(fit["elements"]),
+                        fit["carbons"], fit["rmsd"]))
+    return "\n".join(lines)
+
+
+def processMASS(masses, lang='zh', tolerance=DEFAULT_TOLERANCE, tolerance_unit=DEFAULT_TOLERANCE_UNIT,
+                top_n=None, output="text"):
+        """
+        质谱处理函数。
+
+        output="text" 返回与旧版一致的文本；output="records" 返回
+        find_neutral_losses 的结构化结果，便于后续程序使用。
+        """
         for mass in masses:
+            if isinstance(mass, (list, tuple)):
+                assert len(mass) == 2, "Mass peaks must be (m/z, intensity)."
+                mass = mass[0]
             assert type(mass) == float or type(mass) == int, "Mass values must be numbers." 
             assert mass > 0, "Mass values must be positive."
-        
-        results = analyze_masses(masses)
-        
-        result_text = tr("mass_result_title", lang, len(results))
-        result_text += tr("mass_possible_mw", lang, max(masses))
-        result_text += "\n".join([tr("mass_diff_line", lang, diff, group, m1, m2) for diff, group, m1, m2 in results])
+
+        mz, intensities = _split_peaks(masses)
+        findings = find_neutral_losses(mz, intensities, tolerance=tolerance,
+                                       tolerance_unit=tolerance_unit, top_n=top_n)
+        if output == "records":
+            return findings
+        if output != "text":
+            raise ValueError("output must be 'text' or 'records'.")
+
+        # 只有给出强度时才能拟合分子离子簇
+        has_intensity = any(isinstance(m, (list, tuple)) for m in masses)
+        fits = fit_isotope_pattern(list(zip(mz, intensities)), max_results=3) if has_intensity else []
+
+        results = [(f["loss"], f["group"], f["m1"], f["m2"]) for f in findings]
+        ions = find_characteristic_ions(mz, tolerance=tolerance, tolerance_unit=tolerance_unit)
+        result_text = render_mass_text(results, _as_number(mz.max()), lang, ions=ions)
+        if fits:
+            result_text += ("\n" if results or ions else "") + render_isotope_text(fits, lang)
         print(result_text)
         return result_text
     
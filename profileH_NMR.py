@@ -0,0 +1,281 @@
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from processH_NMR import processH_NMR
+from profileMASS import iter_profile_csv
+
+# 默认谱仪参数
+DEFAULT_SFO1 = 400.0
+# 指数窗展宽 (Hz)
+DEFAULT_LINE_BROADENING = 0.3
+# 多重峰内相邻谱线的最大间距 (Hz)，超过即视为不同的峰组
+DEFAULT_MAX_COUPLING = 20.0
+# 取峰阈值：信噪比与相对最强峰的比例
+DEFAULT_MIN_SNR = 8.0
+DEFAULT_MIN_RELATIVE_INTENSITY = 0.01
+# 基线多项式阶数
+DEFAULT_BASELINE_ORDER = 3
+# 自动相位只用最强的若干点计算代价函数
+PHASE_POINTS = 1024
+
+
+def read_fid(path, dtype="<i4", offset=0):
+    """
+    以内存映射方式读取原始 FID（实部/虚部交替存放），返回复数数组。
+
+    Bruker fid 一般为 "<i4" (BYTORDA=0) 或 ">i4"，Varian/其它导出多为 float32/float64。
+    """
+    raw = np.memmap(path, dtype=np.dtype(dtype), mode="r", offset=offset)
+    n = raw.size // 2
+    pairs = raw[: 2 * n].reshape(n, 2)
+    return pairs[:, 0].astype(np.float64) + 1j * pairs[:, 1].astype(np.float64)
+
+
+def fid_to_spectrum(fid, sw, sfo1=DEFAULT_SFO1, carrier_ppm=0.0, line_broadening=DEFAULT_LINE_BROADENING,
+                    zero_fill=None, group_delay=0.0, reverse=False):
+    """
+    FID -> 频域谱：指数窗、补零、FFT。
+
+    - sw: 谱宽 (Hz)；sfo1: 观测频率 (MHz)；carrier_ppm: 载波（谱中心）的化学位移
+    - group_delay: 数字滤波器群延迟（点数），以一阶相位补偿
+    - reverse: 部分厂商的频率方向相反，置 True 翻转
+
+    返回 (ppm, spectrum)，ppm 升序，spectrum 为复数。
+    """
+    fid = np.asarray(fid)
+    n = fid.size
+    t = np.arange(n) / float(sw)
+    apodized = fid * np.exp(-np.pi * line_broadening * t)
+    size = zero_fill or 1 << int(np.ceil(np.log2(max(2 * n, 2))))
+    spectrum = np.fft.fftshift(np.fft.fft(apodized, size))
+    k = np.arange(size) - size // 2
+    if group_delay:
+        spectrum = spectrum * np.exp(2j * np.pi * group_delay * k / size)
+    freq = k * (float(sw) / size)
+    if reverse:
+        spectrum = spectrum[::-1]
+    ppm = carrier_ppm + freq / sfo1
+    return ppm, spectrum
+
+
+def auto_phase(spectrum, points=PHASE_POINTS):
+    """
+    自动零阶/一阶相位校正。
+
+    以最强峰为一阶相位支点，在 (phi0, phi1) 网格上一次性计算实部，
+    取负吸收平方和最小的组合，再在最优点附近细化 phi0。
+    """
+    n = spectrum.size
+    magnitude = np.abs(spectrum)
+    pivot = int(np.argmax(magnitude))
+    idx = np.argpartition(magnitude, -min(points, n))[-min(points, n):]
+    s = spectrum[idx]
+    rel = (idx - pivot) / float(n)
+
+    phi0 = np.deg2rad(np.arange(0, 360, 4.0))
+    phi1 = np.deg2rad(np.arange(-180, 181, 5.0))
+    cos0, sin0 = np.cos(phi0), np.sin(phi0)
+
+    best = (np.inf, 0.0, 0.0)
+    for p1 in phi1:
+        rotated = s * np.exp(1j * p1 * rel)
+        real = rotated.real[:, None] * cos0[None, :] - rotated.imag[:, None] * sin0[None, :]
+        cost = np.sum(np.minimum(real, 0.0) ** 2, axis=0) - 1e-3 * np.sum(real, axis=0) ** 2 / s.size
+        j = int(np.argmin(cost))
+        if cost[j] < best[0]:
+            best = (cost[j], phi0[j], p1)
+
+    _, p0, p1 = best
+    fine = p0 + np.deg2rad(np.arange(-4.0, 4.01, 0.2))
+    rotated = s * np.exp(1j * p1 * rel)
+    real = rotated.real[:, None] * np.cos(fine)[None, :] - rotated.imag[:, None] * np.sin(fine)[None, :]
+    cost = np.sum(np.minimum(real, 0.0) ** 2, axis=0) - 1e-3 * np.sum(real, axis=0) ** 2 / s.size
+    p0 = fine[int(np.argmin(cost))]
+
+    ramp = (np.arange(n) - pivot) / float(n)
+    return (spectrum * np.exp(1j * (p0 + p1 * ramp))).real
+
+
+def estimate_noise(y):
+    """用一阶差分的 MAD 估计噪声标准差，不受峰的影响。"""
+    diff = np.diff(y)
+    return float(np.median(np.abs(diff - np.median(diff))) * 1.4826 / np.sqrt(2.0)) or 1e-12
+
+
+def baseline_correct(x, y, order=DEFAULT_BASELINE_ORDER, iterations=5):
+    """迭代多项式基线：每轮只用残差在 2.5 sigma 以内的点重新拟合。"""
+    u = (x - x.min()) / (np.ptp(x) or 1.0) * 2.0 - 1.0
+    noise = estimate_noise(y)
+    mask = np.ones(y.size, dtype=bool)
+    baseline = np.zeros_like(y)
+    for _ in range(iterations):
+        coeffs = np.polynomial.polynomial.polyfit(u[mask], y[mask], order)
+        baseline = np.polynomial.polynomial.polyval(u, coeffs)
+        new_mask = np.abs(y - baseline) < 2.5 * noise
+        if new_mask.sum() < order + 2 or np.array_equal(new_mask, mask):
+            break
+        mask = new_mask
+    return y - baseline
+
+
+def pick_lines(x, y, min_snr=DEFAULT_MIN_SNR, min_relative_intensity=DEFAULT_MIN_RELATIVE_INTENSITY):
+    """局部极大值取峰，返回谱线位置与高度（x 升序）。"""
+    mid = y[1:-1]
+    is_max = (mid > y[:-2]) & (mid >= y[2:])
+    threshold = max(min_snr * estimate_noise(y), min_relative_intensity * y.max())
+    idx = np.flatnonzero(is_max & (mid > threshold)) + 1
+    if idx.size == 0:
+        return np.empty(0), np.empty(0)
+    # 抛物线插值细化峰位
+    left, center, right = y[idx - 1], y[idx], y[idx + 1]
+    denom = left - 2 * center + right
+    shift = np.where(denom != 0, 0.5 * (left - right) / np.where(denom != 0, denom, 1), 0.0)
+    step = np.gradient(x)[idx]
+    return x[idx] + shift * step, center
+
+
+def group_multiplets(line_x, line_y, max_gap):
+    """相邻谱线间距不超过 max_gap 的归为同一多重峰，返回每组的 (起, 止) 下标。"""
+    if line_x.size == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(line_x) > max_gap) + 1
+    starts = np.concatenate(([0], breaks))
+    stops = np.concatenate((breaks, [line_x.size]))
+    return list(zip(starts, stops))
+
+
+def integrate_regions(x, y, regions):
+    """用累计梯形积分一次性求各区间 [lo, hi] 的面积（x 升序）。"""
+    cumulative = np.concatenate(([0.0], np.cumsum((y[1:] + y[:-1]) * 0.5 * np.diff(x))))
+    lo = np.searchsorted(x, [r[0] for r in regions], side="left")
+    hi = np.searchsorted(x, [r[1] for r in regions], side="right") - 1
+    hi = np.maximum(hi, lo)
+    return cumulative[hi] - cumulative[lo]
+
+
+def analyze_spectrum(ppm, real, sfo1=DEFAULT_SFO1, max_coupling=DEFAULT_MAX_COUPLING, min_snr=DEFAULT_MIN_SNR,
+                     min_relative_intensity=DEFAULT_MIN_RELATIVE_INTENSITY, exclude=None,
+                     baseline_order=DEFAULT_BASELINE_ORDER):
+    """
+    已相位校正的实谱 -> (shift, area, multiplicity) 列表，可直接交给 processH_NMR。
+
+    exclude 为 [(lo, hi), ...] 需要忽略的 ppm 区间（溶剂峰、TMS 等）。
+    面积以最小峰组为 1 归一。
+    """
+    order = np.argsort(ppm)
+    x = np.asarray(ppm, dtype=np.float64)[order]
+    y = baseline_correct(x, np.asarray(real, dtype=np.float64)[order], order=baseline_order)
+
+    line_x, line_y = pick_lines(x, y, min_snr, min_relative_intensity)
+    if exclude:
+        keep = np.ones(line_x.size, dtype=bool)
+        for lo, hi in exclude:
+            keep &= ~((line_x >= lo) & (line_x <= hi))
+        line_x, line_y = line_x[keep], line_y[keep]
+
+    max_gap = max_coupling / sfo1
+    groups = group_multiplets(line_x, line_y, max_gap)
+    if not groups:
+        return []
+
+    margin = max_gap / 2.0
+    regions = [(line_x[a] - margin, line_x[b - 1] + margin) for a, b in groups]
+    areas = integrate_regions(x, y, regions)
+    centers = [float(np.average(line_x[a:b], weights=line_y[a:b])) for a, b in groups]
+    counts = [int(b - a) for a, b in groups]
+
+    positive = areas[areas > 0]
+    unit = positive.min() if positive.size else 1.0
+    return [
+        (round(c, 2), round(float(area / unit), 2), n)
+        for c, area, n in zip(centers, areas, counts)
+        if area > 0
+    ]
+
+
+def _load_processed(options):
+    if "x" in options and "y" in options:
+        return np.asarray(options["x"], dtype=np.float64), np.asarray(options["y"], dtype=np.float64)
+    xs, ys = [], []
+    for x, y in iter_profile_csv(options["path"]):
+        xs.append(x)
+        ys.append(y)
+    return np.concatenate(xs), np.concatenate(ys)
+
+
+def _peaks_from_sticks(sticks, sfo1, max_coupling):
+    """峰表（位移, 强度）直接分组，强度之和作为面积近似。"""
+    sticks = np.asarray(sticks, dtype=np.float64).reshape(-1, 2)
+    sticks = sticks[np.argsort(sticks[:, 0])]
+    groups = group_multiplets(sticks[:, 0], sticks[:, 1], max_coupling / sfo1)
+    sums = [sticks[a:b, 1].sum() for a, b in groups]
+    unit = min(s for s in sums if s > 0) if any(s > 0 for s in sums) else 1.0
+    return [
+        (round(float(np.average(sticks[a:b, 0], weights=sticks[a:b, 1])), 2), round(float(s / unit), 2), int(b - a))
+        for (a, b), s in zip(groups, sums)
+        if s > 0
+    ]
+
+
+def h_nmr_peaks_from_options(options):
+    """
+    按 "h_nmr_spectrum" 的选项得到峰列表。三种输入：
+
+    - {"fid": path, "sw": Hz, "sfo1": MHz, "carrier_ppm": ..., "dtype": "<i4", ...}: 原始 FID
+    - {"path": csv} 或 {"x": [...], "y": [...]}: 已处理的实谱 (ppm, 强度)
+    - {"peaks": [[shift, intensity], ...]}: 峰表
+    """
+    if not isinstance(options, dict):
+        raise ValueError("h_nmr_spectrum must be a dictionary.")
+    sfo1 = float(options.get("sfo1") or DEFAULT_SFO1)
+    max_coupling = float(options.get("max_coupling", DEFAULT_MAX_COUPLING))
+    analyze_kwargs = {k: options[k] for k in ("min_snr", "min_relative_intensity", "exclude", "baseline_order")
+                      if k in options}
+
+    if "peaks" in options:
+        return _peaks_from_sticks(options["peaks"], sfo1, max_coupling)
+    if "fid" in options:
+        if "sw" not in options:
+            raise ValueError("FID input needs the spectral width 'sw' (Hz).")
+        fid = read_fid(options["fid"], dtype=options.get("dtype", "<i4"), offset=int(options.get("offset", 0)))
+        ppm, spectrum = fid_to_spectrum(
+            fid, float(options["sw"]), sfo1, float(options.get("carrier_ppm", 0.0)),
+            line_broadening=float(options.get("line_broadening", DEFAULT_LINE_BROADENING)),
+            group_delay=float(options.get("group_delay", 0.0)),
+            reverse=bool(options.get("reverse", False)),
+        )
+        real = auto_phase(spectrum)
+        return analyze_spectrum(ppm, real, sfo1, max_coupling, **analyze_kwargs)
+    if "path" in options or ("x" in options and "y" in options):
+        x, y = _load_processed(options)
+        return analyze_spectrum(x, y, sfo1, max_coupling, **analyze_kwargs)
+    raise ValueError("h_nmr_spectrum needs 'fid', 'path', 'x'/'y' or 'peaks'.")
+
+
+def process_h_nmr_batch(option_list, max_workers=None):
+    """
+    批量处理多张谱图，结果顺序与输入一致。
+
+    max_workers 大于 1 时使用进程池；每个进程一次只持有一张谱图，内存占用有界。
+    """
+    if max_workers and max_workers > 1:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            return list(pool.map(h_nmr_peaks_from_options, option_list, chunksize=4))
+    return [h_nmr_peaks_from_options(options) for options in option_list]
+
+
+def processH_NMRSpectrum(options, lang='zh'):
+    """JSON "h_nmr_spectrum" 入口：自动取峰、分组、积分后交给 processH_NMR。"""
+    peaks = h_nmr_peaks_from_options(options)
+    if not peaks:
+        raise ValueError("No peaks found in 1H NMR spectrum.")
+    return processH_NMR(peaks, lang=lang, total_h=options.get("total_h"))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("用法: python profileH_NMR.py <谱图文件(两列: ppm, 强度)>")
+        sys.exit(1)
+    processH_NMRSpectrum({"path": sys.argv[1]})
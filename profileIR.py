@@ -0,0 +1,217 @@
+import sys
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from processIR import processIR
+from profileMASS import iter_profile_csv
+
+# 基线估计的滚动窗口宽度 (cm^-1)
+DEFAULT_BASELINE_WIDTH = 300.0
+# Savitzky-Golay 平滑窗口 (cm^-1) 与多项式阶数
+DEFAULT_SMOOTH_WIDTH = 12.0
+DEFAULT_SMOOTH_ORDER = 2
+# 相对最强峰的最小显著性 (prominence)
+DEFAULT_MIN_PROMINENCE = 0.03
+# 半高宽分类阈值 (cm^-1)
+BROAD_WIDTH = 75.0
+SHARP_WIDTH = 30.0
+# 相对强度分类阈值
+STRONG_LEVEL = 0.5
+MEDIUM_LEVEL = 0.2
+
+
+def to_absorbance(y, mode="auto"):
+    """
+    把纵轴统一成吸光度，使吸收峰成为极大值。
+
+    mode: "transmittance" (%T 或 0-1 的透过率)、"absorbance" 或 "auto"。
+    auto 时中位数大于 1.5 视为 %T，0.3-1.5 之间且不超过 1.05 视为透过率，否则视为吸光度。
+    """
+    y = np.asarray(y, dtype=np.float64)
+    if mode == "auto":
+        median = np.median(y)
+        if median > 1.5:
+            mode, y = "transmittance", y / 100.0
+        elif 0.3 < median <= 1.5 and y.max() <= 1.05:
+            mode = "transmittance"
+        else:
+            mode = "absorbance"
+    elif mode == "transmittance" and np.median(y) > 1.5:
+        y = y / 100.0
+    if mode == "transmittance":
+        return -np.log10(np.clip(y, 1e-6, None))
+    if mode == "absorbance":
+        return y
+    raise ValueError("mode must be 'auto', 'transmittance' or 'absorbance'.")
+
+
+def _odd_window(width, step, minimum=3):
+    n = max(minimum, int(round(width / step)))
+    return n if n % 2 else n + 1
+
+
+def savgol_coefficients(window, order):
+    """Savitzky-Golay 平滑的卷积系数（最小二乘多项式在窗口中心的取值）。"""
+    half = window // 2
+    x = np.arange(-half, half + 1, dtype=np.float64)
+    vander = np.vander(x, order + 1, increasing=True)
+    return np.linalg.pinv(vander)[0]
+
+
+def smooth(y, window, order=DEFAULT_SMOOTH_ORDER):
+    if window < order + 2 or y.size < window:
+        return y.copy()
+    coeffs = savgol_coefficients(window, order)
+    half = window // 2
+    padded = np.pad(y, half, mode="edge")
+    return np.convolve(padded, coeffs[::-1], mode="valid")
+
+
+def rolling_baseline(y, window):
+    """滚动最小值再做滑动平均，得到平滑的下包络作为基线。"""
+    if y.size < window:
+        return np.full_like(y, y.min())
+    half = window // 2
+    padded = np.pad(y, half, mode="edge")
+    lower = sliding_window_view(padded, window).min(axis=1)
+    padded = np.pad(lower, half, mode="edge")
+    return sliding_window_view(padded, window).mean(axis=1)
+
+
+def _crossing(x, y, peak, base, level):
+    """从峰顶走向 base，找首次降到 level 以下的位置，线性插值返回横坐标。"""
+    if base == peak:
+        return x[peak]
+    step = 1 if base > peak else -1
+    path = np.arange(peak, base + step, step)
+    below = np.flatnonzero(y[path] <= level)
+    if below.size == 0:
+        return x[base]
+    j = path[below[0]]
+    i = path[below[0] - 1]
+    if y[i] == y[j]:
+        return x[j]
+    return x[i] + (level - y[i]) * (x[j] - x[i]) / (y[j] - y[i])
+
+
+def detect_ir_bands(x, y, mode="auto", baseline_width=DEFAULT_BASELINE_WIDTH,
+                    smooth_width=DEFAULT_SMOOTH_WIDTH, min_prominence=DEFAULT_MIN_PROMINENCE):
+    """
+    从完整的 IR 谱线中检出吸收带。
+
+    步骤：转吸光度 -> 基线扣除 -> Savitzky-Golay 平滑 -> 局部极大值 ->
+    按显著性 (prominence) 过滤 -> 计算半高宽。
+
+    返回 list of dict: wn, absorbance, prominence, width, intensity ("s"/"m"/"w"),
+    shape ("broad"/"sharp"/"")，按波数降序。
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = to_absorbance(y, mode)
+    order = np.argsort(x)
+    x, y = x[order], y[order]
+    if x.size < 5:
+        return []
+    step = float(np.median(np.diff(x)))
+    if step <= 0:
+        raise ValueError("Wavenumbers must be strictly increasing after sorting.")
+
+    signal = y - rolling_baseline(y, _odd_window(baseline_width, step))
+    signal = smooth(signal, _odd_window(smooth_width, step, minimum=DEFAULT_SMOOTH_ORDER + 3))
+
+    mid = signal[1:-1]
+    peaks = np.flatnonzero((mid > signal[:-2]) & (mid >= signal[2:])) + 1
+    # 先按高度粗筛噪声峰：显著性不会超过峰顶到全谱最低点的高度
+    floor = signal.min()
+    peaks = peaks[signal[peaks] - floor >= min_prominence * (signal.max() - floor)]
+    if peaks.size == 0:
+        return []
+
+    # 显著性：峰高减去两侧（到更高峰为止）最低点中较高的一个
+    prominence = np.empty(peaks.size)
+    left_base = np.empty(peaks.size, dtype=np.intp)
+    right_base = np.empty(peaks.size, dtype=np.intp)
+    for k, p in enumerate(peaks):
+        higher_left = np.flatnonzero(signal[:p] > signal[p])
+        lo = higher_left[-1] + 1 if higher_left.size else 0
+        higher_right = np.flatnonzero(signal[p + 1:] > signal[p])
+        hi = p + higher_right[0] if higher_right.size else signal.size - 1
+        left_base[k] = lo + np.argmin(signal[lo:p + 1])
+        right_base[k] = p + np.argmin(signal[p:hi + 1])
+        prominence[k] = signal[p] - max(signal[left_base[k]], signal[right_base[k]])
+
+    keep = prominence >= min_prominence * prominence.max()
+    peaks, prominence = peaks[keep], prominence[keep]
+    left_base, right_base = left_base[keep], right_base[keep]
+
+    strongest = prominence.max()
+    bands = []
+    for p, prom, lb, rb in zip(peaks, prominence, left_base, right_base):
+        half = signal[p] - prom / 2.0
+        width = _crossing(x, signal, p, rb, half) - _crossing(x, signal, p, lb, half)
+        level = prom / strongest
+        if level >= STRONG_LEVEL:
+            intensity = "s"
+        elif level >= MEDIUM_LEVEL:
+            intensity = "m"
+        else:
+            intensity = "w"
+        if width >= BROAD_WIDTH:
+            shape = "broad"
+        elif width <= SHARP_WIDTH:
+            shape = "sharp"
+        else:
+            shape = ""
+        bands.append(
+            {
+                "wn": round(float(x[p])),
+                "absorbance": float(y[p]),
+                "prominence": float(prom),
+                "width": round(float(width), 1),
+                "intensity": intensity,
+                "shape": shape,
+            }
+        )
+    bands.sort(key=lambda b: -b["wn"])
+    return bands
+
+
+def load_ir_trace(path, delimiter=None):
+    """读取两列 (波数, 透过率/吸光度) 文本文件。"""
+    xs, ys = [], []
+    for x, y in iter_profile_csv(path, delimiter=delimiter):
+        xs.append(x)
+        ys.append(y)
+    if not xs:
+        return np.empty(0), np.empty(0)
+    return np.concatenate(xs), np.concatenate(ys)
+
+
+def processIRSpectrum(options, lang='zh'):
+    """
+    JSON "ir_spectrum" 入口：自动检峰后交给 processIR。
+
+    options 为 dict，给出 "path"（两列文本文件）或 "x"/"y" 数组，
+    可选 "mode"、"baseline_width"、"smooth_width"、"min_prominence"。
+    """
+    if not isinstance(options, dict):
+        raise ValueError("ir_spectrum must be a dictionary.")
+    if "path" in options:
+        x, y = load_ir_trace(options["path"])
+    elif "x" in options and "y" in options:
+        x, y = options["x"], options["y"]
+    else:
+        raise ValueError("ir_spectrum needs 'path' or 'x' and 'y'.")
+
+    kwargs = {k: options[k] for k in ("mode", "baseline_width", "smooth_width", "min_prominence") if k in options}
+    bands = detect_ir_bands(x, y, **kwargs)
+    if not bands:
+        raise ValueError("No bands found in IR spectrum.")
+    return processIR(bands, lang=lang)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("用法: python profileIR.py <谱图文件(两列: 波数, 透过率/吸光度)>")
+        sys.exit(1)
+    processIRSpectrum({"path": sys.argv[1]})
@@ -0,0 +1,206 @@
+import sys
+import itertools
+
+import numpy as np
+
+from processMASS import processMASS
+
+# 流式读取时每块的点数
+DEFAULT_CHUNK_SIZE = 65536
+# 基线估计的窗口点数与分位数
+DEFAULT_BASELINE_WINDOW = 512
+DEFAULT_BASELINE_PERCENTILE = 10.0
+# 相对强度阈值 (%，以最强峰为 100)
+DEFAULT_MIN_RELATIVE_INTENSITY = 1.0
+# 谱图自动取峰后，碎片丢失线索只保留强度最高的前 N 条
+DEFAULT_TOP_N = 50
+
+
+def iter_profile_csv(path, chunk_size=DEFAULT_CHUNK_SIZE, delimiter=None):
+    """
+    分块读取两列 (m/z, 强度) 的 CSV/文本文件，逐块产出 numpy 数组。
+
+    每次只把 chunk_size 行读入内存；首行若不是数字则视为表头跳过，
+    以 # 开头的行为注释。delimiter 为 None 时自动识别逗号、制表符或空白。
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        first = True
+        while True:
+            lines = list(itertools.islice(f, chunk_size))
+            if not lines:
+                break
+            if first:
+                first = False
+                if delimiter is None:
+                    delimiter = "," if "," in lines[-1] else None
+                head = lines[0].strip()
+                try:
+                    [float(v) for v in head.replace(",", " ").split()[:2]]
+                except ValueError:
+                    lines = lines[1:]
+            if not lines:
+                continue
+            block = np.loadtxt(lines, delimiter=delimiter, usecols=(0, 1), comments="#", ndmin=2)
+            if block.size == 0:
+                continue
+            yield block[:, 0], block[:, 1]
+
+
+def iter_profile_binary(path, dtype="<f8", layout="interleaved", chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    以内存映射方式读取原始二进制谱图，逐块产出 (m/z, 强度) 视图。
+
+    layout:
+    - "interleaved": mz0, y0, mz1, y1, ...
+    - "columns": 先是全部 N 个 m/z，随后是 N 个强度
+    """
+    raw = np.memmap(path, dtype=np.dtype(dtype), mode="r")
+    if raw.size % 2:
+        raise ValueError("Binary profile must contain an even number of values.")
+    n = raw.size // 2
+    if layout == "interleaved":
+        pairs = raw.reshape(n, 2)
+        mz_all, y_all = pairs[:, 0], pairs[:, 1]
+    elif layout == "columns":
+        mz_all, y_all = raw[:n], raw[n:]
+    else:
+        raise ValueError("layout must be 'interleaved' or 'columns'.")
+
+    for start in range(0, n, chunk_size):
+        stop = min(start + chunk_size, n)
+        yield (np.asarray(mz_all[start:stop], dtype=np.float64),
+               np.asarray(y_all[start:stop], dtype=np.float64))
+
+
+def estimate_baseline(intensity, window=DEFAULT_BASELINE_WINDOW, percentile=DEFAULT_BASELINE_PERCENTILE):
+    """按固定窗口取低分位数作为分段常数基线。"""
+    n = intensity.size
+    if n == 0:
+        return intensity.copy()
+    window = max(1, min(window, n))
+    n_full = n // window
+    baseline = np.empty(n, dtype=np.float64)
+    if n_full:
+        blocks = intensity[: n_full * window].reshape(n_full, window)
+        levels = np.percentile(blocks, percentile, axis=1)
+        baseline[: n_full * window] = np.repeat(levels, window)
+    if n_full * window < n:
+        baseline[n_full * window:] = np.percentile(intensity[n_full * window:], percentile)
+    return baseline
+
+
+def _segment_boundaries(y):
+    """峰区间的分界点：局部极小值或零点（不含首尾）。"""
+    if y.size < 3:
+        return np.empty(0, dtype=np.intp)
+    mid = y[1:-1]
+    is_min = (mid <= y[:-2]) & (mid < y[2:])
+    is_zero = mid <= 0
+    return np.flatnonzero(is_min | is_zero) + 1
+
+
+def _centroid_segments(mz, y, bounds):
+    """按分界点切分区间，返回每个区间的强度加权质心与峰顶强度。"""
+    if mz.size == 0:
+        return np.empty(0), np.empty(0)
+    starts = np.concatenate(([0], bounds))
+    weight = np.add.reduceat(y, starts)
+    moment = np.add.reduceat(mz * y, starts)
+    apex = np.maximum.reduceat(y, starts)
+    keep = weight > 0
+    return moment[keep] / weight[keep], apex[keep]
+
+
+def centroid_stream(chunks, baseline_window=DEFAULT_BASELINE_WINDOW,
+                    baseline_percentile=DEFAULT_BASELINE_PERCENTILE,
+                    min_relative_intensity=DEFAULT_MIN_RELATIVE_INTENSITY):
+    """
+    对 (m/z, 强度) 数据块流做基线扣除、质心化和相对强度过滤。
+
+    每块只在最后一个分界点之前结算峰，剩余部分并入下一块，
+    因此跨块的峰不会被截断；内存占用只与块大小和峰数有关。
+
+    返回 list of (m/z, 相对强度%)，按 m/z 升序。
+    """
+    carry_mz = np.empty(0)
+    carry_y = np.empty(0)
+    centroids = []
+    apexes = []
+
+    for mz, y in chunks:
+        corrected = y - estimate_baseline(y, baseline_window, baseline_percentile)
+        np.clip(corrected, 0, None, out=corrected)
+        mz = np.concatenate((carry_mz, mz))
+        corrected = np.concatenate((carry_y, corrected))
+
+        bounds = _segment_boundaries(corrected)
+        if bounds.size == 0:
+            carry_mz, carry_y = mz, corrected
+            continue
+        last = bounds[-1]
+        c, a = _centroid_segments(mz[:last], corrected[:last], bounds[:-1])
+        centroids.append(c)
+        apexes.append(a)
+        carry_mz, carry_y = mz[last:], corrected[last:]
+
+    c, a = _centroid_segments(carry_mz, carry_y, _segment_boundaries(carry_y))
+    centroids.append(c)
+    apexes.append(a)
+
+    centroids = np.concatenate(centroids)
+    apexes = np.concatenate(apexes)
+    if apexes.size == 0:
+        return []
+    relative = apexes / apexes.max() * 100.0
+    keep = relative >= min_relative_intensity
+    order = np.argsort(centroids[keep])
+    return [(round(float(m), 4), round(float(r), 2))
+            for m, r in zip(centroids[keep][order], relative[keep][order])]
+
+
+def load_profile_peaks(path, fmt=None, dtype="<f8", layout="interleaved", chunk_size=DEFAULT_CHUNK_SIZE,
+                       delimiter=None, baseline_window=DEFAULT_BASELINE_WINDOW,
+                       baseline_percentile=DEFAULT_BASELINE_PERCENTILE,
+                       min_relative_intensity=DEFAULT_MIN_RELATIVE_INTENSITY):
+    """
+    从 profile 模式的谱图文件自动取峰。
+
+    fmt 为 "csv" 或 "binary"；缺省时按扩展名判断 (.csv/.txt/.tsv 为文本，其余为二进制)。
+    """
+    if fmt is None:
+        fmt = "csv" if path.lower().endswith((".csv", ".txt", ".tsv", ".xy")) else "binary"
+    if fmt == "csv":
+        chunks = iter_profile_csv(path, chunk_size=chunk_size, delimiter=delimiter)
+    elif fmt == "binary":
+        chunks = iter_profile_binary(path, dtype=dtype, layout=layout, chunk_size=chunk_size)
+    else:
+        raise ValueError("fmt must be 'csv' or 'binary'.")
+    return centroid_stream(chunks, baseline_window=baseline_window,
+                           baseline_percentile=baseline_percentile,
+                           min_relative_intensity=min_relative_intensity)
+
+
+def processMASSProfile(options, lang='zh'):
+    """
+    JSON "mass_profile" 入口：自动取峰后交给 processMASS。
+
+    options 为 dict，必须包含 "path"，其余键与 load_profile_peaks 的参数同名；
+    另可给出 "top_n"、"tolerance"、"tolerance_unit" 传给 processMASS。
+    """
+    if not isinstance(options, dict) or "path" not in options:
+        raise ValueError("mass_profile must be a dictionary with a 'path' key.")
+
+    options = dict(options)
+    top_n = options.pop("top_n", DEFAULT_TOP_N)
+    mass_kwargs = {k: options.pop(k) for k in ("tolerance", "tolerance_unit") if k in options}
+    peaks = load_profile_peaks(**options)
+    if not peaks:
+        raise ValueError("No peaks found in mass profile.")
+    return processMASS(peaks, lang=lang, top_n=top_n, **mass_kwargs)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("用法: python profileMASS.py <谱图文件(.csv/.bin)>")
+        sys.exit(1)
+    processMASSProfile({"path": sys.argv[1]})
@@ -0,0 +1,242 @@
+import re
+import sys
+import json
+import os
+
+def load_locales():
+    try:
+        if getattr(sys, 'frozen', False):
+            base_dir = os.path.dirname(sys.executable)
+        else:
+            base_dir = os.path.dirname(__file__)
+        path = os.path.join(base_dir, "locales.json")
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+    except Exception:
+        pass
+    return {}
+
+LOCALES = load_locales()
+
+def tr(key, lang='zh', *args):
+    lang_data = LOCALES.get(lang, {})
+    text = lang_data.get(key, key)
+    if args:
+        try:
+            return text.format(*args)
+        except:
+            return text
+    return text
+
+# 默认输入预算（估计 token 数），约为完整证据链加 Step 2 回答的常见长度
+DEFAULT_PROMPT_BUDGET = 3000
+
+# 粗略的本地 token 估计：汉字约 1 token/字，英文单词约 4 字符/token，数字约 3 位/token，其余符号各 1
+_TOKEN_PATTERN = re.compile(r"[㐀-鿿豈-﫿]|[A-Za-z]+|\d+|\S")
+
+
+def estimate_tokens(text):
+    """本地估计文本的 token 数（不依赖具体分词器，误差约 ±20%，用于预算与报告）。"""
+    total = 0
+    for match in _TOKEN_PATTERN.finditer(text or ""):
+        piece = match.group(0)
+        if piece[0].isascii() and piece[0].isalpha():
+            total += (len(piece) + 3) // 4
+        elif piece[0].isdigit():
+            total += (len(piece) + 2) // 3
+        else:
+            total += 1
+    return total
+
+
+_template_cache = {}
+
+
+# 各模板中需要收窄的字段（按占位符顺序，None 为默认的贪婪匹配）：
+# 1H 峰行的面积不含逗号，否则贪婪匹配会吞掉后面 "Triplet (t, 2 neighbors)" 中逗号之前的部分
+FIELD_PATTERNS = {
+    "hnmr_peak_line": (None, r"[^,]+", None),
+    "hnmr_peak_line_h": (None, r"[^,≈]+?", r"[^,]+", None),
+}
+
+
+def _template(key, lang):
+    """把 locales 中的格式串转成正则（{} 占位符 -> 分组），用于识别各处理器输出的行。"""
+    cache_key = (key, lang)
+    if cache_key not in _template_cache:
+        text = tr(key, lang).strip()
+        parts = re.split(r"\{[^}]*\}", text)
+        # 贪婪匹配配合回溯，使含括号的基团名（如 "CH3 (Methyl)"）不会截断后面的数值字段
+        fields = FIELD_PATTERNS.get(key) or ()
+        pattern = re.escape(parts[0])
+        for k, part in enumerate(parts[1:]):
+            field = fields[k] if k < len(fields) and fields[k] else ".+"
+            pattern += f"({field})" + re.escape(part)
+        _template_cache[cache_key] = re.compile(pattern + "$")
+    return _template_cache[cache_key]
+
+
+def _match(key, line, lang):
+    m = _template(key, lang).match(line)
+    return m.groups() if m else None
+
+
+def _short_mult(desc):
+    # "Doublet (d, 1 neighbor)" -> "doublet"
+    return desc.split(" (")[0].lower()
+
+
+def compact_section(text, lang='zh'):
+    """
+    把一个处理器的文本输出改写成紧凑的规范编码，返回 (必需行, 可选行)。
+
+    - 各节标题改为 MS: / IR: / 1H NMR: / 13C: 等短标签；
+    - "可能为" 子行并入所属的峰标题行，以 "; " 分隔；
+    - 13C 逐行结果合并为一行；
+    - 质谱质量差峰对是可截断的可选行，按相关度排序：来自最大 m/z 的丢失优先，
+      其次候选基团越少（越专一）越优先，再按母峰质量降序。
+    """
+    required = []
+    pairs = []
+    carbons = []
+    header = None
+
+    def flush_header():
+        nonlocal header
+        if header is not None:
+            title, groups = header
+            required.append(title + (" " + "; ".join(groups) if groups else ""))
+            header = None
+
+    for raw in text.splitlines():
+        line = raw.strip()
+        if not line:
+            continue
+
+        groups = (_match("ir_possible_line", line, lang) or _match("hnmr_possible_line", line, lang)
+                  or _match("cnmr_possible_line", line, lang))
+        if groups and header is not None:
+            header[1].append(groups[0])
+            continue
+        flush_header()
+
+        if _match("mass_result_title", line, lang):
+            required.append("MS:")
+        elif (found := _match("mass_possible_mw", line, lang)):
+            required.append(f"M={found[0]}")
+        elif (found := _match("mass_diff_line", line, lang)):
+            diff, group, m1, m2 = found
+            pairs.append((m1, m2, diff, group))
+        elif (found := _match("mass_ion_line", line, lang)):
+            required.append(f"ion {found[0]}: {found[1]}")
+        elif _match("ir_result_title", line, lang):
+            required.append("IR:")
+        elif (found := _match("ir_band_line", line, lang)):
+            header = (f"{found[0]} ({found[1]}, w{found[2]}):", [])
+        elif (found := _match("ir_wavenumber_line", line, lang)):
+            header = (f"{found[0]}:", [])
+        elif _match("hnmr_result_title", line, lang):
+            required.append("1H NMR:")
+        elif (found := _match("hnmr_total_h", line, lang)):
+            required.append(f"total H={found[0]}")
+        elif (found := _match("hnmr_peak_line_h", line, lang)):
+            header = (f"{found[0]} {found[2]}H {_short_mult(found[3])}:", [])
+        elif (found := _match("hnmr_peak_line", line, lang)):
+            header = (f"{found[0]} area {found[1]} {_short_mult(found[2])}:", [])
+        elif (found := _match("cnmr_line_format", line, lang)):
+            shift, kind, count = found
+            carbons.append(f"{shift} {kind}" + ("" if count.strip() == "1" else f" x{count}"))
+        else:
+            required.append(re.sub(r"\s+", " ", line))
+    flush_header()
+
+    if carbons:
+        required.insert(0, "13C: " + "; ".join(carbons))
+    optional = []
+    if pairs:
+        top = max(float(m1) for m1, _, _, _ in pairs)
+        pairs.sort(key=lambda p: (float(p[0]) != top, p[3].count(" or ") + p[3].count("|"), -float(p[0])))
+        optional = [f"{m1}-{m2}={diff}: {group}" for m1, m2, diff, group in pairs]
+    return required, optional
+
+
+def _normalize(line):
+    return re.sub(r"\s+", " ", line).strip().lower()
+
+
+def build_prompt(intro, blocks, instruction, budget=DEFAULT_PROMPT_BUDGET, lang='zh'):
+    """
+    按预算拼接 prompt。blocks 为 [(必需行, 可选行), ...]：
+    全部必需行去重后保留；可选行按各块内的相关度顺序轮流加入，直到估计 token 数达到 budget。
+    返回 (prompt, 报告 dict: tokens, budget, omitted)。必需部分本身超出预算时照样返回并在报告中体现。
+    """
+    seen = set()
+    kept_blocks = []
+    for required, optional in blocks:
+        kept = []
+        for line in required:
+            key = _normalize(line)
+            if key and key not in seen:
+                seen.add(key)
+                kept.append(line)
+        rest = [line for line in optional if _normalize(line) not in seen]
+        kept_blocks.append((kept, rest, []))
+
+    def render(omitted):
+        body = "\n".join("\n".join(kept + extra) for kept, _, extra in kept_blocks if kept or extra)
+        if omitted:
+            body += "\n" + tr("prompt_omitted_lines", lang, omitted)
+        return intro + body + "\n" + instruction
+
+    used = estimate_tokens(render(0))
+    remaining = sum(len(rest) for _, rest, _ in kept_blocks)
+    depth = 0
+    while remaining:
+        for kept, rest, extra in kept_blocks:
+            if depth >= len(rest):
+                continue
+            cost = estimate_tokens(rest[depth]) + 1
+            if used + cost > budget:
+                remaining = 0
+                break
+            extra.append(rest[depth])
+            used += cost
+            remaining -= 1
+        depth += 1
+
+    omitted = sum(len(rest) - len(extra) for _, rest, extra in kept_blocks)
+    prompt = render(omitted)
+    return prompt, {"tokens": estimate_tokens(prompt), "budget": budget, "omitted": omitted}
+
+
+def evidence_blocks(datas, lang='zh'):
+    return [compact_section(text, lang) for text in datas]
+
+
+def gen_prompt_1_budget(datas, lang='zh', budget=DEFAULT_PROMPT_BUDGET):
+    """gen_prompt_1 的预算版本：证据链使用紧凑编码。返回 (prompt, 报告)。"""
+    return build_prompt(tr("prompt_1_intro", lang), evidence_blocks(datas, lang),
+                        tr("prompt_1_instruction", lang), budget, lang)
+
+
+def gen_prompt_2_budget(findings, datas, lang='zh', budget=DEFAULT_PROMPT_BUDGET, shortlist=None):
+    """
+    gen_prompt_2 的预算版本。findings 为 Step 2 的回答，datas 为证据链；
+    回答中与证据链重复的行只保留一次，证据链使用紧凑编码。
+    shortlist: 本地枚举得到的候选结构行（见 enumerateStructure.format_shortlist），整块保留在回答之后。
+    返回 (prompt, 报告)。
+    """
+    evidence = evidence_blocks(datas, lang)
+    known = {_normalize(line) for required, optional in evidence for line in required + optional}
+    answer = [line.strip() for line in (findings or "").splitlines()
+              if line.strip() and _normalize(line) not in known]
+    blocks = [(answer, [])] + ([(list(shortlist), [])] if shortlist else [])
+    blocks += [([tr("text_evidence_chain", lang).strip()], [])] + evidence
+    return build_prompt(tr("prompt_2_intro", lang), blocks, tr("prompt_2_instruction", lang), budget, lang)
+
+
+def format_report(report, raw_prompt=None, lang='zh'):
+    """发送前打印的一行估计：估计 token 数、预算、省略行数（给出原 prompt 时附上原长度）。"""
+    raw = estimate_tokens(raw_prompt) if raw_prompt is not None else "-"
+    return tr("prompt_token_report", lang, report["tokens"], report["budget"], raw, report["omitted"])
@@ -0,0 +1,393 @@
+import sys
+import re
+import mmap
+
+import numpy as np
+
+from profileMASS import centroid_stream
+
+# ASDF 压缩字符表 (JCAMP-DX 5.01)
+SQZ_DIGITS = {"@": 0, "A": 1, "B": 2, "C": 3, "D": 4, "E": 5, "F": 6, "G": 7, "H": 8, "I": 9,
+              "a": -1, "b": -2, "c": -3, "d": -4, "e": -5, "f": -6, "g": -7, "h": -8, "i": -9}
+DIF_DIGITS = {"%": 0, "J": 1, "K": 2, "L": 3, "M": 4, "N": 5, "O": 6, "P": 7, "Q": 8, "R": 9,
+              "j": -1, "k": -2, "l": -3, "m": -4, "n": -5, "o": -6, "p": -7, "q": -8, "r": -9}
+DUP_DIGITS = {"S": 1, "T": 2, "U": 3, "V": 4, "W": 5, "X": 6, "Y": 7, "Z": 8, "s": 9}
+
+# 含有这些字符的行一定是 ASDF 压缩形式；E/e 只有后面不跟 +/- 时才视为 SQZ 字符
+_ASDF_CHARS = re.compile(r"[@A-DF-Za-df-z%]|[eE](?![+-])")
+_NUMBER = re.compile(r"[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?")
+
+# 数据区的标签
+DATA_LABELS = ("XYDATA", "PEAKTABLE", "XYPOINTS")
+
+# 自动取峰时的相对强度阈值 (%)
+MASS_MIN_RELATIVE_INTENSITY = 1.0
+NMR_MIN_RELATIVE_INTENSITY = 5.0
+# iter_xy 每块的点数
+DEFAULT_CHUNK_SIZE = 65536
+
+
+def normalize_label(label):
+    """标签规范化：大写，去掉空格、-、/、_ (JCAMP 规定这些字符不参与比较)。"""
+    return re.sub(r"[\s\-/_]", "", label).upper()
+
+
+def decode_asdf_line(line):
+    """
+    解码一行 XYDATA，返回 (values, ends_with_dif)。
+
+    values[0] 为该行的 X，其余为 Y。支持 AFFN、PAC、SQZ、DIF、DUP 混合形式。
+    """
+    line = line.split("$$", 1)[0]
+    if not _ASDF_CHARS.search(line):
+        return [float(v) for v in _NUMBER.findall(line)], False
+
+    values = []
+    token = ""
+    kind = None
+    last_dif = None
+
+    def flush():
+        nonlocal last_dif
+        if not token or token in "+-":
+            return
+        if kind == "dup":
+            count = int(token)
+            for _ in range(count - 1):
+                values.append(values[-1] + last_dif if last_dif is not None else values[-1])
+        elif kind == "dif":
+            last_dif = float(token)
+            values.append(values[-1] + last_dif)
+        else:
+            last_dif = None
+            values.append(float(token))
+
+    for ch in line:
+        if ch.isdigit() or ch == ".":
+            if kind is None:
+                kind = "abs"
+            token += ch
+        elif ch in SQZ_DIGITS:
+            flush()
+            d = SQZ_DIGITS[ch]
+            token, kind = ("-" if d < 0 else "") + str(abs(d)), "abs"
+        elif ch in DIF_DIGITS:
+            flush()
+            d = DIF_DIGITS[ch]
+            token, kind = ("-" if d < 0 else "") + str(abs(d)), "dif"
+        elif ch in DUP_DIGITS:
+            flush()
+            token, kind = str(DUP_DIGITS[ch]), "dup"
+        elif ch in "+-":
+            flush()
+            token, kind = ch, "abs"
+        else:
+            # 空格、逗号等分隔符
+            flush()
+            token, kind = "", None
+    flush()
+    return values, last_dif is not None
+
+
+class JcampBlock:
+    """
+    JCAMP-DX 的一个数据块。
+
+    读取时只记录标签与数据区在文件中的字节范围，X/Y 数组在第一次访问时才解码。
+    """
+
+    def __init__(self, source, labels, data_label, data_format, data_start, data_end):
+        self._source = source
+        self.labels = labels
+        self.data_label = data_label
+        self.data_format = data_format
+        self._data_range = (data_start, data_end)
+        self._xy = None
+
+    def __repr__(self):
+        return f"<JcampBlock {self.title!r} {self.data_type!r} {self.data_label}>"
+
+    @property
+    def title(self):
+        return self.labels.get("TITLE", "")
+
+    @property
+    def data_type(self):
+        return self.labels.get("DATATYPE", "").upper()
+
+    @property
+    def nucleus(self):
+        """NMR 观测核，如 "1H"、"13C"。"""
+        return self.labels.get(".OBSERVENUCLEUS", "").replace("^", "").upper()
+
+    @property
+    def is_peak_table(self):
+        return self.data_label in ("PEAKTABLE", "XYPOINTS")
+
+    def number(self, label, default=None):
+        try:
+            return float(self.labels[label].split()[0])
+        except (KeyError, ValueError, IndexError):
+            return default
+
+    def _lines(self):
+        start, end = self._data_range
+        for _, _, text in _iter_ldr_lines(self._source, start, end):
+            yield text
+
+    def _x_scale(self):
+        """NMR 横轴为 Hz 时换算为 ppm 的除数。"""
+        if self.data_type.startswith("NMR") and self.labels.get("XUNITS", "").upper() == "HZ":
+            return self.number(".OBSERVEFREQUENCY", 1.0) or 1.0
+        return 1.0
+
+    def iter_xy(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        按块解码数据，逐块产出 (x, y) numpy 数组，内存占用只与 chunk_size 有关。
+        可以直接交给 profileMASS.centroid_stream。
+        """
+        xfactor = self.number("XFACTOR", 1.0)
+        yfactor = self.number("YFACTOR", 1.0)
+        x_scale = self._x_scale()
+
+        if self.is_peak_table:
+            numbers = []
+            for line in self._lines():
+                numbers.extend(float(v) for v in _NUMBER.findall(line.split("$$", 1)[0]))
+            width = 3 if "W" in self.data_format.upper() else 2
+            table = np.array(numbers[: len(numbers) // width * width]).reshape(-1, width)
+            yield table[:, 0] * xfactor / x_scale, table[:, 1] * yfactor
+            return
+
+        first_x = self.number("FIRSTX")
+        last_x = self.number("LASTX")
+        n_points = self.number("NPOINTS")
+        if first_x is None or last_x is None or not n_points:
+            raise ValueError("XYDATA block needs FIRSTX, LASTX and NPOINTS.")
+        delta = (last_x - first_x) / (n_points - 1) if n_points > 1 else 0.0
+
+        ys = []
+        produced = 0
+        prev_dif = False
+        for line in self._lines():
+            if not line.strip():
+                continue
+            values, ends_dif = decode_asdf_line(line)
+            if not values:
+                continue
+            # 行首为 X；X 由 FIRSTX/DELTAX 推出，这里只取 Y
+            y_line = values[1:]
+            # 上一行以 DIF 结尾时，本行第一个 Y 是校验值
+            if prev_dif and y_line:
+                y_line = y_line[1:]
+            prev_dif = ends_dif
+            ys.extend(y_line)
+            if len(ys) >= chunk_size:
+                yield self._emit(ys, produced, first_x, delta, yfactor, x_scale)
+                produced += len(ys)
+                ys = []
+        if ys:
+            yield self._emit(ys, produced, first_x, delta, yfactor, x_scale)
+
+    @staticmethod
+    def _emit(ys, produced, first_x, delta, yfactor, x_scale):
+        y = np.asarray(ys, dtype=np.float64) * yfactor
+        x = first_x + delta * (produced + np.arange(y.size))
+        return x / x_scale, y
+
+    def _decode(self):
+        if self._xy is None:
+            xs, ys = [], []
+            for x, y in self.iter_xy():
+                xs.append(x)
+                ys.append(y)
+            if xs:
+                self._xy = (np.concatenate(xs), np.concatenate(ys))
+            else:
+                self._xy = (np.empty(0), np.empty(0))
+        return self._xy
+
+    @property
+    def x(self):
+        return self._decode()[0]
+
+    @property
+    def y(self):
+        return self._decode()[1]
+
+
+def _iter_ldr_lines(buffer, start=0, stop=None):
+    """逐行产出 (起始偏移, 结束偏移, 文本)，不一次性解码整个文件。"""
+    pos = start
+    size = len(buffer) if stop is None else stop
+    while pos < size:
+        end = buffer.find(b"\n", pos, size)
+        if end == -1:
+            end = size
+        yield pos, end, buffer[pos:end].decode("latin-1").rstrip("\r")
+        pos = end + 1
+
+
+def parse_jcamp(buffer):
+    """
+    扫描 JCAMP-DX 内容（bytes 或 mmap），返回含数据的 JcampBlock 列表。
+
+    数据区不逐行解析，而是直接跳到下一个以 ## 开头的行，因此建索引的开销与数据量基本无关。
+    支持 ##BLOCKS 复合文件（LINK 块本身不返回）。NTUPLES 格式暂不支持，会被跳过。
+    """
+    blocks = []
+    stack = []
+    current = None
+    label = None
+    pos = 0
+    size = len(buffer)
+
+    while pos < size:
+        end = buffer.find(b"\n", pos)
+        if end == -1:
+            end = size
+        text = buffer[pos:end].decode("latin-1").strip()
+        next_pos = end + 1
+
+        if not text.startswith("##"):
+            # 多行标签值的续行
+            if current is not None and label is not None:
+                current["labels"][label] += "\n" + text
+            pos = next_pos
+            continue
+
+        name, _, value = text[2:].partition("=")
+        label = normalize_label(name)
+        value = value.split("$$", 1)[0].strip()
+
+        if label == "TITLE":
+            current = {"labels": {}, "data": None}
+            stack.append(current)
+        elif current is None:
+            pos = next_pos
+            continue
+
+        if label == "END":
+            finished = stack.pop()
+            if finished["data"] is not None:
+                blocks.append(JcampBlock(buffer, finished["labels"], *finished["data"]))
+            current = stack[-1] if stack else None
+            label = None
+            pos = next_pos
+            continue
+
+        current["labels"][label] = value
+        if label in DATA_LABELS:
+            # 跳过数据区，记录其字节范围
+            data_end = buffer.find(b"\n##", end)
+            data_end = size if data_end == -1 else data_end + 1
+            current["data"] = (label, value, next_pos, data_end)
+            label = None
+            pos = data_end
+            continue
+        pos = next_pos
+
+    return blocks
+
+
+def read_jcamp(path):
+    """以内存映射方式打开 JCAMP-DX 文件并建立块索引；数据在访问时才解码。"""
+    with open(path, "rb") as f:
+        try:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # 空文件无法映射
+            buffer = b""
+    return parse_jcamp(buffer)
+
+
+def _pick_peaks(block, min_relative_intensity, sign=1):
+    """连续谱自动取峰；peak table 直接返回。sign=-1 时取负峰（DEPT-135）。"""
+    if block.is_peak_table:
+        x, y = block.x, block.y * sign
+        keep = y > 0
+        if not keep.any():
+            return []
+        rel = y[keep] / y[keep].max() * 100.0
+        return [(float(a), float(b)) for a, b in zip(x[keep], rel) if b >= min_relative_intensity]
+    chunks = ((x, np.clip(y * sign, 0, None)) for x, y in block.iter_xy())
+    return centroid_stream(chunks, min_relative_intensity=min_relative_intensity)
+
+
+def _dept_kind(block):
+    """根据脉冲序列或标题判断 13C 块的类型：bb / dept90 / dept135。"""
+    text = " ".join([block.title, block.labels.get(".PULSESEQUENCE", "")]).upper()
+    if "DEPT" in text:
+        if "90" in text:
+            return "dept90"
+        return "dept135"
+    return "bb"
+
+
+def jcamp_to_input(blocks):
+    """
+    把 JCAMP 块按数据类型分派，合成一个 gen_datas 可直接使用的输入 dict。
+
+    - MASS SPECTRUM -> "mass" ([m/z, 相对强度] 列表)
+    - INFRARED SPECTRUM -> "ir_spectrum" (x/y 数组) 或 "ir" (峰表)
+    - 13C NMR -> "c_nmr" (bb / dept90 / dept135)
+    - 1H NMR -> "h_nmr_spectrum" (x/y 数组或峰表)
+    """
+    data = {}
+    for block in blocks:
+        dtype = block.data_type
+        if "MASS" in dtype:
+            peaks = _pick_peaks(block, MASS_MIN_RELATIVE_INTENSITY)
+            data["mass"] = [[round(mz, 4), round(i, 2)] for mz, i in peaks]
+        elif "INFRARED" in dtype or dtype.startswith("IR"):
+            if block.is_peak_table:
+                data["ir"] = [round(float(v)) for v in block.x]
+            else:
+                yunits = block.labels.get("YUNITS", "").upper()
+                mode = "transmittance" if "TRANS" in yunits else "absorbance" if "ABS" in yunits else "auto"
+                data["ir_spectrum"] = {"x": block.x, "y": block.y, "mode": mode}
+        elif dtype.startswith("NMR"):
+            nucleus = block.nucleus
+            if nucleus == "13C":
+                c_nmr = data.setdefault("c_nmr", {"bb": [], "dept90": [], "dept135": []})
+                kind = _dept_kind(block)
+                if kind == "bb":
+                    peaks = _pick_peaks(block, NMR_MIN_RELATIVE_INTENSITY)
+                    c_nmr["bb"] = [[round(s, 1), "1"] for s, _ in peaks]
+                elif kind == "dept90":
+                    peaks = _pick_peaks(block, NMR_MIN_RELATIVE_INTENSITY)
+                    c_nmr["dept90"] = [round(s, 1) for s, _ in peaks]
+                else:
+                    up = _pick_peaks(block, NMR_MIN_RELATIVE_INTENSITY, sign=1)
+                    down = _pick_peaks(block, NMR_MIN_RELATIVE_INTENSITY, sign=-1)
+                    c_nmr["dept135"] = [[round(s, 1), 1] for s, _ in up] + [[round(s, 1), -1] for s, _ in down]
+            elif nucleus == "1H":
+                if block.is_peak_table:
+                    data["h_nmr_spectrum"] = {"peaks": [[float(a), float(b)] for a, b in zip(block.x, block.y)]}
+                else:
+                    data["h_nmr_spectrum"] = {"x": block.x, "y": block.y}
+                # 多重峰分组按 Hz 计算耦合间距，需要观测频率
+                sfo1 = block.number(".OBSERVEFREQUENCY")
+                if sfo1:
+                    data["h_nmr_spectrum"]["sfo1"] = sfo1
+    return data
+
+
+def load_jcamp_input(paths):
+    """读取一个或多个 JCAMP-DX 文件，合并为一个 gen_datas 输入 dict（后读的文件覆盖先读的同名键）。"""
+    if isinstance(paths, str):
+        paths = [paths]
+    data = {}
+    for path in paths:
+        data.update(jcamp_to_input(read_jcamp(path)))
+    return data
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("用法: python readJCAMP.py <文件.jdx> [...]")
+        sys.exit(1)
+    for path in sys.argv[1:]:
+        for block in read_jcamp(path):
+            print(path, block)
+    print(sorted(load_jcamp_input(sys.argv[1:]).keys()))
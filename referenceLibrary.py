@@ -0,0 +1,511 @@
+import sys
+import os
+import json
+import threading
+
+import numpy as np
+
+from readJCAMP import load_jcamp_input
+from processC_DEPR_NMR import interpret_dept_data, dept_tolerances
+from enumerateStructure import is_solvent_peak
+
+def load_locales():
+    try:
+        if getattr(sys, 'frozen', False):
+            base_dir = os.path.dirname(sys.executable)
+        else:
+            base_dir = os.path.dirname(__file__)
+        path = os.path.join(base_dir, "locales.json")
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+    except Exception:
+        pass
+    return {}
+
+LOCALES = load_locales()
+
+def tr(key, lang='zh', *args):
+    lang_data = LOCALES.get(lang, {})
+    text = lang_data.get(key, key)
+    if args:
+        try:
+            return text.format(*args)
+        except:
+            return text
+    return text
+
+LIBRARY_FILE = "reference.jsonl"
+# 编译后的索引放在与库文件同名、加此后缀的目录中（.npy 文件，以内存映射方式读取）
+CACHE_SUFFIX = ".cache"
+
+# 各谱图分块：(名称, 下限, 上限, 箱宽, 相邻箱权重)。箱中心为 下限 + k * 箱宽；
+# IR 与 13C 把每个峰以相邻箱权重分到左右两箱，使相差不到一个箱宽的峰仍有重叠
+SPECTRUM_BLOCKS = (
+    ("mass", 1.0, 1000.0, 1.0, 0.0),
+    ("ir", 400.0, 4000.0, 10.0, 0.5),
+    ("c_nmr", -10.0, 240.0, 1.0, 0.5),
+)
+BLOCK_NAMES = tuple(b[0] for b in SPECTRUM_BLOCKS)
+
+# 检索参数的默认值，可在 API.json 中用同名键覆盖（见 library_options）
+DEFAULT_LIBRARY_OPTIONS = {
+    # 参考库路径，空字符串表示程序目录下的 reference.jsonl
+    "library_path": "",
+    "library_top_k": 5,
+    # 相似度达到 library_report 的命中写入报告；达到 library_accept 且
+    # 至少比对了 library_min_blocks 种谱图、没有其它结构同样达到时直接作为答案，不再请求 AI
+    "library_report": 0.8,
+    "library_accept": 0.95,
+    "library_min_blocks": 2,
+    # 13C 倒排索引预筛：条目须在 ±1 个箱内含有查询中至少这一比例的 13C 峰
+    "library_min_carbon_fraction": 0.8,
+}
+
+
+def library_options(config=None):
+    """从配置中取出参考库选项，缺省项使用 DEFAULT_LIBRARY_OPTIONS。"""
+    options = dict(DEFAULT_LIBRARY_OPTIONS)
+    for name in DEFAULT_LIBRARY_OPTIONS:
+        if config and config.get(name) is not None:
+            options[name] = type(DEFAULT_LIBRARY_OPTIONS[name])(config[name])
+    return options
+
+
+def _base_dir():
+    if getattr(sys, 'frozen', False):
+        return os.path.dirname(sys.executable)
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+def default_library_path():
+    return os.path.join(_base_dir(), LIBRARY_FILE)
+
+
+def spectrum_peaks(data):
+    """
+    从输入 JSON 取出参与比对的峰表 {"mass": [[m/z, 强度], ...], "ir": [波数, ...], "c_nmr": [位移, ...]}。
+    JCAMP-DX 文件先解码（JSON 中显式给出的键优先）；13C 去掉溶剂峰；没有强度的质谱峰强度记为 100。
+    """
+    if "jcamp" in data:
+        data = {**load_jcamp_input(data["jcamp"]), **{k: v for k, v in data.items() if k != "jcamp"}}
+    peaks = {}
+    if data.get("mass"):
+        peaks["mass"] = [[float(m[0]), float(m[1]) if len(m) > 1 else 100.0] if isinstance(m, (list, tuple))
+                         else [float(m), 100.0] for m in data["mass"]]
+    if data.get("ir"):
+        peaks["ir"] = [float(w[0] if isinstance(w, (list, tuple)) else w) for w in data["ir"]]
+    c_nmr = data.get("c_nmr")
+    if isinstance(c_nmr, dict) and c_nmr.get("bb"):
+        resolved = interpret_dept_data(c_nmr.get("bb", []), c_nmr.get("dept90", []), c_nmr.get("dept135", []),
+                                       **dept_tolerances(c_nmr))
+        peaks["c_nmr"] = [float(p[0]) for p in resolved if not is_solvent_peak(*p)]
+    return peaks
+
+
+def _block_offsets():
+    offsets, start = {}, 0
+    for name, low, high, width, _ in SPECTRUM_BLOCKS:
+        size = int(round((high - low) / width)) + 1
+        offsets[name] = (start, size)
+        start += size
+    return offsets, start
+
+
+BLOCK_OFFSETS, DIMENSION = _block_offsets()
+
+
+def _center_bins(name, values):
+    """各峰所在箱在整个向量中的列号，超出范围的峰为 -1。"""
+    _, low, _, width, _ = SPECTRUM_BLOCKS[BLOCK_NAMES.index(name)]
+    start, size = BLOCK_OFFSETS[name]
+    bins = np.rint((np.asarray(values, dtype=np.float64) - low) / width).astype(np.int64)
+    return np.where((bins >= 0) & (bins < size), bins + start, -1)
+
+
+def _peak_weights(name, peaks):
+    """一个分块的 (位置, 权重)：质谱以强度的平方根为权重，IR 与 13C 每个峰权重为 1。"""
+    if name == "mass":
+        return [p[0] for p in peaks], [max(p[1], 0.0) ** 0.5 for p in peaks]
+    return list(peaks), [1.0] * len(peaks)
+
+
+def _bin_block(name, rows, values, weights):
+    """
+    把一个分块中所有条目的峰分箱，rows 为各峰所属条目。返回按 (条目, 列号) 去重的 (rows, cols, vals)：
+    同一箱中的峰取最大权重，每个条目的该分块归一化为单位长度。
+    """
+    spread = SPECTRUM_BLOCKS[BLOCK_NAMES.index(name)][4]
+    start, size = BLOCK_OFFSETS[name]
+    rows = np.asarray(rows, dtype=np.int64)
+    weights = np.asarray(weights, dtype=np.float64)
+    center = _center_bins(name, values)
+    all_rows, cols, vals = [rows], [center], [weights]
+    if spread:
+        for step in (-1, 1):
+            side = center + step
+            all_rows.append(rows)
+            cols.append(np.where((center >= 0) & (side >= start) & (side < start + size), side, -1))
+            vals.append(weights * spread)
+    rows, cols, vals = np.concatenate(all_rows), np.concatenate(cols), np.concatenate(vals)
+    keep = (cols >= 0) & (vals > 0)
+    rows, cols, vals = rows[keep], cols[keep], vals[keep]
+    key = rows * DIMENSION + cols
+    order = np.lexsort((vals, key))
+    key, vals = key[order], vals[order]
+    # 每组 (条目, 列号) 按权重升序排列，取组内最后一个即最大权重
+    last = np.flatnonzero(np.append(key[1:] != key[:-1], True))
+    key, vals = key[last], vals[last]
+    rows, cols = key // DIMENSION, key % DIMENSION
+    norms = np.sqrt(np.bincount(rows, weights=vals * vals))
+    return rows, cols, vals / norms[rows]
+
+
+def spectrum_vector(peaks):
+    """把峰表分箱为稀疏向量 {分块: (列号, 权重)}，每个分块单独归一化为单位长度（见 _bin_block）。"""
+    vector = {}
+    for name in BLOCK_NAMES:
+        if not peaks.get(name):
+            continue
+        values, weights = _peak_weights(name, peaks[name])
+        _, cols, vals = _bin_block(name, np.zeros(len(values)), values, weights)
+        if cols.size:
+            vector[name] = (cols, vals)
+    return vector
+
+
+def _ranges(starts, ends):
+    """把若干 [start, end) 区间拼接成一个下标数组。"""
+    counts = ends - starts
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+    within = np.arange(offsets[-1]) - np.repeat(offsets[:-1], counts)
+    return np.repeat(starts, counts) + within
+
+
+class ReferenceLibrary:
+    """
+    参考谱图库：每个条目是一张分箱稀疏向量（见 spectrum_vector），整体按列（箱）存成 CSC 形式的
+    稀疏矩阵 ptr / rows / vals，即以箱为键的倒排索引，其中 13C 分块的列兼作 13C 位移的倒排索引。
+    检索时只读取查询非零箱对应的倒排表，按分块累加点积即得余弦相似度，与条目数近似线性、与维数无关。
+    数组可以是内存映射的 .npy 文件。条目的其余信息保存在库文件中，按 offsets 的字节位置读取。
+    """
+
+    def __init__(self, path, ptr, rows, vals, blocks, formulas, offsets):
+        self.path = path
+        self.ptr = ptr
+        self.rows = rows
+        self.vals = vals
+        self.blocks = blocks
+        self.formulas = formulas
+        self.offsets = offsets
+
+    def __len__(self):
+        return self.blocks.size
+
+    @classmethod
+    def build(cls, path):
+        """解析库文件（JSONL，每行一个条目，见 add_reference）并编译为内存中的数组。"""
+        peaks = {name: ([], [], []) for name in BLOCK_NAMES}
+        formulas, offsets = [], [0]
+        with open(path, "rb") as f:
+            for line in f:
+                offsets.append(offsets[-1] + len(line))
+                # 空行也占一个条目位置，使行号与条目下标一致
+                entry = json.loads(line) if line.strip() else {}
+                for name, (rows, values, weights) in peaks.items():
+                    if entry.get("peaks", {}).get(name):
+                        v, w = _peak_weights(name, entry["peaks"][name])
+                        rows.extend([len(formulas)] * len(v))
+                        values.extend(v)
+                        weights.extend(w)
+                formulas.append(entry.get("formula") or "")
+        n = len(formulas)
+        blocks = np.zeros(n, dtype=np.uint8)
+        rows, cols, vals = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)], [np.zeros(0)]
+        for name, (r, v, w) in peaks.items():
+            r, c, v = _bin_block(name, r, v, w)
+            blocks[np.unique(r)] |= 1 << BLOCK_NAMES.index(name)
+            rows.append(r)
+            cols.append(c)
+            vals.append(v)
+        rows, cols, vals = np.concatenate(rows), np.concatenate(cols), np.concatenate(vals)
+        order = np.argsort(cols, kind="stable")
+        ptr = np.concatenate(([0], np.cumsum(np.bincount(cols, minlength=DIMENSION)))).astype(np.int64)
+        return cls(path, ptr, rows[order].astype(np.int32), vals[order].astype(np.float32), blocks,
+                   np.asarray(formulas, dtype=str), np.asarray(offsets, dtype=np.int64))
+
+    _ARRAYS = ("ptr", "rows", "vals", "blocks", "formulas", "offsets")
+
+    def save_cache(self, cache_dir, stamp):
+        """把数组写成 cache_dir 下的 .npy 文件；stamp.json 最后写入，记录对应库文件的 (mtime, size)。"""
+        os.makedirs(cache_dir, exist_ok=True)
+        stamp_path = os.path.join(cache_dir, "stamp.json")
+        if os.path.exists(stamp_path):
+            os.remove(stamp_path)
+        for name in self._ARRAYS:
+            with open(os.path.join(cache_dir, name + ".npy"), "wb") as f:
+                np.save(f, getattr(self, name))
+        with open(stamp_path, "w", encoding="utf-8") as f:
+            json.dump(list(stamp), f)
+
+    @classmethod
+    def from_cache(cls, path, cache_dir, stamp):
+        """读取与库文件 stamp 一致的缓存，数组以只读内存映射打开；缓存缺失或过期时抛出 OSError / ValueError。"""
+        with open(os.path.join(cache_dir, "stamp.json"), "r", encoding="utf-8") as f:
+            if tuple(json.load(f)) != tuple(stamp):
+                raise ValueError("stale reference cache")
+        arrays = [np.load(os.path.join(cache_dir, name + ".npy"), mmap_mode="r", allow_pickle=False)
+                  for name in cls._ARRAYS]
+        return cls(path, *arrays)
+
+    def entry(self, index):
+        """第 index 个条目的完整信息（从库文件按字节位置读取）。"""
+        with open(self.path, "rb") as f:
+            f.seek(int(self.offsets[index]))
+            return json.loads(f.readline())
+
+    def _postings(self, columns):
+        """若干列（箱）的倒排表在 rows / vals 中的下标。"""
+        return _ranges(np.asarray(self.ptr[columns]), np.asarray(self.ptr[columns + 1]))
+
+    def search(self, peaks, *, top_k=DEFAULT_LIBRARY_OPTIONS["library_top_k"], formula=None,
+               min_carbon_fraction=DEFAULT_LIBRARY_OPTIONS["library_min_carbon_fraction"]):
+        """
+        余弦相似度最高的 top_k 个条目，返回 [{"index", "score", "blocks"}, ...]，score 降序。
+        score 为查询中各分块余弦相似度的平均（条目缺少的分块记 0），blocks 为双方都有的分块数。
+        查询含 13C 时先用 13C 倒排索引筛掉峰重合比例不足 min_carbon_fraction 的条目；
+        给出 formula 时只保留分子式相同或未记录分子式的条目。
+        """
+        n = len(self)
+        vector = spectrum_vector(peaks)
+        if not n or not vector:
+            return []
+        candidates = np.ones(n, dtype=bool)
+        if "c_nmr" in vector:
+            centers = _center_bins("c_nmr", peaks["c_nmr"])
+            centers = centers[centers >= 0]
+            hits = np.bincount(self.rows[self._postings(centers)], minlength=n)
+            candidates &= hits >= np.ceil(min_carbon_fraction * centers.size)
+        if formula:
+            candidates &= (self.formulas == formula) | (self.formulas == "")
+        scores = np.zeros(n)
+        shared = np.zeros(n, dtype=np.int64)
+        for name, (cols, weights) in vector.items():
+            idx = self._postings(cols)
+            counts = np.asarray(self.ptr[cols + 1] - self.ptr[cols])
+            scores += np.bincount(self.rows[idx], weights=self.vals[idx] * np.repeat(weights, counts), minlength=n)
+            shared += (np.asarray(self.blocks) >> BLOCK_NAMES.index(name)) & 1
+        scores /= len(vector)
+        scores[~candidates] = 0.0
+        k = min(top_k, n)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [{"index": int(i), "score": round(float(scores[i]), 4), "blocks": int(shared[i])}
+                for i in top if scores[i] > 0]
+
+
+def _stamp(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def load_reference_library(path=None, use_cache=True):
+    """
+    读取参考库。use_cache 为 True 时优先以内存映射方式读取与库文件一致的编译缓存，
+    否则解析库文件并尝试写出缓存（目录不可写或文件被占用时静默跳过）。库文件不存在时返回 None。
+    """
+    path = path or default_library_path()
+    try:
+        stamp = _stamp(path)
+    except FileNotFoundError:
+        return None
+    cache_dir = path + CACHE_SUFFIX
+    if use_cache:
+        try:
+            return ReferenceLibrary.from_cache(path, cache_dir, stamp)
+        except (OSError, ValueError, KeyError):
+            pass
+    library = ReferenceLibrary.build(path)
+    if use_cache:
+        try:
+            library.save_cache(cache_dir, stamp)
+        except OSError:
+            pass
+    return library
+
+
+_libraries = {}
+_libraries_lock = threading.Lock()
+
+
+def get_reference_library(path=None):
+    """
+    按路径复用已加载的参考库（线程安全）；库文件修改（如 add_reference 追加条目）后自动重新加载。
+    库文件不存在时返回 None。
+    """
+    path = os.path.abspath(path or default_library_path())
+    try:
+        stamp = _stamp(path)
+    except FileNotFoundError:
+        return None
+    cached = _libraries.get(path)
+    if cached is None or cached[0] != stamp:
+        with _libraries_lock:
+            cached = _libraries.get(path)
+            if cached is None or cached[0] != stamp:
+                cached = _libraries[path] = (stamp, load_reference_library(path))
+    return cached[1]
+
+
+def add_reference(data, *, smiles=None, formula=None, name=None, structure=None, source=None, path=None):
+    """
+    把一个已确认结构的样品追加到参考库：保存其峰表（见 spectrum_peaks）与结构信息。
+    至少需要 smiles、formula、name 之一；样品中没有可比对的谱图时抛出 ValueError。
+    """
+    assert smiles or formula or name, "至少需要 smiles、formula 或 name 之一"
+    peaks = spectrum_peaks(data)
+    if not peaks:
+        raise ValueError("Sample has no mass, ir or c_nmr peaks to store.")
+    entry = {"name": name, "formula": formula or data.get("formula"), "smiles": smiles,
+             "structure": structure, "source": source, "peaks": peaks}
+    path = path or default_library_path()
+    with _libraries_lock:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    return entry
+
+
+def import_results(input_path, results_path, *, path=None, verdicts=("consistent",)):
+    """
+    从批量运行的输入与结果 (run_batch 的输出 JSONL) 中自动导入核验结论在 verdicts 中的回答结构，
+    只取回答给出的结构（核验的首个候选，须带 SMILES），不取正文中提到的片段。
+    未经人工确认，命令行上须加 --auto 才会调用；人工确认的结构请用 add_reference 逐个追加。
+    参考库命中的样品与仅凭本地枚举得出的答案（未经 AI 回答）不导入。返回导入的条目数。
+    """
+    from guess import iter_samples
+
+    confirmed = {}
+    with open(results_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record.get("error") or (record.get("library") or {}).get("match"):
+                continue
+            # 本地枚举直接采用的样品不会进入 Step 2，没有 functional_groups
+            if "functional_groups" not in record:
+                continue
+            verification = record.get("verification")
+            if not verification or verification.get("verdict") not in verdicts or not verification["candidates"]:
+                continue
+            best = verification["candidates"][0]
+            if not best.get("proposed") or not best.get("smiles"):
+                continue
+            confirmed[str(record["id"])] = (best, record.get("structure"))
+    added = 0
+    for sample_id, data in iter_samples(input_path):
+        if str(sample_id) not in confirmed:
+            continue
+        best, structure = confirmed[str(sample_id)]
+        try:
+            add_reference(data, smiles=best.get("smiles"), formula=best.get("formula"), structure=structure,
+                          source=f"{os.path.basename(input_path)}#{sample_id}", path=path)
+        except ValueError:
+            continue
+        added += 1
+    return added
+
+
+def search_library(data, options=None):
+    """
+    用样品的峰表检索参考库，返回 {"hits": [...], "match": 可直接采用的命中或 None}；库不存在时返回 None。
+    hits 只含相似度达到 library_report 的命中，每项为条目信息加上 index、score 与 blocks。
+    """
+    options = dict(DEFAULT_LIBRARY_OPTIONS, **(options or {}))
+    library = get_reference_library(options["library_path"] or None)
+    if library is None:
+        return None
+    found = library.search(spectrum_peaks(data), top_k=options["library_top_k"], formula=data.get("formula"),
+                           min_carbon_fraction=options["library_min_carbon_fraction"])
+    hits = []
+    for hit in found:
+        if hit["score"] < options["library_report"]:
+            break
+        entry = library.entry(hit["index"])
+        entry.pop("peaks", None)
+        hits.append(dict(entry, **hit))
+    accepted = [h for h in hits if h["score"] >= options["library_accept"]]
+    match = None
+    if accepted and accepted[0]["blocks"] >= options["library_min_blocks"]:
+        key = lambda h: h.get("smiles") or h.get("formula") or h.get("name")
+        # 两个不同结构都达到接受阈值时不直接采用
+        if all(key(h) == key(accepted[0]) for h in accepted):
+            match = accepted[0]
+    return {"hits": hits, "match": match}
+
+
+def _hit_name(hit):
+    return hit.get("name") or hit.get("smiles") or hit.get("formula")
+
+
+def format_library_hits(result, lang='zh'):
+    """达到报告阈值的命中列表（加入 Step 3 prompt 或显示），没有命中时返回空列表。"""
+    if not result or not result["hits"]:
+        return []
+    lines = [tr("library_hits_title", lang)]
+    for k, hit in enumerate(result["hits"], 1):
+        detail = " ".join(v for v in (hit.get("smiles"), hit.get("formula")) if v and v != _hit_name(hit))
+        lines.append(tr("library_hit_line", lang, k, _hit_name(hit), detail, hit["score"]))
+    return lines
+
+
+def format_library_match(result, lang='zh'):
+    """直接采用的命中作为结构回答的文字。"""
+    hit = result["match"]
+    return tr("library_match_answer", lang, _hit_name(hit), hit.get("formula") or "-", hit.get("smiles") or "-",
+              hit["score"])
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Reference spectra library: add confirmed samples and search")
+    parser.add_argument("--library", help="参考库路径，默认为程序目录下的 reference.jsonl")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="追加一个已确认结构的样品")
+    add.add_argument("sample", help="样品 JSON")
+    add.add_argument("--smiles")
+    add.add_argument("--formula")
+    add.add_argument("--name")
+    imported = commands.add_parser("import", help="从批量运行结果导入已确认的结构")
+    imported.add_argument("input", help="批量运行的输入（JSON、目录或 JSONL）")
+    imported.add_argument("results", help="批量运行的结果 JSONL")
+    imported.add_argument("--auto", action="store_true", help="确认自动导入核验结论为吻合的回答（未经人工确认）")
+    imported.add_argument("--doubtful", action="store_true", help="核验结论为存疑的回答也导入")
+    search = commands.add_parser("search", help="检索与样品最相似的条目")
+    search.add_argument("sample", help="样品 JSON")
+    search.add_argument("-k", "--top-k", type=int, default=DEFAULT_LIBRARY_OPTIONS["library_top_k"])
+    commands.add_parser("build", help="重新编译索引")
+    args = parser.parse_args()
+
+    if args.command == "add":
+        with open(args.sample, "r", encoding="utf-8") as f:
+            sample = json.load(f)
+        add_reference(sample, smiles=args.smiles, formula=args.formula, name=args.name,
+                      source=os.path.basename(args.sample), path=args.library)
+    elif args.command == "import":
+        if not args.auto:
+            parser.error("import adds unreviewed answers; pass --auto to confirm, or use add for reviewed structures")
+        verdicts = ("consistent", "doubtful") if args.doubtful else ("consistent",)
+        print(import_results(args.input, args.results, path=args.library, verdicts=verdicts))
+    elif args.command == "search":
+        with open(args.sample, "r", encoding="utf-8") as f:
+            sample = json.load(f)
+        found = search_library(sample, {"library_path": args.library or "", "library_top_k": args.top_k,
+                                        "library_report": 0.0})
+        print(json.dumps(found, ensure_ascii=False, indent=2))
+    else:
+        path = args.library or default_library_path()
+        library = ReferenceLibrary.build(path)
+        library.save_cache(path + CACHE_SUFFIX, _stamp(path))
+        print(len(library))
@@ -0,0 +1,461 @@
+import sys
+import json
+import os
+from functools import lru_cache
+from math import comb
+
+import numpy as np
+
+from molecule import parse_smiles, AROMATIC_BOND, aromatic_distances, classify_substituent, is_carbonyl
+from processH_NMR import estimate_proton_counts, parse_area
+
+def load_locales():
+    try:
+        if getattr(sys, 'frozen', False):
+            base_dir = os.path.dirname(sys.executable)
+        else:
+            base_dir = os.path.dirname(__file__)
+        path = os.path.join(base_dir, "locales.json")
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+    except Exception:
+        pass
+    return {}
+
+LOCALES = load_locales()
+
+def tr(key, lang='zh', *args):
+    lang_data = LOCALES.get(lang, {})
+    text = lang_data.get(key, key)
+    if args:
+        try:
+            return text.format(*args)
+        except:
+            return text
+    return text
+
+# 取代基增量表（经验加和规则，单位 ppm）
+# CH3-X 的甲基位移
+CH3_SHIFTS = {
+    "alkyl": 0.90, "C=C": 1.70, "C#C": 1.80, "aryl": 2.35, "CHO": 2.20, "COR": 2.10, "COOH": 2.10,
+    "COOR": 2.00, "CONR2": 2.00, "CN": 2.00, "OH": 3.40, "OR": 3.30, "OAr": 3.75, "OCOR": 3.65,
+    "NR2": 2.25, "NCOR": 2.85, "NO2": 4.30, "SR": 2.10, "SO2": 2.90, "F": 4.25, "Cl": 3.05,
+    "Br": 2.70, "I": 2.15,
+}
+# X-CH2-Y (基准 1.25) 与 CH (基准 1.50) 的 alpha 增量
+CH2_BASE = 1.25
+CH_BASE = 1.50
+ALPHA_INCREMENTS = {
+    "alkyl": 0.0, "C=C": 0.75, "C#C": 0.90, "aryl": 1.45, "CHO": 1.10, "COR": 1.20, "COOH": 0.80,
+    "COOR": 0.70, "CONR2": 0.80, "CN": 1.20, "OH": 2.30, "OR": 2.10, "OAr": 2.75, "OCOR": 2.80,
+    "NR2": 1.30, "NCOR": 1.90, "NO2": 3.00, "SR": 1.30, "SO2": 1.65, "F": 3.00, "Cl": 2.30,
+    "Br": 2.10, "I": 1.90,
+}
+# beta 位取代基的增量
+BETA_INCREMENTS = {
+    "C=C": 0.10, "C#C": 0.15, "aryl": 0.25, "CHO": 0.20, "COR": 0.20, "COOH": 0.20, "COOR": 0.20,
+    "CONR2": 0.20, "CN": 0.40, "OH": 0.20, "OR": 0.20, "OAr": 0.35, "OCOR": 0.35, "NR2": 0.15,
+    "NCOR": 0.20, "NO2": 0.60, "SR": 0.20, "SO2": 0.35, "F": 0.40, "Cl": 0.45, "Br": 0.55, "I": 0.50,
+}
+# 苯环取代基增量 (ortho, meta, para)，基准 7.27
+BENZENE_BASE = 7.27
+AROMATIC_INCREMENTS = {
+    "alkyl": (-0.18, -0.11, -0.21), "C=C": (0.04, -0.04, -0.12), "C#C": (0.15, -0.02, -0.01),
+    "aryl": (0.23, 0.07, -0.02), "CHO": (0.56, 0.22, 0.29), "COR": (0.62, 0.14, 0.21),
+    "COOH": (0.85, 0.18, 0.27), "COOR": (0.71, 0.11, 0.21), "CONR2": (0.61, 0.10, 0.17),
+    "CN": (0.36, 0.18, 0.28), "OH": (-0.56, -0.12, -0.45), "OR": (-0.48, -0.09, -0.44),
+    "OAr": (-0.29, -0.05, -0.23), "OCOR": (-0.25, 0.03, -0.13), "NR2": (-0.75, -0.25, -0.65),
+    "NCOR": (0.12, -0.07, -0.28), "NO2": (0.95, 0.26, 0.38), "SR": (-0.08, -0.10, -0.24),
+    "SO2": (0.60, 0.25, 0.33), "F": (-0.26, 0.00, -0.20), "Cl": (0.03, -0.02, -0.09),
+    "Br": (0.18, -0.08, -0.04), "I": (0.39, -0.21, 0.00),
+}
+# 六元氮杂芳环按到 N 的距离给出基准值（吡啶）
+AZINE_BASE = {1: 8.55, 2: 7.25, 3: 7.65}
+# 五元杂芳环 (alpha, beta) 基准值
+FIVE_RING_BASE = {"O": (7.42, 6.38), "S": (7.20, 6.96), "N": (6.68, 6.22)}
+# 稠环：邻位 / 间位为稠合碳时的额外去屏蔽
+FUSED_ORTHO = 0.50
+FUSED_META = 0.20
+# 烯氢：5.25 + Z_gem + Z_cis + Z_trans；SMILES 不区分顺反时取 cis/trans 平均
+ALKENE_BASE = 5.25
+ALKENE_INCREMENTS = {
+    "alkyl": (0.45, -0.22, -0.28), "C=C": (1.00, -0.09, -0.23), "C#C": (0.47, 0.38, 0.12),
+    "aryl": (1.38, 0.36, -0.07), "CHO": (1.02, 0.95, 1.17), "COR": (1.10, 1.12, 0.87),
+    "COOH": (0.97, 1.41, 0.71), "COOR": (0.80, 1.18, 0.55), "CONR2": (1.37, 0.98, 0.46),
+    "CN": (0.27, 0.75, 0.55), "OH": (1.22, -1.07, -1.21), "OR": (1.22, -1.07, -1.21),
+    "OAr": (1.22, -1.07, -1.21), "OCOR": (2.11, -0.35, -0.64), "NR2": (0.80, -1.26, -1.21),
+    "NCOR": (2.08, -0.57, -0.72), "NO2": (1.87, 1.32, 0.62), "SR": (1.11, -0.29, -0.13),
+    "SO2": (1.55, 1.16, 0.93), "F": (1.54, -0.40, -1.02), "Cl": (1.08, 0.18, 0.13),
+    "Br": (1.07, 0.45, 0.55), "I": (1.14, 0.81, 0.88),
+}
+# 其它类型氢的固定位移
+ALDEHYDE_SHIFT = 9.70
+ARYL_ALDEHYDE_SHIFT = 9.95
+FORMATE_SHIFT = 8.05
+IMINE_SHIFT = 8.10
+ALKYNE_SHIFT = 2.00
+ARYL_ALKYNE_SHIFT = 3.05
+CYCLOPROPANE_CORRECTION = -1.00
+# 可交换氢 (OH/NH/SH)
+EXCHANGEABLE_SHIFTS = {
+    "acid": 11.5, "phenol": 5.5, "alcohol": 2.0, "amide": 6.5, "pyrrole": 8.0,
+    "aniline": 3.6, "amine": 1.3, "thiophenol": 3.4, "thiol": 1.5,
+}
+
+# 一级近似的邻位偶合常数 (Hz)
+J_SP3 = 7.0
+J_ORTHO = 7.8
+J_FIVE_RING = 3.3
+J_ALKENE = 13.0
+J_ALLYLIC_VICINAL = 6.8
+J_ALDEHYDE = 2.0
+# 间距小于该值 (Hz) 的谱线视为重合
+LINE_RESOLUTION = 1.0
+
+# 打分：位移误差尺度 (ppm)、可交换氢的权重与最大偏离、重数不符的权重
+SHIFT_SCALE = 0.3
+SHIFT_ERROR_CAP = 2.0
+EXCHANGEABLE_WEIGHT = 0.25
+EXCHANGEABLE_WINDOW = 1.5
+MULT_WEIGHT = 0.5
+
+MULT_LABELS = {1: "s", 2: "d", 3: "t", 4: "q", 5: "quint", 6: "sext", 7: "sept"}
+
+
+def _exchangeable_kind(mol, atom):
+    symbol = mol.symbols[atom]
+    nbrs = [j for j, _ in mol.neighbors[atom]]
+    if symbol == "O":
+        if any(is_carbonyl(mol, j) for j in nbrs):
+            return "acid"
+        if any(mol.aromatic[j] for j in nbrs):
+            return "phenol"
+        return "alcohol"
+    if symbol == "N":
+        if mol.aromatic[atom]:
+            return "pyrrole"
+        if any(is_carbonyl(mol, j) for j in nbrs):
+            return "amide"
+        if any(mol.aromatic[j] for j in nbrs):
+            return "aniline"
+        return "amine"
+    if symbol == "S":
+        return "thiophenol" if any(mol.aromatic[j] for j in nbrs) else "thiol"
+    return None
+
+
+def environment_key(mol, atom):
+    """
+    氢所在环境的子结构键：相同的键一定给出相同的预测位移，
+    因此位移计算按键缓存，不同候选结构间共享。
+    """
+    symbol = mol.symbols[atom]
+    n_h = mol.hcounts[atom]
+    if symbol != "C":
+        return ("X", _exchangeable_kind(mol, atom))
+
+    nbrs = mol.neighbors[atom]
+    if mol.aromatic[atom]:
+        ring_size = mol.ring_membership()[atom]
+        distances = aromatic_distances(mol, atom)
+        substituents = []
+        hetero = []
+        fused = []
+        for a, d in distances.items():
+            if d == 0:
+                continue
+            if mol.symbols[a] != "C" and d <= 3:
+                hetero.append((d, mol.symbols[a]))
+            ring_bonds = sum(1 for _, order in mol.neighbors[a] if order == AROMATIC_BOND)
+            if ring_bonds >= 3 and d <= 2:
+                fused.append(d)
+            for b, order in mol.neighbors[a]:
+                if order != AROMATIC_BOND and d <= 3:
+                    substituents.append((d, classify_substituent(mol, a, b)))
+        return ("Ar", ring_size, tuple(sorted(hetero)), tuple(sorted(fused)), tuple(sorted(substituents)))
+
+    for j, order in nbrs:
+        if order == 2 and mol.symbols[j] == "O":
+            formate = any(mol.symbols[k] == "O" and o == 1 for k, o in nbrs)
+            aryl = any(mol.aromatic[k] for k, _ in nbrs)
+            return ("CHO", "formate" if formate else "aryl" if aryl else "alkyl")
+        if order == 2 and mol.symbols[j] == "N":
+            return ("CH=N",)
+        if order == 3:
+            return ("C#CH", any(mol.aromatic[k] for k, o in mol.neighbors[j] if k != atom))
+        if order == 2 and mol.symbols[j] == "C":
+            gem = tuple(sorted(classify_substituent(mol, atom, k) for k, o in nbrs if k != j))
+            far = tuple(sorted(classify_substituent(mol, j, k) for k, o in mol.neighbors[j] if k != atom))
+            return ("C=CH", gem, far)
+
+    alpha = tuple(sorted(classify_substituent(mol, atom, j) for j, _ in nbrs))
+    beta = []
+    for j, _ in nbrs:
+        if mol.symbols[j] == "C" and not mol.aromatic[j] and classify_substituent(mol, atom, j) == "alkyl":
+            beta.extend(classify_substituent(mol, j, k) for k, _ in mol.neighbors[j] if k != atom)
+    ring3 = mol.ring_membership()[atom] == 3
+    return ("sp3", n_h, alpha, tuple(sorted(b for b in beta if b != "alkyl")), ring3)
+
+
+@lru_cache(maxsize=8192)
+def predict_shift(key):
+    """按环境键给出 (化学位移, 是否可交换)。"""
+    kind = key[0]
+    if kind == "X":
+        return EXCHANGEABLE_SHIFTS.get(key[1], 2.0), True
+    if kind == "CHO":
+        return {"formate": FORMATE_SHIFT, "aryl": ARYL_ALDEHYDE_SHIFT}.get(key[1], ALDEHYDE_SHIFT), False
+    if kind == "CH=N":
+        return IMINE_SHIFT, False
+    if kind == "C#CH":
+        return (ARYL_ALKYNE_SHIFT if key[1] else ALKYNE_SHIFT), False
+    if kind == "C=CH":
+        _, gem, far = key
+        shift = ALKENE_BASE
+        shift += sum(ALKENE_INCREMENTS.get(s, (0, 0, 0))[0] for s in gem)
+        shift += sum((ALKENE_INCREMENTS.get(s, (0, 0, 0))[1] + ALKENE_INCREMENTS.get(s, (0, 0, 0))[2]) / 2
+                     for s in far)
+        return shift, False
+    if kind == "Ar":
+        _, ring_size, hetero, fused, substituents = key
+        if ring_size == 5 and hetero:
+            d, element = hetero[0]
+            alpha, beta = FIVE_RING_BASE.get(element, FIVE_RING_BASE["N"])
+            shift = alpha if d == 1 else beta
+        elif hetero:
+            shift = AZINE_BASE.get(hetero[0][0], BENZENE_BASE)
+        else:
+            shift = BENZENE_BASE
+        # 只计最近的稠合碳
+        if fused:
+            shift += FUSED_ORTHO if fused[0] == 1 else FUSED_META
+        shift += sum(AROMATIC_INCREMENTS.get(s, (0, 0, 0))[d - 1] for d, s in substituents)
+        return shift, False
+
+    _, n_h, alpha, beta, ring3 = key
+    if n_h >= 3:
+        shift = CH3_SHIFTS.get(alpha[0], 0.9) if alpha else 0.23
+    else:
+        shift = (CH2_BASE if n_h == 2 else CH_BASE) + sum(ALPHA_INCREMENTS.get(s, 0.0) for s in alpha)
+    shift += sum(BETA_INCREMENTS.get(s, 0.0) for s in beta)
+    if ring3:
+        shift += CYCLOPROPANE_CORRECTION
+    return shift, False
+
+
+@lru_cache(maxsize=1024)
+def multiplet_pattern(couplings, resolution=LINE_RESOLUTION):
+    """
+    一级多重峰谱线：couplings 为 ((n, J), ...)，逐组做二项式分裂（外积展开），
+    再合并间距小于 resolution 的谱线。返回 (偏移 Hz, 相对强度)，强度和为 1。
+    """
+    offsets = np.zeros(1)
+    weights = np.ones(1)
+    for n, j in couplings:
+        k = np.arange(n + 1)
+        offsets = np.add.outer(offsets, (k - n / 2.0) * j).ravel()
+        weights = np.multiply.outer(weights, [comb(n, i) for i in k]).ravel()
+    order = np.argsort(offsets, kind="stable")
+    offsets, weights = offsets[order], weights[order]
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(offsets) > resolution) + 1))
+    merged_w = np.add.reduceat(weights, starts)
+    merged_x = np.add.reduceat(offsets * weights, starts) / merged_w
+    merged_w = merged_w / merged_w.sum()
+    merged_x.setflags(write=False)
+    merged_w.setflags(write=False)
+    return merged_x, merged_w
+
+
+def _coupling(mol, a, b, order, key_a):
+    """a、b 两个相邻含氢碳之间 H-H 的邻位偶合常数。"""
+    if order == AROMATIC_BOND:
+        return J_FIVE_RING if mol.ring_membership()[a] == 5 else J_ORTHO
+    if order == 2:
+        return J_ALKENE
+    if key_a[0] == "CHO" or is_carbonyl(mol, b):
+        return J_ALDEHYDE
+    sp2_a = any(o == 2 for _, o in mol.neighbors[a])
+    sp2_b = any(o == 2 for _, o in mol.neighbors[b])
+    return J_ALLYLIC_VICINAL if sp2_a or sp2_b else J_SP3
+
+
+def predict_signals(mol):
+    """
+    预测一级 1H 谱：每个含氢的拓扑等价类给出一组信号。
+
+    返回 list of dict: shift, h_count, mult, couplings, exchangeable，按位移升序。
+    """
+    classes = mol.symmetry_classes()
+    members = {}
+    for atom, c in enumerate(classes):
+        if mol.hcounts[atom]:
+            members.setdefault(c, []).append(atom)
+
+    signals = []
+    for c, atoms in members.items():
+        atom = atoms[0]
+        key = environment_key(mol, atom)
+        shift, exchangeable = predict_shift(key)
+        couplings = {}
+        if not exchangeable:
+            for b, order in mol.neighbors[atom]:
+                if mol.symbols[b] != "C" or not mol.hcounts[b] or classes[b] == c:
+                    continue
+                j = _coupling(mol, atom, b, order, key)
+                couplings[(classes[b], j)] = couplings.get((classes[b], j), 0) + mol.hcounts[b]
+        pattern = tuple(sorted((n, j) for (_, j), n in couplings.items()))
+        offsets, _ = multiplet_pattern(pattern)
+        signals.append(
+            {
+                "shift": round(float(shift), 2),
+                "h_count": sum(mol.hcounts[a] for a in atoms),
+                "mult": 1 if exchangeable else int(offsets.size),
+                "couplings": pattern,
+                "exchangeable": exchangeable,
+            }
+        )
+    signals.sort(key=lambda s: s["shift"])
+    return signals
+
+
+@lru_cache(maxsize=4096)
+def _simulate_smiles(smiles):
+    mol = parse_smiles(smiles)
+    return tuple(tuple(sorted(s.items())) for s in predict_signals(mol)), mol.formula().get("H", 0)
+
+
+def simulate_smiles(smiles):
+    """SMILES -> (signals, 总 H 数)，同一 SMILES 的结果会被缓存。"""
+    signals, total = _simulate_smiles(smiles.strip())
+    return [dict(s) for s in signals], total
+
+
+def simulate_lines(signals, sfo1=400.0):
+    """把全部信号一次性展开为线谱：返回 (ppm, 强度)，强度以 H 数为单位。"""
+    if not signals:
+        return np.empty(0), np.empty(0)
+    patterns = [multiplet_pattern(s["couplings"]) if not s["exchangeable"] else (np.zeros(1), np.ones(1))
+                for s in signals]
+    sizes = [p[0].size for p in patterns]
+    centers = np.repeat([s["shift"] for s in signals], sizes)
+    scale = np.repeat([s["h_count"] for s in signals], sizes)
+    offsets = np.concatenate([p[0] for p in patterns])
+    weights = np.concatenate([p[1] for p in patterns])
+    return centers + offsets / sfo1, weights * scale
+
+
+def score_prediction(signals, peaks, total_h=None):
+    """
+    预测信号与观测 processH_NMR 输入 (shift, area, mult) 的差异打分。
+
+    每个预测信号归属到位移最近的观测峰（允许多个信号重叠到同一峰），
+    可交换氢若附近没有观测峰则视为未观测到。积分按候选结构的总 H 数换算。
+    返回 dict: cost (越小越好), score (0-1), shift_error, integral_error, mult_error。
+    """
+    obs = sorted(peaks, key=lambda p: p[0])
+    obs_shift = np.array([float(p[0]) for p in obs])
+    pred_shift = np.array([s["shift"] for s in signals])
+    pred_h = np.array([s["h_count"] for s in signals], dtype=np.float64)
+    exchangeable = np.array([s["exchangeable"] for s in signals], dtype=bool)
+    if obs_shift.size == 0 or pred_shift.size == 0:
+        return {"cost": np.inf, "score": 0.0, "shift_error": None, "integral_error": None, "mult_error": None}
+
+    right = np.clip(np.searchsorted(obs_shift, pred_shift), 1, obs_shift.size - 1) if obs_shift.size > 1 \
+        else np.zeros(pred_shift.size, dtype=int)
+    left = np.maximum(right - 1, 0)
+    nearest = np.where(np.abs(obs_shift[left] - pred_shift) <= np.abs(obs_shift[right] - pred_shift), left, right)
+    error = np.minimum(np.abs(obs_shift[nearest] - pred_shift), SHIFT_ERROR_CAP)
+    observed = ~exchangeable | (error <= EXCHANGEABLE_WINDOW)
+
+    weights = pred_h * np.where(exchangeable, EXCHANGEABLE_WEIGHT, 1.0) * observed
+    shift_error = float((error * weights).sum() / weights.sum()) if weights.sum() else SHIFT_ERROR_CAP
+
+    # 积分：按候选的（可观测）总 H 数把观测面积换算为 H 数
+    expected_total = int(pred_h[observed].sum())
+    counts, _, _ = estimate_proton_counts([p[1] for p in obs], total_h=total_h or expected_total)
+    known = np.array([c is not None for c in counts])
+    integral_error = 0.0
+    if known.any():
+        obs_h = np.array([c or 0 for c in counts], dtype=np.float64)
+        assigned = np.bincount(nearest[observed], weights=pred_h[observed], minlength=obs_shift.size)
+        denom = obs_h[known].sum() + assigned[known].sum()
+        integral_error = float(np.abs(obs_h - assigned)[known].sum() / denom) if denom else 0.0
+
+    # 重数：只比较一对一归属的非交换信号
+    per_peak = np.bincount(nearest[observed], minlength=obs_shift.size)
+    obs_mult = np.array([int(p[2]) for p in obs])
+    pred_mult = np.array([s["mult"] for s in signals])
+    check = observed & ~exchangeable & (per_peak[nearest] == 1) & (obs_mult[nearest] > 0)
+    mult_error = float(np.mean(pred_mult[check] != obs_mult[nearest[check]])) if check.any() else 0.0
+
+    cost = shift_error / SHIFT_SCALE + integral_error + MULT_WEIGHT * mult_error
+    if total_h and int(pred_h.sum()) != int(total_h):
+        cost += abs(int(pred_h.sum()) - int(total_h)) / float(total_h)
+    return {
+        "cost": float(cost),
+        "score": float(np.exp(-cost)),
+        "shift_error": shift_error,
+        "integral_error": integral_error,
+        "mult_error": mult_error,
+    }
+
+
+def rank_candidates(candidates, peaks, total_h=None):
+    """
+    对候选结构 (SMILES 列表) 逐一模拟 1H 谱并打分，按 cost 升序返回。
+
+    每项为 dict: smiles, signals, total_h 与 score_prediction 的各项；
+    无法解析的 SMILES 保留在末尾并带 error 字段。
+    """
+    for p in peaks:
+        assert isinstance(p, (list, tuple)) and len(p) == 3, "Each peak must be (shift, area, multiplicity)."
+    ranked, failed = [], []
+    for smiles in candidates:
+        try:
+            signals, n_h = simulate_smiles(smiles)
+        except ValueError as e:
+            failed.append({"smiles": smiles, "error": str(e), "cost": np.inf, "score": 0.0})
+            continue
+        result = {"smiles": smiles, "signals": signals, "total_h": n_h}
+        result.update(score_prediction(signals, peaks, total_h=total_h))
+        ranked.append(result)
+    ranked.sort(key=lambda r: r["cost"])
+    return ranked + failed
+
+
+def format_signals(signals):
+    """[{shift, h_count, mult}, ...] -> '1.26 (3H, t), 4.12 (2H, q)'"""
+    return ", ".join(
+        f"{s['shift']:.2f} ({s['h_count']}H, {'br s' if s['exchangeable'] else MULT_LABELS.get(s['mult'], 'm')})"
+        for s in signals
+    )
+
+
+def processH_NMRCandidates(candidates, peaks, lang='zh', total_h=None):
+    """与 processH_NMR 风格一致：打印候选结构按 1H 谱吻合度的排序。"""
+    ranked = rank_candidates(candidates, peaks, total_h=total_h)
+    lines = [tr("hnmr_candidate_title", lang, len(ranked))]
+    for k, r in enumerate(ranked, 1):
+        if "error" in r:
+            lines.append(tr("hnmr_candidate_invalid", lang, k, r["smiles"], r["error"]))
+            continue
+        lines.append(tr("hnmr_candidate_line", lang, k, r["smiles"], r["score"], r["shift_error"],
+                        r["integral_error"] * 100, r["mult_error"] * 100))
+        lines.append(tr("hnmr_candidate_signals", lang, format_signals(r["signals"])))
+    result_text = "\n".join(lines)
+    print(result_text)
+    return result_text
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("用法: python simulateH_NMR.py <输入 JSON (含 h_nmr)> <SMILES> [SMILES ...]")
+        sys.exit(1)
+    with open(sys.argv[1], "r", encoding="utf-8") as f:
+        data = json.load(f)
+    peaks = [
+        (float(item["shift"]), parse_area(item.get("area")), int(item.get("multiplicity", 1)))
+        for item in data["h_nmr"]
+    ]
+    processH_NMRCandidates(sys.argv[2:], peaks)
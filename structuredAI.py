@@ -0,0 +1,156 @@
+import sys
+import json
+import os
+
+from promptAI import DEFAULT_PROMPT_BUDGET, build_prompt, evidence_blocks
+
+def load_locales():
+    try:
+        if getattr(sys, 'frozen', False):
+            base_dir = os.path.dirname(sys.executable)
+        else:
+            base_dir = os.path.dirname(__file__)
+        path = os.path.join(base_dir, "locales.json")
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+    except Exception:
+        pass
+    return {}
+
+LOCALES = load_locales()
+
+def tr(key, lang='zh', *args):
+    lang_data = LOCALES.get(lang, {})
+    text = lang_data.get(key, key)
+    if args:
+        try:
+            return text.format(*args)
+        except:
+            return text
+    return text
+
+# Step 2 结构化输出的 JSON Schema
+FUNCTIONAL_GROUP_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "functional_groups": {"type": "array", "items": {"type": "string"}},
+        "formulas": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": ["functional_groups", "formulas"],
+    "additionalProperties": False,
+}
+# 结构化回答只是两个短列表，正常不会超过几百 token；上限用于防止模型跑题后继续输出
+DEFAULT_STRUCTURED_MAX_TOKENS = 512
+
+
+def response_format(kind="json_object"):
+    """
+    请求参数 response_format。"json_object" 兼容面最广（DeepSeek 等）；
+    "json_schema" 需要端点支持严格 schema 输出；None 表示不传，只靠 prompt 约束。
+    """
+    if kind is None:
+        return None
+    if kind == "json_schema":
+        return {"type": "json_schema",
+                "json_schema": {"name": "functional_groups", "schema": FUNCTIONAL_GROUP_SCHEMA, "strict": True}}
+    if kind == "json_object":
+        return {"type": "json_object"}
+    raise ValueError("kind must be 'json_object', 'json_schema' or None.")
+
+
+class JsonStreamScanner:
+    """
+    增量扫描流式输出，找到第一个完整的顶层 JSON 对象。
+
+    feed(delta) 逐段送入文本，顶层对象的右花括号到达时返回 True，调用方即可关闭流。
+    只跟踪字符串 / 转义 / 括号深度，不做完整解析，每个字符 O(1)。
+    对象之前的 ```json 围栏或说明文字会被跳过。
+    """
+
+    def __init__(self):
+        self._parts = []
+        self._offset = 0
+        self._start = None
+        self._end = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    @property
+    def done(self):
+        return self._end is not None
+
+    def feed(self, delta):
+        if self._end is not None:
+            return True
+        base = self._offset
+        self._parts.append(delta)
+        self._offset += len(delta)
+        for i, ch in enumerate(delta):
+            if self._start is None:
+                if ch == "{":
+                    self._start = base + i
+                    self._depth = 1
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._end = base + i + 1
+                    return True
+        return False
+
+    @property
+    def text(self):
+        """完整对象的文本；尚未结束时返回已收到的部分（从左花括号起）。"""
+        if self._start is None:
+            return ""
+        full = "".join(self._parts)
+        return full[self._start:self._end]
+
+
+def parse_functional_groups(text):
+    """
+    从回答中解析 {"functional_groups": [...], "formulas": [...]}，
+    允许对象前后有围栏或说明文字。格式不符时抛出 ValueError。
+    """
+    scanner = JsonStreamScanner()
+    if not scanner.feed(text or ""):
+        raise ValueError("No complete JSON object in answer.")
+    try:
+        data = json.loads(scanner.text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid JSON: {e}") from None
+    result = {}
+    for key in FUNCTIONAL_GROUP_SCHEMA["required"]:
+        values = data.get(key, [])
+        if not isinstance(values, list):
+            raise ValueError(f"'{key}' must be a list.")
+        result[key] = [str(v).strip() for v in values if str(v).strip()]
+    return result
+
+
+def gen_prompt_1_structured(datas, lang='zh', budget=DEFAULT_PROMPT_BUDGET):
+    """结构化模式的 Step 2 prompt：证据链同 gen_prompt_1_budget，指令改为按 schema 只输出 JSON。返回 (prompt, 报告)。"""
+    schema = json.dumps(FUNCTIONAL_GROUP_SCHEMA, ensure_ascii=False)
+    return build_prompt(tr("prompt_1_intro", lang), evidence_blocks(datas, lang),
+                        tr("prompt_1_json_instruction", lang, schema), budget, lang)
+
+
+def format_functional_groups(parsed, lang='zh'):
+    """把解析后的 Step 2 结果写成供 Step 3 使用的两行文字。"""
+    lines = [tr("structured_groups_line", lang, ", ".join(parsed["functional_groups"]) or "-")]
+    if parsed["formulas"]:
+        lines.append(tr("structured_formulas_line", lang, ", ".join(parsed["formulas"])))
+    return "\n".join(lines)
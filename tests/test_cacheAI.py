@@ -0,0 +1,25 @@
+from cacheAI import cache_key, ResponseCache
+from guess import ask_AI
+from mockAI import MockServer
+
+FAST = {"ttft": 0.0, "token_rate": 0, "reasoning_tokens": 0}
+
+
+def test_cache_key_includes_request_options():
+    base = cache_key("p", "m", "u", "enabled")
+    assert cache_key("p", "m", "u", "enabled", {"max_tokens": 10}) != base
+    assert cache_key("p", "m", "u", "enabled", {"response_format": {"type": "json_object"}}) != base
+    assert cache_key("p", "m", "u", "enabled", {}) == base
+
+
+def test_truncated_reply_is_not_cached(tmp_path, capsys):
+    cache_path = str(tmp_path / "cache.sqlite3")
+    with MockServer(options=FAST, reply="one two three four five six") as server:
+        kwargs = dict(api_key="mock", base_url=server.url, model="mock", cache_path=cache_path)
+        truncated = ask_AI("prompt", max_tokens=3, **kwargs)
+        assert ask_AI("prompt", max_tokens=3, **kwargs) == truncated
+        assert server.stats["requests"] == 2
+        full = ask_AI("prompt", **kwargs)
+        assert ask_AI("prompt", **kwargs) == full != truncated
+        assert server.stats["requests"] == 3
+    assert len(ResponseCache(cache_path)._conn.execute("SELECT key FROM responses").fetchall()) == 1
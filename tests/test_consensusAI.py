@@ -0,0 +1,31 @@
+from consensusAI import evidence_agreement, extract_candidates, rank_answers
+
+
+def test_chlorine_m_plus_2_counts_as_molecular_ion():
+    # 氯苯 M=112，最大 m/z 114 是 37Cl 同位素峰
+    assert evidence_agreement("C6H5Cl", {"mass": [114, 112, 77]}) == 1.0
+
+
+def test_wrong_molecular_ion_still_fails():
+    assert evidence_agreement("C6H6", {"mass": [80, 78]}) == 0.0
+
+
+ANSWER = """分析：
+1H NMR 中 δ 4.12 (q, 2H) 为 OCH2，δ 2.05 (s, 3H) 为乙酰基 CH3CO，δ 1.26 (t, 3H) 为 CH3。
+IR 1740 cm-1 为酯羰基。
+结论：
+名称：乙酸乙酯
+分子式：C4H8O2
+结构简式：CH3COOCH2CH3"""
+
+
+def test_answer_line_wins_over_reasoning_fragments():
+    candidates = extract_candidates(ANSWER)
+    assert candidates[0] == ("C4H8O2", "CH3COOCH2CH3")
+    # OCH2 只是 CH3COOCH2CH3 的一部分
+    assert "CH2O" not in [formula for formula, _ in candidates]
+
+
+def test_votes_go_to_the_answer_formula():
+    ranking = rank_answers([ANSWER, ANSWER.replace("OCH2，", "OCH2 (CH2O)，")])
+    assert ranking[0]["formula"] == "C4H8O2" and ranking[0]["votes"] == 2
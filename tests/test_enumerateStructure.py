@@ -0,0 +1,66 @@
+import pytest
+
+from enumerateStructure import shortlist_structures, enumeration_jobs
+
+
+def _sample(formula, bb, dept90=(), dept135=()):
+    return {"formula": formula,
+            "c_nmr": {"bb": [[s, "1"] for s in bb], "dept90": list(dept90), "dept135": [list(p) for p in dept135]}}
+
+
+CARBONYL_CASES = {
+    "acetone": (_sample("C3H6O", [206.7, 30.8], dept135=[(30.8, 1)]), "CC(C)=O"),
+    "acetaldehyde": (_sample("C2H4O", [200.5, 31.2], [200.5], [(200.5, 1), (31.2, 1)]), "CC=O"),
+    "ethyl acetate": (_sample("C4H8O2", [171.1, 60.5, 21.0, 14.2], dept135=[(60.5, -1), (21.0, 1), (14.2, 1)]),
+                      "CC(=O)OCC"),
+    "acetic acid": (_sample("C2H4O2", [178.0, 20.8], dept135=[(20.8, 1)]), "CC(=O)O"),
+    "DMF": (_sample("C3H7NO", [162.7, 36.5, 31.4], [162.7], [(162.7, 1), (36.5, 1), (31.4, 1)]), "CN(C=O)C"),
+}
+
+
+@pytest.mark.parametrize("name", sorted(CARBONYL_CASES))
+def test_carbonyl_compounds_are_enumerated(name):
+    data, expected = CARBONYL_CASES[name]
+    result = shortlist_structures(data, max_workers=1)
+    assert result["complete"]
+    assert expected in [c["smiles"] for c in result["candidates"]]
+
+
+def test_dmf_is_not_reported_as_unique():
+    # 两个 N-甲基拓扑等价，但酰胺 C-N 旋转受阻使其出两个峰
+    data, _ = CARBONYL_CASES["DMF"]
+    assert not shortlist_structures(data, max_workers=1)["unique"]
+
+
+def test_enumeration_jobs_requires_peaks():
+    with pytest.raises(ValueError):
+        enumeration_jobs("C3H6O")
+
+
+def test_guessed_formula_is_flagged():
+    data, _ = CARBONYL_CASES["acetone"]
+    assert shortlist_structures(data, max_workers=1)["formula_given"]
+    guessed = dict(data, formula=None, mass=[58, 43])
+    result = shortlist_structures(guessed, max_workers=1)
+    assert not result["formula_given"]
+
+
+def test_time_limit_marks_search_incomplete():
+    data, _ = CARBONYL_CASES["ethyl acetate"]
+    assert not shortlist_structures(data, max_workers=1, time_limit=1e-9)["complete"]
+
+
+def test_peroxide_is_not_reported_as_unique():
+    # 二乙基过氧化物：O-O 键不在搜索范围内，唯一的结果 COCCOC 不能当作穷举结论
+    data = dict(_sample("C4H10O2", [70.0, 13.0], dept135=[(70.0, -1), (13.0, 1)]), mass=[90, 61, 29])
+    result = shortlist_structures(data, max_workers=1)
+    assert result["complete"] and result["count"] == 1
+    assert not result["unique"]
+
+
+def test_small_rings_are_rechecked_before_unique():
+    data, _ = CARBONYL_CASES["acetone"]
+    assert shortlist_structures(data, max_workers=1)["unique"]
+    # 不饱和分子式会以 min_ring=3 复查，三、四元环也不能满足这些峰时仍是唯一的
+    isobutene = _sample("C4H8", [142.0, 111.0, 24.0], dept135=[(111.0, -1), (24.0, 1)])
+    assert shortlist_structures(isobutene, max_workers=1)["unique"]
@@ -0,0 +1,40 @@
+import pytest
+
+from clientAI import get_client_loop, _async_clients
+from failoverAI import DEFAULT_FAILOVER_OPTIONS
+from guess import ask_AI_failover
+from mockAI import MockServer
+
+FAST = {"ttft": 0.0, "token_rate": 0, "reasoning_tokens": 0}
+
+
+def test_failover_does_not_stack_sdk_retries():
+    options = dict(DEFAULT_FAILOVER_OPTIONS, max_attempts=2, backoff_base=0.0, breaker_threshold=100)
+    with MockServer(options=dict(FAST, error_rate=1.0)) as server:
+        with pytest.raises(Exception):
+            ask_AI_failover("prompt", [("mock", server.url, "mock")], use_cache=False, options=options)
+        # 每轮尝试只发出一个 HTTP 请求
+        assert server.stats["requests"] == 2
+
+
+def test_failover_reuses_async_client_between_calls():
+    with MockServer(options=FAST, reply="ok") as server:
+        endpoints = [("mock", server.url, "mock")]
+        assert ask_AI_failover("first", endpoints, use_cache=False) == "ok"
+        clients = dict(_async_clients[get_client_loop()])
+        assert ask_AI_failover("second", endpoints, use_cache=False) == "ok"
+        assert _async_clients[get_client_loop()] == clients
+
+
+def test_cache_replays_do_not_shrink_the_hedge_delay(tmp_path):
+    from failoverAI import endpoint_health
+
+    cache_path = str(tmp_path / "cache.sqlite3")
+    with MockServer(options=FAST, reply="ok") as server:
+        endpoints = [("mock", server.url, "mock")]
+        health = endpoint_health(f"mock@{server.url}")
+        ask_AI_failover("cached", endpoints, cache_path=cache_path)
+        for _ in range(6):
+            assert ask_AI_failover("cached", endpoints, cache_path=cache_path) == "ok"
+        assert server.stats["requests"] == 1
+        assert len(health._ttft) == 1
@@ -0,0 +1,18 @@
+import os
+import shutil
+
+from libraryMASS import CACHE_SUFFIX, default_library_path, load_library
+
+
+def test_truncated_cache_is_rebuilt(tmp_path):
+    path = str(tmp_path / "fragments.csv")
+    shutil.copy(default_library_path(), path)
+    expected = len(load_library(path))
+    cache_path = path + CACHE_SUFFIX
+    size = os.path.getsize(cache_path)
+    # 模拟另一个进程写到一半的缓存
+    with open(cache_path, "r+b") as f:
+        f.truncate(size // 2)
+    assert len(load_library(path)) == expected
+    assert os.path.getsize(cache_path) == size
+    assert [name for name in os.listdir(tmp_path) if name.endswith(".tmp")] == []
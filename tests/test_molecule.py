@@ -0,0 +1,32 @@
+import pytest
+
+from molecule import parse_smiles
+
+
+@pytest.mark.parametrize("smiles, formula", [
+    ("c1ccsc1", "C4H4S"),
+    ("c1ccoc1", "C4H4O"),
+    ("c1cc[nH]c1", "C4H5N"),
+    ("c1ccncc1", "C5H5N"),
+])
+def test_aromatic_heteroatoms_take_lowest_valence(smiles, formula):
+    assert parse_smiles(smiles).formula_string() == formula
+
+
+@pytest.mark.parametrize("smiles, aromatic", [
+    ("C1=CC=CC=C1", 6),
+    ("OC1=CC=CC=C1", 6),
+    ("C1=CC=NC=C1", 6),
+    ("C1=CC=C2C=CC=CC2=C1", 10),
+    ("C1=CCC=CC1", 0),
+    ("O=C1C=CC(=O)C=C1", 0),
+])
+def test_kekule_six_rings_are_aromatic(smiles, aromatic):
+    mol = parse_smiles(smiles)
+    assert sum(mol.aromatic) == aromatic
+
+
+def test_kekule_and_aromatic_benzene_agree():
+    kekule, aromatic = parse_smiles("CC1=CC=CC=C1"), parse_smiles("Cc1ccccc1")
+    assert kekule.formula_string() == aromatic.formula_string() == "C7H8"
+    assert sorted(o for _, _, o in kekule.bonds) == sorted(o for _, _, o in aromatic.bonds)
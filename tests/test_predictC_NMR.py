@@ -0,0 +1,10 @@
+from predictC_NMR import processC_NMRCandidates
+
+
+def test_candidates_use_per_experiment_tolerance(capsys):
+    # 乙酸乙酯：OCH2 的 DEPT-135 峰偏离 BB 0.8 ppm
+    c_nmr = {"bb": [[14.2, 1], [21.0, 1], [60.4, 1], [171.0, 1]], "dept90": [],
+             "dept135": [[14.2, 1], [21.0, 1], [61.2, -1]]}
+    default = processC_NMRCandidates(["CCOC(C)=O"], c_nmr, lang='en')
+    narrowed = processC_NMRCandidates(["CCOC(C)=O"], dict(c_nmr, dept135_tolerance=0.5), lang='en')
+    assert default != narrowed
@@ -0,0 +1,17 @@
+from processC_DEPR_NMR import interpret_dept_data
+
+
+def test_default_tolerance_pairs_peaks_within_one_ppm():
+    resolved = interpret_dept_data([[30.0, 1]], [], [[30.8, -1]])
+    assert resolved == [[30.0, 2, 1]]
+
+
+def test_per_experiment_tolerance_can_narrow():
+    resolved = interpret_dept_data([[30.0, 1]], [], [[30.8, -1]], tolerance_135=0.5)
+    assert resolved[0][1] == 0
+
+
+def test_neighbouring_peaks_are_all_paired():
+    # 贪心会先取 30.0↔30.3，让 30.6 落空被当成季碳；最大配对应为 30.0↔29.5、30.6↔30.3
+    resolved = interpret_dept_data([[30.0, 1], [30.6, 1]], [], [[29.5, 1], [30.3, -1]])
+    assert resolved == [[30.0, 3, 1], [30.6, 2, 1]]
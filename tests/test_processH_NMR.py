@@ -0,0 +1,15 @@
+from processH_NMR import analyze_h_nmr, estimate_proton_counts
+
+
+def test_analyze_h_nmr_returns_findings_list():
+    findings = analyze_h_nmr([(1.2, 3, 3), (4.1, 2, 4)])
+    assert isinstance(findings, list)
+    assert [f["h_count"] for f in findings] == [3, 2]
+    findings, total = analyze_h_nmr([(1.2, 3, 3), (4.1, 2, 4)], return_total=True)
+    assert total == 5
+
+
+def test_clamped_small_peak_keeps_total():
+    counts, total, _ = estimate_proton_counts([100, 100, 1], total_h=10)
+    assert total == 10
+    assert sorted(counts) == [1, 4, 5]
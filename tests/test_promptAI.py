@@ -0,0 +1,23 @@
+import json
+import os
+
+import pytest
+
+from guess import gen_datas
+from promptAI import compact_section
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize("lang", ["zh", "en"])
+def test_hnmr_lines_with_missing_areas(lang):
+    with open(os.path.join(ROOT, "test_data", "input_2.json"), "r", encoding="utf-8") as f:
+        data = json.load(f)
+    required = [line for text in gen_datas(data, lang) for line in compact_section(text, lang)[0]]
+    assert any(line.startswith("2.75 area N/A triplet:") for line in required)
+    assert any(line.startswith("6.65 area N/A doublet:") for line in required)
+
+
+def test_hnmr_line_with_area_and_proton_count():
+    text = "H_NMR Analysis Results (1 peaks found):\nShift 3.75 ppm (Area: 2.0 ≈ 2H, Doublet (d, 1 neighbor)):"
+    assert compact_section(text, "en")[0] == ["1H NMR:", "3.75 2H doublet:"]
@@ -0,0 +1,32 @@
+import numpy as np
+
+from guess import gen_datas
+from profileMASS import DEFAULT_TOP_N
+from readJCAMP import read_jcamp, jcamp_to_input
+
+
+def _write_profile_ms(path, peaks, step=0.1):
+    """写一个连续（XYDATA）质谱块，每个峰为窄高斯。"""
+    x = np.arange(10.0, 160.0 + step / 2, step)
+    y = np.zeros_like(x)
+    for mz, height in peaks:
+        y += height * np.exp(-0.5 * ((x - mz) / 0.05) ** 2)
+    y = np.round(y).astype(int)
+    lines = ["##TITLE=profile", "##JCAMP-DX=5.01", "##DATA TYPE=MASS SPECTRUM",
+             "##XUNITS=M/Z", "##YUNITS=RELATIVE ABUNDANCE",
+             f"##FIRSTX={x[0]:.1f}", f"##LASTX={x[-1]:.1f}", f"##NPOINTS={x.size}",
+             "##XFACTOR=1", "##YFACTOR=1", "##XYDATA=(X++(Y..Y))"]
+    for start in range(0, x.size, 10):
+        lines.append(f"{x[start]:.1f} " + " ".join(str(v) for v in y[start:start + 10]))
+    lines.append("##END=")
+    path.write_text("\n".join(lines) + "\n", encoding="ascii")
+
+
+def test_profile_mass_clues_are_capped(tmp_path):
+    # 每个整数质量一个峰，可配对的丢失线索远多于 DEFAULT_TOP_N
+    path = tmp_path / "ms.jdx"
+    _write_profile_ms(path, [(float(mz), 100 + mz % 7 * 50) for mz in range(15, 151)])
+    mass = jcamp_to_input(read_jcamp(str(path)))["mass"]
+    assert len(mass) == 136
+    text = gen_datas({"jcamp": str(path)})[0]
+    assert 0 < text.count("->") <= DEFAULT_TOP_N
@@ -0,0 +1,29 @@
+import json
+
+from referenceLibrary import import_results
+
+
+def _write_jsonl(path, records):
+    path.write_text("".join(json.dumps(r) + "\n" for r in records), encoding="utf-8")
+
+
+def test_import_skips_enumeration_only_and_fragment_answers(tmp_path):
+    samples = tmp_path / "samples.jsonl"
+    _write_jsonl(samples, [{"id": k, "mass": [74, 59, 45]} for k in ("enum", "ai", "fragment")])
+    candidate = {"smiles": "CCOCC", "formula": "C4H10O", "verdict": "consistent"}
+    results = tmp_path / "results.jsonl"
+    _write_jsonl(results, [
+        # 本地枚举直接采用，未经 AI 回答
+        {"id": "enum", "error": None, "structure": "CCOCC", "enumeration": {"unique": True},
+         "verification": {"verdict": "consistent", "candidates": [dict(candidate, proposed=True)]}},
+        {"id": "ai", "error": None, "functional_groups": "ether", "structure": "CCOCC",
+         "verification": {"verdict": "consistent", "candidates": [dict(candidate, proposed=True)]}},
+        # 回答结构没有 SMILES，排在首位的只是分子式
+        {"id": "fragment", "error": None, "functional_groups": "ether", "structure": "C4H10O",
+         "verification": {"verdict": "consistent",
+                          "candidates": [{"smiles": None, "formula": "C4H10O", "proposed": True}, candidate]}},
+    ])
+    library = tmp_path / "reference.jsonl"
+    assert import_results(str(samples), str(results), path=str(library)) == 1
+    entry = json.loads(library.read_text(encoding="utf-8"))
+    assert entry["smiles"] == "CCOCC" and entry["source"] == "samples.jsonl#ai"
@@ -0,0 +1,44 @@
+from verifyStructure import verify_answer, extract_structures, check_molecular_ion
+from molecule import parse_formula
+
+
+def test_m_plus_2_of_chlorine_compound_is_consistent():
+    check = check_molecular_ion(parse_formula("C6H5Cl"), [77.0, 112.0, 114.0])
+    assert check["score"] == 1.0
+    assert check_molecular_ion(parse_formula("C6H6"), [78.0, 80.0])["score"] == 0.0
+
+
+def test_chlorobenzene_against_m_plus_2_spectrum():
+    data = {"mass": [[77, 40], [112, 100], [114, 33]]}
+    assert verify_answer("Chlorobenzene: Clc1ccccc1", data, max_workers=1)["verdict"] == "consistent"
+
+
+def test_proposed_structure_comes_before_prose_fragments():
+    text = "The CCO fragment and a COC ether are ruled out.\nSMILES: CC(C)c1cccc(C(C)C)c1O"
+    assert extract_structures(text)[0]["smiles"] == "CC(C)c1cccc(C(C)C)c1O"
+
+
+def test_verdict_comes_from_proposed_structure():
+    data = {"mass": [46, 45, 31]}
+    text = "Answer: ethyl acetate CCOC(C)=O\nNote the CCO fragment."
+    verification = verify_answer(text, data, max_workers=1)
+    assert verification["candidates"][0]["smiles"] == "CCOC(C)=O"
+    # 片段 CCO 与这张乙醇质谱完全吻合，但结论应取回答给出的乙酸乙酯
+    assert verification["verdict"] != "consistent"
+
+
+def test_structure_without_hydrogens_against_h_nmr():
+    data = {"h_nmr": [{"shift": 1.2, "area": 3, "multiplicity": 1}],
+            "c_nmr": {"bb": [[125.0, "1"]], "dept90": [], "dept135": []}}
+    verification = verify_answer("SMILES: O=C=O", data, max_workers=1)
+    assert verification["candidates"][0]["smiles"] == "O=C=O"
+    assert verification["verdict"] != "consistent"
+
+
+def test_failed_carbon_check_is_not_consistent():
+    # 二乙基过氧化物的谱图：COCCOC 的 OCH3/OCH2 对不上 70 / 13 ppm，总分却因 MS 与 IR 满分而偏高
+    data = {"formula": "C4H10O2", "mass": [90, 61, 29], "ir": [2980, 1100],
+            "c_nmr": {"bb": [[70.0, "1"], [13.0, "1"]], "dept90": [], "dept135": [[70.0, -1], [13.0, 1]]}}
+    candidate = verify_answer("SMILES: COCCOC", data, max_workers=1)["candidates"][0]
+    assert candidate["score"] >= 0.75 and candidate["checks"]["c_nmr"]["score"] < 0.6
+    assert candidate["verdict"] != "consistent"
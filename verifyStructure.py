@@ -0,0 +1,369 @@
+import re
+import sys
+import json
+import os
+
+from molecule import parse_smiles, parse_formula, formula_nominal_mass, is_carbonyl
+from processC_DEPR_NMR import interpret_dept_data, dept_tolerances
+from processH_NMR import estimate_proton_counts, parse_area
+from libraryMASS import get_library, KIND_LOSS
+from simulateH_NMR import simulate_smiles, score_prediction
+from predictC_NMR import predict_smiles, score_c_prediction
+from consensusAI import extract_candidates, after_answer_marker
+from enumerateStructure import canonical_smiles, get_pool, is_solvent_peak
+from isotopeMASS import molecular_ion_offset
+
+def load_locales():
+    try:
+        if getattr(sys, 'frozen', False):
+            base_dir = os.path.dirname(sys.executable)
+        else:
+            base_dir = os.path.dirname(__file__)
+        path = os.path.join(base_dir, "locales.json")
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+    except Exception:
+        pass
+    return {}
+
+LOCALES = load_locales()
+
+def tr(key, lang='zh', *args):
+    lang_data = LOCALES.get(lang, {})
+    text = lang_data.get(key, key)
+    if args:
+        try:
+            return text.format(*args)
+        except:
+            return text
+    return text
+
+# SMILES 候选：由 SMILES 字符组成、至少 3 个字符的片段（能被 parse_smiles 解析且至少含 3 个重原子才采用）
+SMILES_TOKEN = re.compile(r"(?<![A-Za-z0-9])[A-Za-z0-9@+\-\[\]()=#%/\\]{3,}")
+MIN_SMILES_ATOMS = 3
+# 每个回答最多核验的候选数
+MAX_CANDIDATES = 5
+# 中性丢失库标签中的分子式片段，如 "C3H7 (Propyl) or C2H3O (Acetyl)" 中的 C3H7 与 C2H3O
+LOSS_FORMULA_TOKEN = re.compile(r"(?<![A-Za-z0-9])[A-Z][A-Za-z0-9]*")
+
+# 结构中的基团 -> 应出现的 IR 吸收范围 (cm-1)
+IR_EXPECTED_BANDS = {
+    "O-H": (3200, 3650),
+    "N-H": (3150, 3500),
+    "C=O": (1630, 1850),
+    "C≡N": (2210, 2260),
+    "C≡C": (2100, 2260),
+    "Ar": (1450, 1620),
+    "C-O": (1000, 1300),
+}
+# 诊断性吸收区 -> 可以解释它的基团；观测到吸收而结构中没有这些基团时扣分
+IR_DIAGNOSTIC_BANDS = (
+    ((3200, 3650), ("O-H", "N-H")),
+    ((1690, 1850), ("C=O",)),
+    ((2100, 2260), ("C≡N", "C≡C")),
+)
+
+# 总分达到 VERDICT_CONSISTENT 为 "吻合"，达到 VERDICT_DOUBTFUL 为 "存疑"，否则为 "不符"
+VERDICT_CONSISTENT = 0.75
+VERDICT_DOUBTFUL = 0.5
+# 结构性检查（1H、13C）各自达到该分数才可能判为 "吻合"，否则最多为 "存疑"：
+# 给出分子式时 ms_ion 几乎总是 1、IR 没有缺失吸收时也是 1，只看平均分会掩盖一半谱线对不上的结构
+STRUCTURE_CHECKS = ("h_nmr", "c_nmr")
+STRUCTURE_FLOOR = 0.6
+CHECKS = ("ms_ion", "ms_loss", "ir", "h_nmr", "c_nmr")
+
+
+def extract_structures(text, limit=MAX_CANDIDATES):
+    """
+    从 Step 3 的回答中提取候选，返回 [{"formula", "smiles", "text"}, ...]。
+    能解析的 SMILES 优先（按规范 SMILES 去重）；只给出分子式或结构简式的候选 smiles 为 None，
+    且分子式与已有 SMILES 候选相同时不再重复。
+    位于答案行上标记之后的候选（见 consensusAI.after_answer_marker）按出现顺序排在前面，其余按出现顺序排在后面，
+    因此第一个候选即回答给出的结构，正文中提到的 "CCO"、"COC" 之类片段不会排到它前面。
+    """
+    found = []
+    seen = set()
+    for match in SMILES_TOKEN.finditer(text or ""):
+        token = match.group(0).rstrip("-=#.")
+        try:
+            mol = parse_smiles(token)
+        except (ValueError, KeyError, IndexError):
+            continue
+        if len(mol) < MIN_SMILES_ATOMS or "C" not in mol.symbols:
+            continue
+        key = canonical_smiles(mol)
+        if key in seen:
+            continue
+        seen.add(key)
+        found.append((match.start(), {"formula": mol.formula_string(), "smiles": token, "text": token}))
+    formulas = {c["formula"] for _, c in found}
+    for formula, token in extract_candidates(text):
+        if formula in formulas:
+            continue
+        formulas.add(formula)
+        found.append(((text or "").find(token), {"formula": formula, "smiles": None, "text": token}))
+    text = text or ""
+    found.sort(key=lambda item: (not after_answer_marker(text, item[0]), item[0]))
+    return [c for _, c in found[:limit]]
+
+
+def collect_evidence(data):
+    """把输入 JSON 中可核验的部分整理成可序列化的 dict（传给进程池中的打分函数）。"""
+    evidence = {}
+    mass = data.get("mass")
+    if mass:
+        evidence["mass"] = sorted(float(m[0] if isinstance(m, (list, tuple)) else m) for m in mass)
+    ir = data.get("ir")
+    if ir:
+        evidence["ir"] = [float(w[0] if isinstance(w, (list, tuple)) else w) for w in ir]
+    if data.get("h_nmr"):
+        evidence["h_nmr"] = [(float(item["shift"]), parse_area(item.get("area")), int(item.get("multiplicity", 1)))
+                             for item in data["h_nmr"]]
+    c_nmr = data.get("c_nmr")
+    if isinstance(c_nmr, dict) and c_nmr.get("bb"):
+        resolved = interpret_dept_data(c_nmr.get("bb", []), c_nmr.get("dept90", []), c_nmr.get("dept135", []),
+                                       **dept_tolerances(c_nmr))
+        evidence["c_nmr"] = [list(p) for p in resolved if not is_solvent_peak(*p)]
+    return evidence
+
+
+def _check(score, note):
+    return {"score": round(float(score), 3), "note": note}
+
+
+def _shift_error(value, digits):
+    # 结构没有 H（如 CO2、CCl4）或没有可配对的谱线时误差为 None
+    return "-" if value is None else f"{value:.{digits}f}"
+
+
+def check_molecular_ion(counts, mass):
+    """
+    最大 m/z 与名义分子量比较：相等，或是含 Cl / Br / S 分子式的 M+2、M+4 等同位素峰时为 1；
+    偏小时分子离子峰可能缺失，记 0.5；其余偏大的情况说明分子式不可能，记 0。
+    """
+    observed = int(round(mass[-1]))
+    calculated = formula_nominal_mass(counts)
+    offset = molecular_ion_offset(counts, calculated, observed)
+    if offset == 0:
+        return _check(1.0, f"m/z {observed} = {calculated}")
+    if offset is not None:
+        return _check(1.0, f"m/z {observed} = {calculated}+{offset}")
+    if observed < calculated:
+        return _check(0.5, f"m/z {observed} < {calculated}")
+    return _check(0.0, f"m/z {observed} > {calculated}")
+
+
+def _loss_formulas(label):
+    formulas = []
+    for token in LOSS_FORMULA_TOKEN.findall(label):
+        try:
+            formulas.append(parse_formula(token))
+        except ValueError:
+            continue
+    return formulas
+
+
+def check_losses(counts, mass, library=None):
+    """
+    由分子离子到各碎片的中性丢失能否由分子式提供：碎片库中该质量的丢失
+    至少有一个写法的元素组成不超过候选分子式。分子离子与分子式不符时不检查。
+    """
+    calculated = formula_nominal_mass(counts)
+    if molecular_ion_offset(counts, calculated, mass[-1]) is None:
+        return None
+    library = library or get_library()
+    explained, total, missing = 0, 0, []
+    # 分子离子的同位素峰不是碎片
+    for m in (m for m in mass if m < calculated - 0.5):
+        loss = calculated - m
+        idx = library.lookup(loss, kind=KIND_LOSS)
+        if idx.size == 0:
+            continue
+        total += 1
+        if any(all(counts.get(e, 0) >= n for e, n in f.items())
+               for i in idx for f in _loss_formulas(str(library.labels[i]))):
+            explained += 1
+        else:
+            missing.append(f"-{loss:g}")
+    if not total:
+        return None
+    return _check(explained / total, f"{explained}/{total}" + (f" ({', '.join(missing)})" if missing else ""))
+
+
+def structure_groups(mol):
+    """结构中与 IR 吸收相关的基团集合（键见 IR_EXPECTED_BANDS）。"""
+    groups = set()
+    for i, symbol in enumerate(mol.symbols):
+        if symbol == "O" and mol.hcounts[i]:
+            groups.add("O-H")
+        elif symbol == "N" and mol.hcounts[i]:
+            groups.add("N-H")
+        if mol.aromatic[i]:
+            groups.add("Ar")
+        if is_carbonyl(mol, i):
+            groups.add("C=O")
+    for i, j, order in mol.bonds:
+        pair = {mol.symbols[i], mol.symbols[j]}
+        if order == 3:
+            groups.add("C≡N" if pair == {"C", "N"} else "C≡C" if pair == {"C"} else None)
+        elif order == 1 and pair == {"C", "O"}:
+            groups.add("C-O")
+    groups.discard(None)
+    return groups
+
+
+def check_ir(groups, wavenumbers):
+    """
+    IR 核验：结构中每个基团应在其范围内有吸收；诊断性吸收区观测到吸收时结构中须有能解释它的基团。
+    groups 为 None（只有分子式）时不检查。
+    """
+    if groups is None:
+        return None
+
+    def present(low, high):
+        return any(low <= w <= high for w in wavenumbers)
+
+    expected = [g for g in sorted(groups) if g in IR_EXPECTED_BANDS]
+    missing = [g for g in expected if not present(*IR_EXPECTED_BANDS[g])]
+    unexplained = [f"{low}-{high}" for (low, high), explains in IR_DIAGNOSTIC_BANDS
+                   if present(low, high) and not groups.intersection(explains)]
+    total = len(expected) + len(IR_DIAGNOSTIC_BANDS)
+    score = (total - len(missing) - len(unexplained)) / total
+    notes = [f"-{g}" for g in missing] + [f"?{band}" for band in unexplained]
+    return _check(score, ", ".join(notes) or "ok")
+
+
+def _exchangeable(counts):
+    return 2 * counts.get("N", 0) + counts.get("O", 0) + counts.get("S", 0)
+
+
+def check_h_nmr(counts, smiles, peaks):
+    """
+    1H 核验：有结构时用 simulateH_NMR 模拟谱图打分；只有分子式时检查 H 数与积分总数是否相容
+    （允许缺少活泼氢，积分可为 H 数的整数分之一）。
+    """
+    if smiles:
+        signals, n_h = simulate_smiles(smiles)
+        result = score_prediction(signals, peaks)
+        return _check(result["score"], f"{len(signals)} signals / {len(peaks)} peaks, "
+                                       f"δ err {_shift_error(result['shift_error'], 2)} ppm")
+    h_counts, total, _ = estimate_proton_counts([p[1] for p in peaks])
+    if total is None:
+        return None
+    n_h = counts.get("H", 0)
+    fits = any(0 <= n_h - m * total <= _exchangeable(counts) for m in range(1, n_h // max(total, 1) + 1))
+    return _check(1.0 if fits else 0.0, f"H{n_h} / ∫ {total}")
+
+
+def check_c_nmr(counts, smiles, resolved):
+    """13C 核验：有结构时用 predictC_NMR 预测位移与 DEPT 类型打分；只有分子式时检查碳数与碳上 H 数是否够用。"""
+    if smiles:
+        predicted = predict_smiles(smiles)
+        result = score_c_prediction(predicted, resolved)
+        return _check(result["score"], f"{len(predicted)} signals / {len(resolved)} peaks, "
+                                       f"δ err {_shift_error(result['shift_error'], 1)} ppm")
+    # BB 计数为 ">n" 之类的字符串时至少按 1 个碳计
+    n_c = sum(max(r[2], 1) if isinstance(r[2], int) else 1 for r in resolved)
+    min_h = sum(r[1] for r in resolved)
+    checks = [counts.get("C", 0) >= n_c, counts.get("H", 0) >= min_h]
+    return _check(sum(checks) / len(checks), f"C{counts.get('C', 0)} / {len(resolved)} peaks")
+
+
+def score_candidate(candidate, evidence):
+    """
+    对一个候选逐项核验（进程池中调用）。返回 candidate 加上 checks {名称: {score, note}}、
+    score（各项平均）与 verdict ("consistent" / "doubtful" / "inconsistent")。
+    分子离子 m/z 大于候选分子量时直接判为不符；1H 或 13C 检查低于 STRUCTURE_FLOOR 时最多判为存疑。
+    """
+    result = dict(candidate)
+    try:
+        counts = parse_formula(candidate["formula"])
+        mol = parse_smiles(candidate["smiles"]) if candidate.get("smiles") else None
+    except ValueError as e:
+        result.update({"checks": {}, "score": 0.0, "verdict": "inconsistent", "error": str(e)})
+        return result
+    checks = {}
+    if evidence.get("mass"):
+        checks["ms_ion"] = check_molecular_ion(counts, evidence["mass"])
+        checks["ms_loss"] = check_losses(counts, evidence["mass"])
+    if evidence.get("ir"):
+        checks["ir"] = check_ir(structure_groups(mol) if mol is not None else None, evidence["ir"])
+    if evidence.get("h_nmr"):
+        checks["h_nmr"] = check_h_nmr(counts, candidate.get("smiles"), evidence["h_nmr"])
+    if evidence.get("c_nmr"):
+        checks["c_nmr"] = check_c_nmr(counts, candidate.get("smiles"), evidence["c_nmr"])
+    checks = {name: c for name, c in checks.items() if c is not None}
+    score = sum(c["score"] for c in checks.values()) / len(checks) if checks else 0.0
+    if "ms_ion" in checks and checks["ms_ion"]["score"] == 0.0:
+        verdict = "inconsistent"
+    elif score >= VERDICT_CONSISTENT and all(checks[name]["score"] >= STRUCTURE_FLOOR
+                                             for name in STRUCTURE_CHECKS if name in checks):
+        verdict = "consistent"
+    elif score >= VERDICT_DOUBTFUL:
+        verdict = "doubtful"
+    else:
+        verdict = "inconsistent"
+    result.update({"checks": checks, "score": round(score, 3), "verdict": verdict})
+    return result
+
+
+def _score_job(args):
+    return score_candidate(*args)
+
+
+def verify_candidates(candidates, data, *, max_workers=None, min_parallel=2):
+    """
+    逐个核验候选并按 score 降序返回。候选数不少于 min_parallel 且 max_workers（默认 CPU 核数）
+    大于 1 时在进程池中并行打分（与结构枚举共用进程池）；批量运行时多个样品各自提交，
+    可传 min_parallel=1 让单个候选也交给进程池。
+    """
+    evidence = collect_evidence(data)
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    jobs = [(candidate, evidence) for candidate in candidates]
+    if max_workers > 1 and len(jobs) >= min_parallel:
+        scored = list(get_pool(max_workers).map(_score_job, jobs))
+    else:
+        scored = [_score_job(job) for job in jobs]
+    scored.sort(key=lambda r: -r["score"])
+    return scored
+
+
+def verify_answer(text, data, *, max_workers=None, min_parallel=2):
+    """
+    核验 Step 3 的回答：提取候选（见 extract_structures）并与输入数据比对。
+    第一个候选是回答给出的结构，结论取它的结论，而不是得分最高的候选（可能只是正文中提到的片段）。
+    返回 {"verdict": 回答结构的结论或 None, "candidates": 核验结果}，candidates 中回答结构在前，其余按 score 降序。
+    """
+    extracted = extract_structures(text)
+    if extracted:
+        extracted[0] = dict(extracted[0], proposed=True)
+    candidates = verify_candidates(extracted, data, max_workers=max_workers, min_parallel=min_parallel)
+    candidates.sort(key=lambda c: not c.get("proposed"))
+    return {"verdict": candidates[0]["verdict"] if candidates else None, "candidates": candidates}
+
+
+def format_verification(verification, lang='zh'):
+    """核验结果的多行文字说明：每个候选一行结论，其下每项检查一行。"""
+    if not verification or not verification["candidates"]:
+        return tr("verify_none", lang)
+    lines = [tr("verify_title", lang)]
+    for k, c in enumerate(verification["candidates"], 1):
+        name = c["smiles"] or c["text"]
+        label = c["formula"] if name != c["formula"] else ""
+        lines.append(tr("verify_candidate", lang, k, name, label, tr(f"verdict_{c['verdict']}", lang), c["score"]))
+        for check in CHECKS:
+            if check in c["checks"]:
+                lines.append(tr("verify_check", lang, tr(f"verify_check_{check}", lang),
+                                c["checks"][check]["score"], c["checks"][check]["note"]))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("用法: python verifyStructure.py <输入 JSON> <回答文本或 SMILES / 分子式> [...]")
+        sys.exit(1)
+    with open(sys.argv[1], "r", encoding="utf-8") as f:
+        sample = json.load(f)
+    print(format_verification(verify_answer("\n".join(sys.argv[2:]), sample)))